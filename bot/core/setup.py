@@ -5,22 +5,17 @@
 Настройка и инициализация Telegram-бота.
 """
 
+import asyncio
 import logging
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
-
-from bot.handlers.start import start_command
-from bot.handlers.help import help_command
-from bot.handlers.profile import profile_command
-from bot.handlers.message import handle_message
-from bot.handlers.error import error_handler
-from bot.handlers.appointment_confirmation import appointment_confirmation_handler
-from bot.handlers.consent_handlers import notifications_consent_handler, marketing_consent_handler
-from bot.handlers.contact_handler import contact_handler
-from bot.handlers.patient_selection import patient_selection_handler
-from bot.utils.text_loader import reload_texts
+from telegram.ext import Application
+
+from config import DB_POOL_STATS_INTERVAL, ACTIVITY_FLUSH_INTERVAL, MESSAGE_FLUSH_INTERVAL
 
 logger = logging.getLogger(__name__)
 
+# Фоновые задачи, запущенные при старте приложения
+_background_tasks = []
+
 def setup_bot(application: Application):
     """
     Настройка обработчиков команд и сообщений для бота.
@@ -30,6 +25,20 @@ def setup_bot(application: Application):
     """
     logger.info("Настройка обработчиков команд и сообщений...")
     
+    # Обработчики импортируются при настройке, а не при импорте модуля,
+    # чтобы проверка версии схемы при запуске не ждала загрузки всех модулей бота
+    from telegram.ext import CommandHandler, MessageHandler, filters
+    from bot.handlers.start import start_command
+    from bot.handlers.help import help_command
+    from bot.handlers.profile import profile_command
+    from bot.handlers.message import handle_message
+    from bot.handlers.error import error_handler
+    from bot.handlers.appointment_confirmation import appointment_confirmation_handler
+    from bot.handlers.consent_handlers import notifications_consent_handler, marketing_consent_handler
+    from bot.handlers.contact_handler import contact_handler
+    from bot.handlers.patient_selection import patient_selection_handler
+    from bot.utils.text_loader import reload_texts
+    
     # Загрузка текстовых файлов
     reload_texts()
     logger.info("Текстовые файлы загружены")
@@ -59,3 +68,65 @@ def setup_bot(application: Application):
     application.add_error_handler(error_handler)
     
     logger.info("Бот успешно настроен")
+
+
+async def _log_stats_periodically(interval: int):
+    """
+    Периодическая запись статистики пулов соединений, кеша состояния пациентов
+    и состояния выключателя запросов к МИС в лог.
+    
+    Args:
+        interval: Интервал в секундах
+    """
+    from db.pool_stats import log_pool_stats
+    from bot.services.patient_state_cache import patient_state_cache
+    from bot.services.mis_service import mis_circuit_breaker
+    
+    while True:
+        await asyncio.sleep(interval)
+        log_pool_stats()
+        patient_state_cache.log_stats()
+        mis_circuit_breaker.log_stats()
+
+async def on_startup(application: Application):
+    """
+    Действия при запуске приложения (post_init): создание HTTP-клиента МИС
+    и запуск фоновых задач.
+    
+    Args:
+        application: Экземпляр приложения Telegram бота
+    """
+    from bot.services.activity_service import activity_recorder
+    from bot.services.conversation_service import message_recorder
+    from bot.services.mis_service import start_mis_client
+    
+    await start_mis_client()
+    _background_tasks.append(asyncio.create_task(activity_recorder.run(ACTIVITY_FLUSH_INTERVAL)))
+    _background_tasks.append(asyncio.create_task(message_recorder.run(MESSAGE_FLUSH_INTERVAL)))
+    if DB_POOL_STATS_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(_log_stats_periodically(DB_POOL_STATS_INTERVAL)))
+
+async def on_shutdown(application: Application):
+    """
+    Действия при остановке приложения (post_shutdown): остановка фоновых задач,
+    запись накопленного времени последней активности и сообщений пациентов,
+    закрытие HTTP-клиента МИС.
+    
+    Args:
+        application: Экземпляр приложения Telegram бота
+    """
+    from db.pool_stats import log_pool_stats
+    from bot.services.activity_service import activity_recorder
+    from bot.services.conversation_service import message_recorder
+    from bot.services.mis_service import close_mis_client
+    from bot.services.patient_state_cache import patient_state_cache
+    
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await activity_recorder.flush()
+    await message_recorder.flush()
+    await close_mis_client()
+    log_pool_stats()
+    patient_state_cache.log_stats()
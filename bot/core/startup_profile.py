@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Профиль времени запуска бота (main.py --profile-startup).
+
+Фиксирует длительность этапов запуска: импорт модулей, проверку версии схемы,
+настройку обработчиков и время до отправки первого запроса getUpdates.
+Для подробного профиля импорта используйте python -X importtime main.py.
+"""
+
+import time
+import logging
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """
+    Отметки времени этапов запуска.
+    """
+
+    def __init__(self, started: float):
+        """
+        Args:
+            started: Значение time.perf_counter() в начале запуска
+        """
+        self.started = started
+        self.marks = []
+
+    def mark(self, name: str):
+        """
+        Завершение этапа запуска.
+
+        Args:
+            name: Название этапа
+        """
+        self.marks.append((name, time.perf_counter()))
+
+    def report(self):
+        """
+        Запись длительности этапов в лог.
+        """
+        previous = self.started
+        lines = []
+        for name, moment in self.marks:
+            lines.append(f"{name}: {(moment - previous) * 1000:.0f} мс (с начала запуска {(moment - self.started) * 1000:.0f} мс)")
+            previous = moment
+        logger.info("Профиль запуска бота:\n  " + "\n  ".join(lines))
+
+
+class ProfiledGetUpdatesRequest(HTTPXRequest):
+    """
+    Запрос getUpdates, отмечающий в профиле запуска отправку первого запроса.
+    """
+
+    def __init__(self, profile: StartupProfile, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._profile = profile
+
+    async def do_request(self, *args, **kwargs):
+        if self._profile is not None:
+            profile, self._profile = self._profile, None
+            profile.mark("первый запрос getUpdates")
+            profile.report()
+        return await super().do_request(*args, **kwargs)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сессия базы данных, привязанная к обработке одного обновления Telegram.
+
+Сессия открывается процессором обновлений перед вызовом обработчиков,
+доступна им через get_update_session() и после обработки фиксируется
+(или откатывается при ошибке) и закрывается на любом пути выполнения,
+поэтому соединение не может пережить обновление.
+
+Сервисы не фиксируют транзакцию сами: все изменения обновления фиксируются
+одним COMMIT после обработчиков. Исключение - атомарная смена статуса
+уведомления, которая должна быть зафиксирована до запроса к МИС.
+
+Обновления разных пользователей обрабатываются параллельно, а обновления
+одного пользователя - последовательно в порядке поступления, чтобы шаги
+регистрации (чтение и изменение bot_state, запросы к МИС) не выполнялись
+одновременно для двух сообщений пациента.
+"""
+
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+
+from db.database import AsyncSessionLocal
+from bot.services.patient_state_cache import patient_state_cache
+
+logger = logging.getLogger(__name__)
+
+
+class _UpdateScope:
+    """
+    Состояние обработки одного обновления.
+    """
+
+    __slots__ = ('session', 'failed')
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.failed = False
+
+
+_current_scope: ContextVar[Optional[_UpdateScope]] = ContextVar('update_scope', default=None)
+
+
+def get_update_session() -> AsyncSession:
+    """
+    Получение сессии базы данных текущего обновления.
+    Сессию не нужно закрывать: это делает процессор обновлений.
+
+    Returns:
+        AsyncSession: Сессия базы данных
+
+    Raises:
+        RuntimeError: Если вызвано вне обработки обновления
+    """
+    scope = _current_scope.get()
+    if scope is None:
+        raise RuntimeError("Сессия базы данных доступна только при обработке обновления")
+    return scope.session
+
+
+def discard_update_session():
+    """
+    Отметка о том, что обработка обновления завершилась ошибкой:
+    незафиксированные изменения будут откачены, а не зафиксированы.
+    """
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.failed = True
+
+
+class _UserLock:
+    """
+    Блокировка обработки обновлений одного пользователя и количество ожидающих ее обновлений.
+    """
+
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+def update_user_id(update: object) -> Optional[int]:
+    """
+    ID пользователя (или чата), обновления которого обрабатываются последовательно.
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class SessionUpdateProcessor(SimpleUpdateProcessor):
+    """
+    Процессор обновлений, открывающий сессию базы данных на время обработки обновления
+    и обрабатывающий обновления одного пользователя последовательно.
+
+    Ошибки обработчиков перехватываются Application и передаются обработчику ошибок,
+    который вызывает discard_update_session().
+    """
+
+    __slots__ = ('_user_locks',)
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._user_locks = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user_id = update_user_id(update)
+        if user_id is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # Блокировка пользователя берется до общего семафора, чтобы ожидающие обновления
+        # одного пользователя не занимали места параллельной обработки других пользователей.
+        # asyncio.Lock пропускает ожидающих в порядке очереди, т.е. в порядке поступления обновлений
+        entry = self._user_locks.get(user_id)
+        if entry is None:
+            entry = self._user_locks[user_id] = _UserLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                await super().process_update(update, coroutine)
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._user_locks[user_id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        scope = _UpdateScope(AsyncSessionLocal())
+        token = _current_scope.set(scope)
+        committed = False
+        try:
+            await coroutine
+            if not scope.failed:
+                await scope.session.commit()
+                committed = True
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при фиксации изменений обновления: {e}")
+        finally:
+            _current_scope.reset(token)
+            # close() откатывает незафиксированную транзакцию и возвращает соединение в пул
+            await scope.session.close()
+            if not committed:
+                # Сервисы обновляют кеш состояния до фиксации: откаченное состояние не должно в нем остаться
+                user_id = update_user_id(update)
+                if user_id is not None:
+                    patient_state_cache.invalidate(user_id)
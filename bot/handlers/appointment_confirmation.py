@@ -10,13 +10,31 @@ from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import ContextTypes, CallbackQueryHandler
 
-from db.database import get_db
-from bot.services.mis_service import MISService
+from bot.core.update_session import get_update_session, discard_update_session
+from bot.services.mis_service import MISService, is_mis_available
 from bot.services.notification_service import NotificationService
-from bot.services.patient_service import get_patient_by_telegram_id, get_decrypted_patient_data
+from bot.services.patient_service import get_patient_state
 
 logger = logging.getLogger(__name__)
 
+def mis_failure_text(action_text: str) -> str:
+    """
+    Сообщение пациенту о неудачном запросе к МИС: при недоступности МИС предлагается
+    повторить попытку позже, а не звонить в клинику.
+    
+    Args:
+        action_text: Действие в родительном падеже («подтверждении записи»)
+    """
+    if not is_mis_available():
+        return (
+            "Система записи клиники временно недоступна. "
+            "Пожалуйста, нажмите кнопку еще раз через несколько минут."
+        )
+    return (
+        f"К сожалению, произошла ошибка при {action_text}. "
+        "Пожалуйста, свяжитесь с клиникой по телефону."
+    )
+
 async def handle_appointment_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обработчик для кнопок подтверждения и отмены визита.
@@ -42,44 +60,57 @@ async def handle_appointment_confirmation(update: Update, context: ContextTypes.
     telegram_id = update.effective_user.id
     
     # Инициализируем сервисы
-    db = next(get_db())
+    db = get_update_session()
     mis_service = MISService()
     notification_service = NotificationService(db)
     
+    # Новый статус уведомления в зависимости от типа кнопки
+    new_status = {"confirm_appointment": "confirmed", "cancel_appointment": "cancelled"}.get(action)
+    if not new_status:
+        logger.warning(f"Неизвестное действие: {action}")
+        await query.message.reply_text("Неизвестная команда. Пожалуйста, попробуйте снова.")
+        return
+    
+    # Уведомление, переведенное из pending этим обновлением, и признак выполненного действия в МИС:
+    # при ошибке после перехода, но до действия в МИС, уведомление возвращается в ожидание ответа
+    notification = None
+    mis_done = False
+    
     try:
-        # Получаем уведомление по appointment_id и telegram_id
-        notification = await notification_service.get_notification_by_appointment_and_telegram(
-            appointment_id, telegram_id
-        )
-        
-        if not notification:
-            logger.error(f"Уведомление не найдено для appointment_id={appointment_id} и telegram_id={telegram_id}")
-            await query.message.reply_text("Уведомление не найдено или устарело.")
-            return
-        
-        # Получаем пациента из базы данных
-        patient = get_patient_by_telegram_id(db, telegram_id)
-        if not patient:
+        # Получаем состояние пациента (из кеша, без расшифровки конфиденциальных полей)
+        patient_state = await get_patient_state(db, telegram_id)
+        if not patient_state:
             logger.error(f"Пациент не найден для telegram_id={telegram_id}")
             await query.message.reply_text("Произошла ошибка при обработке запроса. Пожалуйста, попробуйте снова.")
             return
         
-        # Получаем расшифрованные данные пациента
-        patient_data = get_decrypted_patient_data(db, patient)
+        # Атомарно переводим уведомление из статуса pending: повторное нажатие
+        # или ответ с другого устройства не выполнит действия в МИС второй раз
+        notification = await notification_service.transition_status_by_appointment(
+            appointment_id,
+            telegram_id,
+            new_status,
+            responded_at=datetime.utcnow(),
+            cancel_reason="cancelled_by_patient_needs_followup" if new_status == "cancelled" else None
+        )
+        
+        if not notification:
+            existing_status = await notification_service.get_notification_status(appointment_id, telegram_id)
+            if not existing_status:
+                logger.error(f"Уведомление не найдено для appointment_id={appointment_id} и telegram_id={telegram_id}")
+                await query.message.reply_text("Уведомление не найдено или устарело.")
+            else:
+                logger.info(f"Повторный ответ пользователя {telegram_id} на визит {appointment_id}: "
+                            f"уведомление уже в статусе {existing_status}")
+                await query.message.reply_text("Ваш ответ на это напоминание уже получен.")
+            return
         
-        # Обрабатываем действие в зависимости от типа кнопки
         if action == "confirm_appointment":
             # Подтверждение визита
             success = await mis_service.confirm_appointment(appointment_id)
             
             if success:
-                # Обновляем статус уведомления
-                await notification_service.update_notification_status(
-                    notification.id,
-                    "confirmed",
-                    datetime.utcnow()
-                )
-                
+                mis_done = True
                 # Отправляем сообщение пользователю
                 await query.message.edit_text(
                     "✅ Ваша запись успешно подтверждена!",
@@ -88,38 +119,44 @@ async def handle_appointment_confirmation(update: Update, context: ContextTypes.
                 
                 logger.info(f"Пользователь {telegram_id} подтвердил визит {appointment_id}")
             else:
-                logger.error(f"Ошибка при подтверждении визита в МИС: appointment_id={appointment_id}")
-                await query.message.reply_text(
-                    "К сожалению, произошла ошибка при подтверждении записи. "
-                    "Пожалуйста, свяжитесь с клиникой по телефону."
+                # Возвращаем уведомление в ожидание ответа, чтобы пациент мог повторить подтверждение
+                await notification_service.transition_status(
+                    notification.id, "pending", expected_status="confirmed", clear_response=True
                 )
+                notification = None
+                
+                logger.error(f"Ошибка при подтверждении визита в МИС: appointment_id={appointment_id}")
+                await query.message.reply_text(mis_failure_text("подтверждении записи"))
         
-        elif action == "cancel_appointment":
-            # Отмена визита
-            # Обновляем статус уведомления
-            await notification_service.update_notification_status(
-                notification.id,
-                "cancelled",
-                datetime.utcnow(),
+        else:
+            # Отменяем визит в МИС
+            success = await mis_service.cancel_appointment(
+                appointment_id,
                 "cancelled_by_patient_needs_followup"
             )
             
+            if not success:
+                # Возвращаем уведомление в ожидание ответа, чтобы пациент мог повторить отмену
+                await notification_service.transition_status(
+                    notification.id, "pending", expected_status="cancelled", clear_response=True
+                )
+                notification = None
+                
+                logger.error(f"Ошибка при отмене визита в МИС: appointment_id={appointment_id}")
+                await query.message.reply_text(mis_failure_text("отмене записи"))
+                return
+            mis_done = True
+            
             # Отправляем сообщение пользователю
             await query.message.edit_text(
                 "❌ Очень жаль, будем ждать вас в следующий раз!",
                 reply_markup=None  # Убираем кнопки
             )
             
-            # Отменяем визит в МИС
-            await mis_service.cancel_appointment(
-                appointment_id,
-                "cancelled_by_patient_needs_followup"
-            )
-            
             # Создаем задачу в МИС для связи с пациентом
             deadline = datetime.utcnow() + timedelta(days=1)
             await mis_service.create_task(
-                patient_data.get('mis_id'),
+                patient_state.mis_id,
                 appointment_id,
                 "Пациент отменил приём через Telegram",
                 "Пациент отменил визит через Telegram-бот. Требуется связаться с пациентом и уточнить причину отмены.",
@@ -127,19 +164,19 @@ async def handle_appointment_confirmation(update: Update, context: ContextTypes.
             )
             
             logger.info(f"Пользователь {telegram_id} отменил визит {appointment_id}")
-        
-        else:
-            logger.warning(f"Неизвестное действие: {action}")
-            await query.message.reply_text("Неизвестная команда. Пожалуйста, попробуйте снова.")
     
     except Exception as e:
         logger.error(f"Ошибка при обработке подтверждения/отмены визита: {e}")
+        if notification is not None and not mis_done:
+            # Возвращаем уведомление в ожидание ответа, чтобы пациент мог повторить ответ
+            await notification_service.transition_status(
+                notification.id, "pending", expected_status=new_status, clear_response=True
+            )
+        discard_update_session()
         await query.message.reply_text(
             "К сожалению, произошла ошибка при обработке вашего запроса. "
             "Пожалуйста, свяжитесь с клиникой по телефону."
         )
-    finally:
-        db.close()
 
 # Регистрация обработчика
 appointment_confirmation_handler = CallbackQueryHandler(
@@ -10,8 +10,8 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, KeyboardButton, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
 
-from db.database import get_db
-from bot.services.patient_service import get_patient_by_telegram_id, update_patient_profile
+from bot.core.update_session import get_update_session
+from bot.services.patient_service import get_patient_state, update_patient_profile
 from bot.utils.text_loader import load_text
 
 logger = logging.getLogger(__name__)
@@ -28,10 +28,10 @@ async def handle_notifications_consent(update: Update, context: ContextTypes.DEF
     await query.answer()  # Отвечаем на callback query, чтобы убрать часы загрузки
     
     user = update.effective_user
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
+    db = get_update_session()
+    patient_state = await get_patient_state(db, user.id)
     
-    if not db_patient:
+    if not patient_state:
         logger.error(f"Пациент с telegram_id={user.id} не найден")
         await query.message.reply_text("Произошла ошибка. Пожалуйста, используйте команду /start для начала работы с ботом.")
         return
@@ -41,7 +41,7 @@ async def handle_notifications_consent(update: Update, context: ContextTypes.DEF
     
     if action == "yes":
         # Пациент согласился на уведомления
-        update_patient_profile(db, user.id, consent_notifications=True, bot_state="awaiting_marketing_consent")
+        await update_patient_profile(db, user.id, consent_notifications=True, bot_state="awaiting_marketing_consent")
         
         # Отправляем сообщение о принятии согласия
         await query.message.edit_text(
@@ -62,8 +62,6 @@ async def handle_notifications_consent(update: Update, context: ContextTypes.DEF
         
         # Отправляем запрос на согласие на маркетинг
         await query.message.reply_text(consent_text, reply_markup=keyboard, parse_mode='Markdown')
-    
-    db.close()
 
 async def handle_marketing_consent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -77,10 +75,10 @@ async def handle_marketing_consent(update: Update, context: ContextTypes.DEFAULT
     await query.answer()  # Отвечаем на callback query, чтобы убрать часы загрузки
     
     user = update.effective_user
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
+    db = get_update_session()
+    patient_state = await get_patient_state(db, user.id)
     
-    if not db_patient:
+    if not patient_state:
         logger.error(f"Пациент с telegram_id={user.id} не найден")
         await query.message.reply_text("Произошла ошибка. Пожалуйста, используйте команду /start для начала работы с ботом.")
         return
@@ -90,7 +88,7 @@ async def handle_marketing_consent(update: Update, context: ContextTypes.DEFAULT
     
     # Обновляем состояние пациента
     consent_marketing = (action == "yes")
-    update_patient_profile(db, user.id, consent_marketing=consent_marketing, bot_state="awaiting_phone_number")
+    await update_patient_profile(db, user.id, consent_marketing=consent_marketing, bot_state="awaiting_phone_number")
     
     # Отправляем сообщение о принятии решения
     if action == "yes":
@@ -117,8 +115,6 @@ async def handle_marketing_consent(update: Update, context: ContextTypes.DEFAULT
         "Вы можете нажать кнопку ниже, чтобы передать номер автоматически.",
         reply_markup=keyboard
     )
-    
-    db.close()
 
 # Регистрация обработчиков
 notifications_consent_handler = CallbackQueryHandler(
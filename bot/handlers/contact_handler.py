@@ -9,8 +9,8 @@ import logging
 from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, MessageHandler, filters
 
-from db.database import get_db
-from bot.services.patient_service import get_patient_by_telegram_id, update_patient_profile
+from bot.core.update_session import get_update_session
+from bot.services.patient_service import get_patient_state, update_patient_profile
 
 logger = logging.getLogger(__name__)
 
@@ -25,17 +25,17 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
+    db = get_update_session()
+    patient_state = await get_patient_state(db, user.id)
 
-    if not db_patient:
+    if not patient_state:
         await update.message.reply_text(
             "Кажется, вы еще не зарегистрированы. Пожалуйста, используйте команду /start."
         )
         return
 
-    if db_patient.bot_state == "awaiting_phone_number":
-        update_patient_profile(db, db_patient, phone_number=contact.phone_number, bot_state="registered")
+    if patient_state.bot_state == "awaiting_phone_number":
+        await update_patient_profile(db, user.id, phone_number=contact.phone_number, bot_state="registered")
         await update.message.reply_text(
             "✅ Ваш номер телефона сохранён! Регистрация завершена.",
             reply_markup=ReplyKeyboardRemove()
@@ -51,3 +51,7 @@ async def reject_manual_phone(update: Update, context: ContextTypes.DEFAULT_TYPE
 def register_handlers(application):
     application.add_handler(MessageHandler(filters.CONTACT, handle_contact))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), reject_manual_phone))
+
+
+# Регистрация обработчика
+contact_handler = MessageHandler(filters.CONTACT, handle_contact)
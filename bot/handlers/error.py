@@ -10,6 +10,8 @@ import traceback
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from bot.core.update_session import discard_update_session
+
 logger = logging.getLogger(__name__)
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
@@ -25,6 +27,9 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Произошла ошибка: {context.error}")
     logger.error(traceback.format_exc())
     
+    # Незафиксированные изменения обновления откатываются
+    discard_update_session()
+    
     # Отправка сообщения пользователю, если возможно
     if update and isinstance(update, Update) and update.effective_message:
         error_message = (
@@ -6,12 +6,10 @@
 """
 
 import logging
-from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from db.database import get_db
-from bot.services.patient_service import get_patient_by_telegram_id
+from bot.services.activity_service import activity_recorder
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +25,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"Пользователь {user.id} запросил справку")
     
-    # Обновление времени последней активности пациента
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
-    if db_patient:
-        db_patient.last_activity = datetime.utcnow()
-        db.commit()
+    # Отметка активности пациента (записывается в базу данных фоновой задачей)
+    activity_recorder.mark(user.id)
     
     # Справочное сообщение
     help_message = (
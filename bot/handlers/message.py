@@ -7,12 +7,14 @@
 
 import logging
 import re
-from datetime import datetime
+from datetime import datetime, timezone
 from telegram import Update, ReplyKeyboardRemove, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 
-from db.database import get_db
-from bot.services.patient_service import get_patient_by_telegram_id, update_patient_profile, get_decrypted_patient_data
+from bot.core.update_session import get_update_session
+from bot.services.activity_service import activity_recorder
+from bot.services.conversation_service import message_recorder
+from bot.services.patient_service import get_patient_state, update_patient_profile, get_decrypted_patient_data
 from bot.services.mis_service import MISService
 
 logger = logging.getLogger(__name__)
@@ -30,25 +32,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_text = update.message.text
     logger.info(f"Получено сообщение от пользователя {user.id}: {message_text}")
     
-    # Получение пациента из базы данных
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
+    # Получение состояния пациента (из кеша, без расшифровки конфиденциальных полей)
+    db = get_update_session()
+    patient_state = await get_patient_state(db, user.id)
     
-    if not db_patient:
+    if not patient_state:
         await update.message.reply_text(
             "Кажется, вы еще не зарегистрированы. Пожалуйста, используйте команду /start для начала работы с ботом."
         )
         return
     
-    # Обновление времени последней активности
-    db_patient.last_activity = datetime.utcnow()
-    db.commit()
-    
-    # Получение расшифрованных данных пациента
-    patient_data = get_decrypted_patient_data(db, db_patient)
+    # Отметка активности (записывается в базу данных фоновой задачей)
+    activity_recorder.mark(user.id)
     
     # Обработка сообщения в зависимости от текущего состояния пациента
-    bot_state = db_patient.bot_state
+    bot_state = patient_state.bot_state
     
     if bot_state in ["awaiting_notifications_consent", "awaiting_marketing_consent"]:
         # Если пациент находится в процессе получения согласий,
@@ -65,7 +63,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Простая валидация номера телефона (только цифры, +, длина)
         if re.match(r'^\+?[0-9]{10,15}$', phone_number):
             # Сохраняем номер телефона (будет зашифрован в update_patient_profile)
-            update_patient_profile(db, user.id, phone_number=phone_number, bot_state="awaiting_birth_date")
+            await update_patient_profile(db, user.id, phone_number=phone_number, bot_state="awaiting_birth_date")
             
             logger.info(f"Пользователь {user.id} ввел номер телефона: {phone_number}")
             
@@ -96,8 +94,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return
             
-            # Сохраняем дату рождения (будет зашифрована в update_patient_profile)
-            update_patient_profile(db, user.id, birth_date=birth_date)
+            # Сохраняем дату рождения (будет зашифрована в update_patient_profile);
+            # расшифрованные данные пациента возвращаются тем же запросом
+            db_patient = await update_patient_profile(db, user.id, birth_date=birth_date)
+            patient_data = get_decrypted_patient_data(db, db_patient)
             
             # Отправляем сообщение о поиске пациента в МИС
             await update.message.reply_text(
@@ -140,7 +140,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         )
                         
                         # Устанавливаем состояние ожидания выбора пациента
-                        update_patient_profile(db, user.id, bot_state="awaiting_patient_selection")
+                        await update_patient_profile(db, user.id, bot_state="awaiting_patient_selection")
                         return
                     else:
                         # Если найден только один пациент, используем его
@@ -150,7 +150,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     patient = patients
                 
                 # Сохраняем данные пациента
-                update_patient_profile(
+                db_patient = await update_patient_profile(
                     db, 
                     user.id,
                     mis_id=patient.get("patient_id"),
@@ -162,8 +162,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     registered_in_bot=True
                 )
                 
-                # Получаем обновленные данные пациента
-                db_patient = get_patient_by_telegram_id(db, user.id)
+                # Обновленные данные пациента получены из RETURNING
                 patient_data = get_decrypted_patient_data(db, db_patient)
                 
                 # Формируем имя и отчество для приветствия
@@ -180,7 +179,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             else:
                 # Пациент не найден
                 logger.warning(f"Пациент не найден в МИС по номеру телефона: {patient_data.get('phone_number')} и дате рождения: {birth_date_str}")
-                update_patient_profile(db, user.id, bot_state="awaiting_phone_number")
+                await update_patient_profile(db, user.id, bot_state="awaiting_phone_number")
                 
                 # Создаем кнопку для отправки контакта
                 keyboard = ReplyKeyboardMarkup(
@@ -201,10 +200,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
     
     else:  # active или другие состояния
-        # Обработка обычных сообщений
+        # Обычное сообщение сохраняется в журнал и попадает в список входящих сотрудников клиники
+        # (записывается в базу данных фоновой задачей) со временем отправки сообщения в UTC
+        sent_at = update.message.date.astimezone(timezone.utc).replace(tzinfo=None)
+        message_recorder.record(patient_state.id, update.message.message_id, message_text, sent_at)
         await update.message.reply_text(
-            "Я получил ваше сообщение. Чтобы узнать о доступных командах, используйте /help."
+            "Я получил ваше сообщение и передал его сотрудникам клиники. "
+            "Чтобы узнать о доступных командах, используйте /help."
         )
-    
-    # Закрытие сессии базы данных
-    db.close()
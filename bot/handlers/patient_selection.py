@@ -10,8 +10,8 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes, CallbackQueryHandler
 
-from db.database import get_db
-from bot.services.patient_service import get_patient_by_telegram_id, update_patient_profile, get_decrypted_patient_data
+from bot.core.update_session import get_update_session
+from bot.services.patient_service import get_patient_state, update_patient_profile, get_decrypted_patient_data
 from bot.services.mis_service import MISService
 
 logger = logging.getLogger(__name__)
@@ -28,16 +28,16 @@ async def handle_patient_selection(update: Update, context: ContextTypes.DEFAULT
     await query.answer()  # Отвечаем на callback query, чтобы убрать часы загрузки
     
     user = update.effective_user
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
+    db = get_update_session()
+    patient_state = await get_patient_state(db, user.id)
     
-    if not db_patient:
+    if not patient_state:
         logger.error(f"Пациент с telegram_id={user.id} не найден")
         await query.message.reply_text("Произошла ошибка. Пожалуйста, используйте команду /start для начала работы с ботом.")
         return
     
     # Проверяем состояние пациента
-    if db_patient.bot_state != "awaiting_patient_selection":
+    if patient_state.bot_state != "awaiting_patient_selection":
         await query.message.reply_text("Произошла ошибка. Пожалуйста, используйте команду /start для начала работы с ботом.")
         return
     
@@ -55,7 +55,7 @@ async def handle_patient_selection(update: Update, context: ContextTypes.DEFAULT
     
     if patient:
         # Сохраняем данные пациента
-        update_patient_profile(
+        db_patient = await update_patient_profile(
             db, 
             user.id,
             mis_id=patient_id,
@@ -67,8 +67,7 @@ async def handle_patient_selection(update: Update, context: ContextTypes.DEFAULT
             registered_in_bot=True
         )
         
-        # Получаем обновленные данные пациента
-        db_patient = get_patient_by_telegram_id(db, user.id)
+        # Обновленные данные пациента получены из RETURNING
         patient_data = get_decrypted_patient_data(db, db_patient)
         
         # Формируем имя и отчество для приветствия
@@ -85,14 +84,12 @@ async def handle_patient_selection(update: Update, context: ContextTypes.DEFAULT
     else:
         # Пациент не найден
         logger.error(f"Пациент с ID={patient_id} не найден в МИС")
-        update_patient_profile(db, user.id, bot_state="awaiting_phone_number")
+        await update_patient_profile(db, user.id, bot_state="awaiting_phone_number")
         
         # Отправляем сообщение об ошибке
         await query.message.edit_text(
             "❗ Произошла ошибка при получении данных пациента. Пожалуйста, попробуйте снова или обратитесь в клинику."
         )
-    
-    db.close()
 
 # Регистрация обработчика
 patient_selection_handler = CallbackQueryHandler(
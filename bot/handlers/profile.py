@@ -6,11 +6,11 @@
 """
 
 import logging
-from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 
-from db.database import get_db
+from bot.core.update_session import get_update_session
+from bot.services.activity_service import activity_recorder
 from bot.services.patient_service import get_patient_by_telegram_id, get_decrypted_patient_data
 
 logger = logging.getLogger(__name__)
@@ -28,8 +28,8 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Пользователь {user.id} запросил свой профиль")
     
     # Получение пациента из базы данных
-    db = next(get_db())
-    db_patient = get_patient_by_telegram_id(db, user.id)
+    db = get_update_session()
+    db_patient = await get_patient_by_telegram_id(db, user.id)
     
     if not db_patient:
         await update.message.reply_text(
@@ -37,9 +37,8 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    # Обновление времени последней активности
-    db_patient.last_activity = datetime.utcnow()
-    db.commit()
+    # Отметка активности (записывается в базу данных фоновой задачей)
+    activity_recorder.mark(user.id)
     
     # Получение расшифрованных данных пациента
     patient_data = get_decrypted_patient_data(db, db_patient)
@@ -5,36 +5,73 @@
 Обработчик команды /start и логики поэтапной регистрации.
 """
 
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
 
-from db.database import get_db
-from bot.services.patient_service import create_or_get_patient, update_patient_profile
+from bot.core.update_session import get_update_session
+from bot.services.patient_service import get_or_create_patient, update_patient_profile
+from bot.utils.text_loader import load_text
 
 def get_phone_request_keyboard():
     button = KeyboardButton(text="📱 Отправить номер", request_contact=True)
     return ReplyKeyboardMarkup([[button]], resize_keyboard=True, one_time_keyboard=True)
 
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик команды /start.
+    Создает пациента (или обновляет время активности существующего) одним запросом
+    и запрашивает согласие на уведомления.
+    
+    Args:
+        update: Объект обновления от Telegram
+        context: Контекст бота
+    """
+    user = update.effective_user
+    db = get_update_session()
+    patient = await get_or_create_patient(db, user.id, update.effective_chat.id)
+    
+    if patient.registered_in_bot:
+        await update.message.reply_text(
+            "👋 С возвращением! Чтобы узнать о доступных командах, используйте /help."
+        )
+        return
+    
+    await update_patient_profile(db, patient, bot_state="awaiting_notifications_consent")
+    
+    # Загружаем текст согласия на уведомления
+    consent_text = load_text('consent_notifications.md')
+    
+    # Создаем кнопки согласия/отказа
+    keyboard = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✅ Согласен", callback_data="consent_notifications:yes"),
+            InlineKeyboardButton("❌ Не согласен", callback_data="consent_notifications:no")
+        ]
+    ])
+    
+    await update.message.reply_text(consent_text, reply_markup=keyboard, parse_mode='Markdown')
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Старт команды /start"""
     user = update.effective_user
-    db = next(get_db())
-    patient = create_or_get_patient(db, user.id)
+    db = get_update_session()
+    patient = await get_or_create_patient(db, user.id)
 
     await update.message.reply_text(
         "👋 Привет! Чтобы продолжить, подтвердите согласие на обработку персональных данных и получение уведомлений.\n\n"
         "Напиши: *Согласен*",
         parse_mode='Markdown'
     )
-    update_patient_profile(db, patient, bot_state="awaiting_consent")
+    await update_patient_profile(db, patient, bot_state="awaiting_consent")
 
 
 async def handle_consent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     text = update.message.text.strip().lower()
 
-    db = next(get_db())
-    patient = create_or_get_patient(db, user.id)
+    db = get_update_session()
+    patient = await get_or_create_patient(db, user.id)
 
     if patient.bot_state != "awaiting_consent":
         return
@@ -43,7 +80,7 @@ async def handle_consent(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, напиши 'Согласен', чтобы продолжить.")
         return
 
-    update_patient_profile(db, patient, bot_state="awaiting_full_name")
+    await update_patient_profile(db, patient, bot_state="awaiting_full_name")
     await update.message.reply_text("Отлично! Теперь напиши своё полное ФИО.")
 
 
@@ -51,13 +88,13 @@ async def handle_full_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     full_name = update.message.text.strip()
 
-    db = next(get_db())
-    patient = create_or_get_patient(db, user.id)
+    db = get_update_session()
+    patient = await get_or_create_patient(db, user.id)
 
     if patient.bot_state != "awaiting_full_name":
         return
 
-    update_patient_profile(db, patient, full_name=full_name, bot_state="awaiting_phone_number")
+    await update_patient_profile(db, patient, full_name=full_name, bot_state="awaiting_phone_number")
 
     await update.message.reply_text(
         f"Спасибо, {full_name}!\nТеперь отправьте свой номер телефона с помощью кнопки ниже ⬇️",
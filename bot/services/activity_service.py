@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сервис для учета времени последней активности пациентов.
+
+Обработчики только отмечают активность пользователя в памяти, а фоновая задача
+периодически записывает все накопленные значения одним запросом
+UPDATE ... FROM (VALUES ...), вместо отдельной транзакции на каждое сообщение.
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import update, values, column, BigInteger, DateTime
+
+from db.database import async_engine
+from db.models import Patient
+from bot.services.batch_recorder import BatchRecorder
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество строк VALUES в одном запросе
+FLUSH_CHUNK_SIZE = 1000
+
+
+class ActivityRecorder(BatchRecorder):
+    """
+    Буфер времени последней активности пациентов.
+    """
+
+    description = "времени последней активности"
+
+    def _empty(self):
+        return {}
+
+    def _requeue(self, pending):
+        # Более новые отметки, сделанные во время записи, имеют приоритет
+        for telegram_id, timestamp in pending.items():
+            self._pending.setdefault(telegram_id, timestamp)
+
+    def mark(self, telegram_id: int, timestamp: datetime = None):
+        """
+        Отметка активности пользователя (без обращения к базе данных).
+
+        Args:
+            telegram_id: ID пользователя в Telegram
+            timestamp: Время активности (по умолчанию текущее)
+        """
+        self._pending[telegram_id] = timestamp or datetime.utcnow()
+
+    async def _write(self, pending: dict) -> int:
+        rows = list(pending.items())
+        updated = 0
+
+        async with async_engine.begin() as conn:
+            for offset in range(0, len(rows), FLUSH_CHUNK_SIZE):
+                activity = values(
+                    column('telegram_id', BigInteger),
+                    column('last_activity', DateTime),
+                    name='activity'
+                ).data(rows[offset:offset + FLUSH_CHUNK_SIZE])
+                result = await conn.execute(
+                    update(Patient.__table__)
+                    .where(
+                        Patient.telegram_id == activity.c.telegram_id,
+                        Patient.last_activity < activity.c.last_activity
+                    )
+                    .values(last_activity=activity.c.last_activity)
+                )
+                updated += result.rowcount
+
+        logger.debug(f"Записано время последней активности: {updated} из {len(rows)}")
+        return updated
+
+
+# Общий буфер активности процесса бота
+activity_recorder = ActivityRecorder()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Базовый буфер записей, которые обработчики накапливают в памяти,
+а фоновая задача записывает в базу данных пакетами.
+"""
+
+import asyncio
+import logging
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRecorder:
+    """
+    Буфер пакетной записи.
+
+    Подкласс определяет пустой буфер (_empty), запись пакета (_write) и возврат
+    незаписанного пакета в буфер (_requeue); добавление в буфер вызывает _added().
+    """
+
+    # Что записывается, в родительном падеже (для лога)
+    description = "записей"
+
+    def __init__(self, batch_size: int = None):
+        """
+        Args:
+            batch_size: Количество записей, при котором запись начинается до истечения интервала
+                (None - только по интервалу)
+        """
+        self._pending = self._empty()
+        self._batch_size = batch_size
+        self._batch_ready = asyncio.Event()
+
+    def _empty(self):
+        return []
+
+    def _requeue(self, pending):
+        """
+        Возврат незаписанного пакета в начало буфера.
+        """
+        self._pending = pending + self._pending
+
+    async def _write(self, pending) -> int:
+        """
+        Запись пакета в одной транзакции.
+
+        Returns:
+            int: Количество записанных строк
+        """
+        raise NotImplementedError
+
+    def _added(self):
+        if self._batch_size and len(self._pending) >= self._batch_size:
+            self._batch_ready.set()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных значений в базу данных.
+        При ошибке значения возвращаются в буфер и будут записаны при следующей попытке.
+
+        Returns:
+            int: Количество записанных строк
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, self._empty()
+        try:
+            return await self._write(pending)
+        except SQLAlchemyError as e:
+            self._requeue(pending)
+            logger.error(f"Ошибка при записи {self.description}: {e}")
+            return 0
+        except asyncio.CancelledError:
+            # Остановка фоновой задачи во время записи: транзакция откатывается,
+            # значения будут записаны при остановке бота (on_shutdown)
+            self._requeue(pending)
+            raise
+
+    async def run(self, interval: float):
+        """
+        Периодическая запись накопленных значений (фоновая задача).
+        Запись начинается раньше интервала, если в буфере накопился полный пакет.
+
+        Args:
+            interval: Интервал записи в секундах
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Автоматический выключатель (circuit breaker) для запросов к внешним системам.
+
+closed    - запросы выполняются, сбои подряд подсчитываются;
+open      - после failure_threshold сбоев подряд запросы отклоняются без обращения
+            к внешней системе в течение recovery_timeout секунд;
+half_open - по истечении recovery_timeout выполняется один пробный запрос:
+            успех закрывает выключатель, сбой снова открывает его.
+"""
+
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель запросов к одной внешней системе.
+    Предназначен для одного цикла событий (без блокировок).
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        """
+        Args:
+            name: Название внешней системы (для лога)
+            failure_threshold: Количество сбоев подряд, после которого выключатель открывается
+            recovery_timeout: Время до пробного запроса после открытия, секунды
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        """
+        Текущее состояние; открытый выключатель переходит в half_open по истечении recovery_timeout.
+        """
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Проверка, можно ли выполнить запрос. В состоянии half_open разрешается
+        только один пробный запрос одновременно.
+
+        Returns:
+            bool: True, если запрос можно выполнить
+        """
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        """
+        Учет успешного запроса.
+        """
+        self._failures = 0
+        self._probe_in_flight = False
+        if self._state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        """
+        Учет сбоя внешней системы (ошибка сети, таймаут, ответ 5xx).
+        """
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            self._set_state(OPEN)
+
+    def release(self):
+        """
+        Завершение запроса без вывода о доступности внешней системы
+        (например, отмена запроса или ошибка на стороне клиента до получения ответа):
+        пробный запрос может быть выполнен повторно. Любой полученный ответ, кроме 5xx,
+        в том числе 4xx, означает, что система доступна (record_success).
+        """
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Выключатель запросов к {self.name}: {self._state} -> {state}"
+            + (f" (сбоев подряд: {self._failures}, пробный запрос через {self.recovery_timeout:.0f} с)" if state == OPEN else ""))
+        self._state = state
+
+    def stats(self) -> dict:
+        """
+        Состояние и счетчики выключателя для мониторинга.
+        """
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
+
+    def log_stats(self):
+        """
+        Запись состояния выключателя в лог.
+        """
+        logger.info(f"Выключатель запросов к {self.name}: " + ", ".join(f"{key}={value}" for key, value in self.stats().items()))
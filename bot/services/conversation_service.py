@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сервис для журнала сообщений пациентов и списка входящих чатов.
+
+Обработчики только добавляют входящие сообщения в буфер, а фоновая задача
+записывает их пакетами: в одной транзакции сообщения добавляются в журнал
+patient_messages, а счетчики непрочитанных и последнее сообщение чатов
+обновляются одним запросом INSERT ... ON CONFLICT DO UPDATE
+SET unread_count = conversations.unread_count + n.
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, update, insert, case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+
+from db.database import async_engine
+from db.models import Conversation, PatientMessage
+from bot.services.batch_recorder import BatchRecorder
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество сообщений в одном запросе
+FLUSH_CHUNK_SIZE = 500
+
+
+def build_conversation_upsert(rows: list):
+    """
+    Запрос обновления чатов по пакету сообщений.
+    Счетчик непрочитанных увеличивается атомарно, последнее сообщение заменяется,
+    только если оно новее сохраненного (пакеты разных процессов могут прийти не по порядку).
+
+    Args:
+        rows: Словари с patient_id, last_message, last_timestamp и unread_count
+    """
+    stmt = pg_insert(Conversation.__table__).values(rows)
+    table = Conversation.__table__
+    is_newer = stmt.excluded.last_timestamp >= table.c.last_timestamp
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.patient_id],
+        set_={
+            'unread_count': table.c.unread_count + stmt.excluded.unread_count,
+            'last_message': case((is_newer, stmt.excluded.last_message), else_=table.c.last_message),
+            'last_timestamp': func.greatest(table.c.last_timestamp, stmt.excluded.last_timestamp),
+        }
+    )
+
+
+class MessageRecorder(BatchRecorder):
+    """
+    Буфер входящих сообщений пациентов.
+    """
+
+    description = "сообщений пациентов"
+
+    def __init__(self, batch_size: int = FLUSH_CHUNK_SIZE):
+        """
+        Args:
+            batch_size: Количество сообщений, при котором запись начинается до истечения интервала
+        """
+        super().__init__(batch_size)
+
+    def record(self, patient_id: int, telegram_message_id: int, text: str, timestamp: datetime = None):
+        """
+        Добавление входящего сообщения в буфер (без обращения к базе данных).
+
+        Args:
+            patient_id: ID пациента
+            telegram_message_id: ID сообщения в Telegram
+            text: Текст сообщения
+            timestamp: Время сообщения, UTC без часового пояса (по умолчанию текущее)
+        """
+        self._pending.append({
+            'patient_id': patient_id,
+            'telegram_message_id': telegram_message_id,
+            'text': text,
+            'created_at': timestamp or datetime.utcnow(),
+        })
+        self._added()
+
+    async def _write(self, pending: list) -> int:
+        """
+        Запись сообщений и обновление чатов в одной транзакции.
+        """
+        # Количество новых сообщений и последнее сообщение каждого пациента
+        conversations = {}
+        for message in pending:
+            conversation = conversations.get(message['patient_id'])
+            if conversation is None:
+                conversation = conversations[message['patient_id']] = {
+                    'patient_id': message['patient_id'],
+                    'unread_count': 0,
+                    'last_timestamp': message['created_at'],
+                    'last_message': message['text'],
+                }
+            conversation['unread_count'] += 1
+            if message['created_at'] >= conversation['last_timestamp']:
+                conversation['last_timestamp'] = message['created_at']
+                conversation['last_message'] = message['text']
+        conversation_rows = sorted(conversations.values(), key=lambda row: row['patient_id'])
+
+        async with async_engine.begin() as conn:
+            for offset in range(0, len(pending), FLUSH_CHUNK_SIZE):
+                await conn.execute(insert(PatientMessage.__table__), pending[offset:offset + FLUSH_CHUNK_SIZE])
+            # Строки чатов блокируются в порядке patient_id, чтобы параллельные записи не взаимоблокировались
+            for offset in range(0, len(conversation_rows), FLUSH_CHUNK_SIZE):
+                await conn.execute(build_conversation_upsert(conversation_rows[offset:offset + FLUSH_CHUNK_SIZE]))
+
+        logger.debug(f"Записано сообщений пациентов: {len(pending)}, обновлено чатов: {len(conversation_rows)}")
+        return len(pending)
+
+
+async def get_inbox(db: AsyncSession, limit: int = 50, before: datetime = None, unread_only: bool = False) -> list:
+    """
+    Список чатов для сотрудников клиники: последние чаты сверху.
+
+    Args:
+        db: Сессия базы данных
+        limit: Максимальное количество чатов
+        before: Время последнего сообщения последнего чата предыдущей страницы
+        unread_only: Только чаты с непрочитанными сообщениями
+
+    Returns:
+        list: Список объектов Conversation
+    """
+    try:
+        stmt = select(Conversation).order_by(Conversation.last_timestamp.desc()).limit(limit)
+        if before is not None:
+            stmt = stmt.where(Conversation.last_timestamp < before)
+        if unread_only:
+            stmt = stmt.where(Conversation.unread_count > 0)
+        return list((await db.scalars(stmt)).all())
+    except SQLAlchemyError as e:
+        logger.error(f"Ошибка при получении списка чатов: {e}")
+        return []
+
+
+async def get_patient_messages(db: AsyncSession, patient_id: int, limit: int = 50,
+                               before: datetime = None) -> list:
+    """
+    Последние сообщения пациента из журнала, новые сверху.
+
+    Args:
+        db: Сессия базы данных
+        patient_id: ID пациента
+        limit: Максимальное количество сообщений
+        before: Время самого раннего сообщения предыдущей страницы
+
+    Returns:
+        list: Список объектов PatientMessage
+    """
+    try:
+        stmt = (
+            select(PatientMessage)
+            .where(PatientMessage.patient_id == patient_id)
+            .order_by(PatientMessage.created_at.desc())
+            .limit(limit)
+        )
+        if before is not None:
+            stmt = stmt.where(PatientMessage.created_at < before)
+        return list((await db.scalars(stmt)).all())
+    except SQLAlchemyError as e:
+        logger.error(f"Ошибка при получении сообщений пациента: {e}")
+        return []
+
+
+async def mark_conversation_read(db: AsyncSession, patient_id: int, read_count: Optional[int] = None) -> Optional[int]:
+    """
+    Отметка сообщений чата прочитанными (без фиксации транзакции).
+    Если указано количество прочитанных сообщений, счетчик уменьшается на него атомарно,
+    и сообщения, пришедшие после загрузки чата сотрудником, остаются непрочитанными.
+
+    Args:
+        db: Сессия базы данных
+        patient_id: ID пациента
+        read_count: Количество прочитанных сообщений (по умолчанию все)
+
+    Returns:
+        int: Оставшееся количество непрочитанных сообщений или None, если чат не найден
+    """
+    try:
+        unread_count = 0 if read_count is None else func.greatest(Conversation.unread_count - read_count, 0)
+        remaining = await db.scalar(
+            update(Conversation)
+            .where(Conversation.patient_id == patient_id)
+            .values(unread_count=unread_count)
+            .returning(Conversation.unread_count)
+        )
+        return remaining
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Ошибка при отметке сообщений прочитанными: {e}")
+        return None
+
+
+# Общий буфер сообщений процесса бота
+message_recorder = MessageRecorder()
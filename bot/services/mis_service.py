@@ -3,31 +3,183 @@
 
 """
 Сервис для работы с API МИС Renovatio.
+
+Все запросы процесса выполняются через один HTTP-клиент с пулом keep-alive
+соединений (и HTTP/2, если включен MIS_HTTP2), поэтому DNS, TCP и TLS
+не устанавливаются заново для каждого запроса. Бот создает клиент при запуске
+и закрывает при остановке (bot/core/setup.py), скрипты - через async with mis_client().
+
+Сбои МИС (ошибки сети, таймауты, ответы 5xx) повторяются с экспоненциальной паузой
+и случайным разбросом по политике метода: методы чтения повторяются при любом сбое,
+изменяющие методы - только если запрос не был отправлен (ошибка соединения).
+Автоматический выключатель (mis_circuit_breaker) после серии сбоев отклоняет запросы
+без обращения к МИС и периодически пропускает пробный запрос.
 """
 
+import random
+import asyncio
 import logging
 import httpx
-from typing import Dict, Any, Optional, List, Union
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Union, NamedTuple
 from datetime import datetime
 
-from config import MIS_RENOVATIO_API_KEY
+from config import (
+    MIS_RENOVATIO_API_KEY, MIS_HTTP_TIMEOUT, MIS_HTTP_MAX_CONNECTIONS,
+    MIS_HTTP_MAX_KEEPALIVE_CONNECTIONS, MIS_HTTP_KEEPALIVE_EXPIRY, MIS_HTTP2,
+    MIS_RETRY_ATTEMPTS, MIS_RETRY_BASE_DELAY, MIS_RETRY_MAX_DELAY, MIS_READ_TIMEOUT,
+    MIS_BREAKER_FAILURE_THRESHOLD, MIS_BREAKER_RECOVERY_TIMEOUT
+)
+from bot.services.circuit_breaker import CircuitBreaker, OPEN
 
 logger = logging.getLogger(__name__)
 
+
+class RetryPolicy(NamedTuple):
+    """
+    Политика повторов запроса к МИС.
+    """
+    # Общее количество попыток
+    attempts: int
+    # Таймаут одной попытки, секунды
+    timeout: float
+    # Повторять только запросы, которые не были отправлены в МИС
+    unsent_only: bool
+
+
+READ_POLICY = RetryPolicy(MIS_RETRY_ATTEMPTS, MIS_READ_TIMEOUT, unsent_only=False)
+WRITE_POLICY = RetryPolicy(MIS_RETRY_ATTEMPTS, MIS_HTTP_TIMEOUT, unsent_only=True)
+
+# Политики повторов идемпотентных методов чтения; остальные методы используют WRITE_POLICY
+RETRY_POLICIES = {
+    "getPatient": READ_POLICY,
+    "getAppointments": READ_POLICY,
+    "getTestResults": READ_POLICY,
+    "getAvailableSlots": READ_POLICY,
+}
+
+# Ошибки, при которых запрос гарантированно не дошел до МИС
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Выключатель запросов к МИС процесса
+mis_circuit_breaker = CircuitBreaker("МИС", MIS_BREAKER_FAILURE_THRESHOLD, MIS_BREAKER_RECOVERY_TIMEOUT)
+
+
+def is_mis_available() -> bool:
+    """
+    Проверка, что запросы к МИС не отклоняются выключателем.
+    """
+    return mis_circuit_breaker.state != OPEN
+
+
+def backoff_delay(retry: int) -> float:
+    """
+    Пауза перед повтором: случайное значение от 0 до экспоненциально растущей границы,
+    чтобы повторы разных запросов не приходили в МИС одновременно.
+
+    Args:
+        retry: Номер повтора, начиная с 0
+    """
+    return random.uniform(0, min(MIS_RETRY_MAX_DELAY, MIS_RETRY_BASE_DELAY * 2 ** retry))
+
+# Общий HTTP-клиент МИС процесса
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_mis_client() -> httpx.AsyncClient:
+    """
+    Создание HTTP-клиента МИС с настройками пула соединений из конфигурации.
+    Если HTTP/2 включен, но пакет h2 не установлен, используется HTTP/1.1.
+    """
+    http2 = MIS_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("MIS_HTTP2 включен, но пакет h2 не установлен (pip install httpx[http2]), используется HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        timeout=MIS_HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MIS_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=MIS_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=MIS_HTTP_KEEPALIVE_EXPIRY
+        ),
+        http2=http2,
+        # Формат кодировки тела запроса API МИС: application/x-www-form-urlencoded
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+
+
+async def start_mis_client() -> httpx.AsyncClient:
+    """
+    Создание общего HTTP-клиента МИС (при запуске бота, post_init).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_mis_client()
+        logger.info(f"Создан HTTP-клиент МИС (соединений не более {MIS_HTTP_MAX_CONNECTIONS})")
+    return _client
+
+
+async def close_mis_client():
+    """
+    Закрытие общего HTTP-клиента МИС и его соединений (при остановке бота, post_shutdown).
+    """
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+        logger.info("HTTP-клиент МИС закрыт")
+
+
+def get_mis_client() -> httpx.AsyncClient:
+    """
+    Общий HTTP-клиент МИС. Если клиент не был создан при запуске, он создается
+    при первом обращении и закрывается вместе с остальными при остановке.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_mis_client()
+    return _client
+
+
+@asynccontextmanager
+async def mis_client():
+    """
+    Общий HTTP-клиент МИС на время работы скрипта:
+
+        async with mis_client():
+            await MISService().get_appointments(...)
+    """
+    client = await start_mis_client()
+    try:
+        yield client
+    finally:
+        await close_mis_client()
+
+
 class MISService:
     """
     Сервис для взаимодействия с API МИС Renovatio.
+    Создание сервиса не открывает соединений: запросы выполняются общим HTTP-клиентом процесса.
     """
     
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            client: HTTP-клиент (по умолчанию общий клиент процесса)
+        """
         self.api_key = MIS_RENOVATIO_API_KEY
         self.base_url = "https://app.rnova.org/api/public"
         self.api_version = "v2"
-        self.timeout = 10.0
+        self._client = client
     
     async def _make_request(self, method: str, params: Dict[str, Any], version: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Выполнение запроса к API МИС Renovatio.
+        Сбои МИС повторяются по политике метода (RETRY_POLICIES).
         
         Args:
             method: Метод API
@@ -52,15 +204,69 @@ class MISService:
             log_params["api_key"] = "***HIDDEN***"
         logger.info(f"Отправка запроса к МИС: {url}, параметры: {log_params}")
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # Используем правильный формат кодировки тела запроса: application/x-www-form-urlencoded
-                headers = {"Content-Type": "application/x-www-form-urlencoded"}
-                response = await client.post(url, data=params, headers=headers)
+        policy = RETRY_POLICIES.get(method, WRITE_POLICY)
+        client = self._client or get_mis_client()
+        
+        for attempt in range(policy.attempts):
+            if attempt:
+                delay = backoff_delay(attempt - 1)
+                logger.info(f"Повтор запроса к МИС {method} через {delay:.1f} с (попытка {attempt + 1} из {policy.attempts})")
+                await asyncio.sleep(delay)
+            
+            # Пока МИС недоступна, запрос отклоняется сразу, без ожидания таймаута
+            if not mis_circuit_breaker.allow_request():
+                logger.warning(f"Запрос к МИС {method} отклонен: МИС недоступна")
+                return None
+            
+            try:
+                response = await client.post(url, data=params, timeout=policy.timeout)
+            except UNSENT_ERRORS as e:
+                mis_circuit_breaker.record_failure()
+                logger.error(f"Ошибка соединения с МИС: {e!r}")
+                continue
+            except httpx.TransportError as e:
+                # Запрос мог быть выполнен МИС: изменяющие методы не повторяются
+                mis_circuit_breaker.record_failure()
+                logger.error(f"Ошибка запроса к МИС: {e!r}")
+                if policy.unsent_only:
+                    return None
+                continue
+            except asyncio.CancelledError:
+                mis_circuit_breaker.release()
+                raise
+            except Exception as e:
+                mis_circuit_breaker.release()
+                logger.error(f"Неизвестная ошибка при запросе к МИС: {e}")
+                return None
             
             # Логирование статуса ответа
             logger.info(f"Получен ответ от МИС: статус {response.status_code}")
             
+            if response.is_server_error:
+                mis_circuit_breaker.record_failure()
+                logger.error(f"Ошибка HTTP при запросе к МИС: {response.status_code} - {response.text}")
+                if policy.unsent_only:
+                    return None
+                continue
+            
+            # Любой другой ответ означает, что МИС доступна
+            mis_circuit_breaker.record_success()
+            return self._parse_response(response)
+        
+        logger.error(f"Запрос к МИС {method} не выполнен после {policy.attempts} попыток")
+        return None
+    
+    def _parse_response(self, response: httpx.Response) -> Optional[Dict[str, Any]]:
+        """
+        Разбор ответа API МИС Renovatio.
+        
+        Args:
+            response: Ответ МИС (без ошибки сервера)
+            
+        Returns:
+            Dict: Данные ответа или None в случае ошибки
+        """
+        try:
             response.raise_for_status()
             result = response.json()
             
@@ -80,9 +286,6 @@ class MISService:
         except httpx.HTTPStatusError as e:
             logger.error(f"Ошибка HTTP при запросе к МИС: {e.response.status_code} - {e.response.text}")
             return None
-        except httpx.RequestError as e:
-            logger.error(f"Ошибка запроса к МИС: {e}")
-            return None
         except Exception as e:
             logger.error(f"Неизвестная ошибка при запросе к МИС: {e}")
             return None
@@ -150,12 +353,14 @@ class MISService:
         
         return result
     
-    async def get_appointments(self, patient_id: int) -> Optional[List[Dict[str, Any]]]:
+    async def get_appointments(self, patient_id: int, date_from: str = None, date_to: str = None) -> Optional[List[Dict[str, Any]]]:
         """
         Получение списка приемов пациента.
         
         Args:
             patient_id: ID пациента в МИС
+            date_from: Дата начала периода в формате YYYY-MM-DD (опционально)
+            date_to: Дата окончания периода в формате YYYY-MM-DD (опционально)
             
         Returns:
             List[Dict]: Список приемов или None в случае ошибки
@@ -164,6 +369,11 @@ class MISService:
             "patient_id": patient_id
         }
         
+        if date_from:
+            params["date_from"] = date_from
+        if date_to:
+            params["date_to"] = date_to
+        
         result = await self._make_request("getAppointments", params)
         return result.get("appointments", []) if result else None
     
@@ -3,12 +3,15 @@
 
 """
 Сервис для работы с уведомлениями в базе данных PostgreSQL.
+Методы сервиса работают с асинхронной сессией базы данных (AsyncSession) и не фиксируют
+транзакцию, кроме атомарной смены статуса: она фиксируется сразу, до запроса к МИС.
 """
 
 import logging
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, lambda_stmt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
 from db.models import Notification, Patient
@@ -20,7 +23,7 @@ class NotificationService:
     Сервис для работы с уведомлениями.
     """
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         """
         Инициализация сервиса.
         
@@ -59,14 +62,13 @@ class NotificationService:
             )
             
             self.db.add(notification)
-            self.db.commit()
-            self.db.refresh(notification)
+            await self.db.flush()
             
             logger.info(f"Создано уведомление для пациента {patient_id}, визит {appointment_id}")
             return notification
         
         except SQLAlchemyError as e:
-            self.db.rollback()
+            await self.db.rollback()
             logger.error(f"Ошибка при создании уведомления: {e}")
             return None
     
@@ -81,7 +83,7 @@ class NotificationService:
             Notification: Объект уведомления или None, если не найдено
         """
         try:
-            return self.db.query(Notification).filter(Notification.id == notification_id).first()
+            return await self.db.get(Notification, notification_id)
         
         except SQLAlchemyError as e:
             logger.error(f"Ошибка при получении уведомления: {e}")
@@ -103,15 +105,41 @@ class NotificationService:
             Notification: Объект уведомления или None, если не найдено
         """
         try:
-            return self.db.query(Notification).filter(
-                Notification.appointment_id == appointment_id,
-                Notification.telegram_id == telegram_id
-            ).first()
+            return await self.db.scalar(lambda_stmt(
+                lambda: select(Notification).where(
+                    Notification.appointment_id == appointment_id,
+                    Notification.telegram_id == telegram_id
+                ).limit(1)
+            ))
         
         except SQLAlchemyError as e:
             logger.error(f"Ошибка при получении уведомления: {e}")
             return None
     
+    async def get_notification_status(self, appointment_id: int, telegram_id: int) -> Optional[str]:
+        """
+        Получение статуса уведомления по ID визита и ID пользователя в Telegram
+        без загрузки объекта уведомления.
+        
+        Args:
+            appointment_id: ID визита в МИС
+            telegram_id: ID пользователя в Telegram
+            
+        Returns:
+            str: Статус уведомления или None, если не найдено
+        """
+        try:
+            return await self.db.scalar(lambda_stmt(
+                lambda: select(Notification.status).where(
+                    Notification.appointment_id == appointment_id,
+                    Notification.telegram_id == telegram_id
+                ).limit(1)
+            ))
+        
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка при получении статуса уведомления: {e}")
+            return None
+    
     async def update_notification_status(
         self,
         notification_id: int,
@@ -146,15 +174,126 @@ class NotificationService:
             if cancel_reason:
                 notification.cancel_reason = cancel_reason
             
-            self.db.commit()
+            await self.db.flush()
             logger.info(f"Обновлен статус уведомления {notification_id} на {status}")
             return True
         
         except SQLAlchemyError as e:
-            self.db.rollback()
+            await self.db.rollback()
             logger.error(f"Ошибка при обновлении статуса уведомления: {e}")
             return False
     
+    async def transition_status(
+        self,
+        notification_id: int,
+        status: str,
+        expected_status: str = "pending",
+        responded_at: datetime = None,
+        cancel_reason: str = None,
+        clear_response: bool = False
+    ) -> Optional[Notification]:
+        """
+        Атомарная смена статуса уведомления (compare-and-set) одним запросом
+        UPDATE ... WHERE status = :expected_status RETURNING.
+        
+        Args:
+            notification_id: ID уведомления
+            status: Новый статус уведомления
+            expected_status: Статус, из которого разрешен переход
+            responded_at: Время ответа пользователя
+            cancel_reason: Причина отмены (если применимо)
+            clear_response: Очистить время ответа и причину отмены (возврат в ожидание ответа)
+            
+        Returns:
+            Notification: Обновленное уведомление, если переход выполнен этим запросом,
+            или None, если уведомление не найдено, уже имеет другой статус или произошла ошибка
+        """
+        return await self._transition(
+            [Notification.id == notification_id],
+            status, expected_status, responded_at, cancel_reason, clear_response
+        )
+    
+    async def transition_status_by_appointment(
+        self,
+        appointment_id: int,
+        telegram_id: int,
+        status: str,
+        expected_status: str = "pending",
+        responded_at: datetime = None,
+        cancel_reason: str = None
+    ) -> Optional[Notification]:
+        """
+        Атомарная смена статуса уведомления о визите (compare-and-set) без предварительной загрузки.
+        
+        Args:
+            appointment_id: ID визита в МИС
+            telegram_id: ID пользователя в Telegram
+            status: Новый статус уведомления
+            expected_status: Статус, из которого разрешен переход
+            responded_at: Время ответа пользователя
+            cancel_reason: Причина отмены (если применимо)
+            
+        Returns:
+            Notification: Обновленное уведомление, если переход выполнен этим запросом, иначе None
+        """
+        return await self._transition(
+            [Notification.appointment_id == appointment_id, Notification.telegram_id == telegram_id],
+            status, expected_status, responded_at, cancel_reason
+        )
+    
+    async def _transition(
+        self,
+        conditions: list,
+        status: str,
+        expected_status: str,
+        responded_at: datetime,
+        cancel_reason: str,
+        clear_response: bool = False
+    ) -> Optional[Notification]:
+        values = {'status': status}
+        if clear_response:
+            values['responded_at'] = None
+            values['cancel_reason'] = None
+        if responded_at:
+            values['responded_at'] = responded_at
+        if cancel_reason:
+            values['cancel_reason'] = cancel_reason
+        
+        # Изменяется одна строка, даже если условиям соответствует несколько уведомлений
+        # (например, повторные напоминания об одном визите): вызывающий код отменяет
+        # переход по ID возвращенного уведомления. Строки, заблокированные параллельным
+        # переходом, пропускаются; условие на статус повторно проверяется после блокировки
+        target_id = (
+            select(Notification.id)
+            .where(*conditions, Notification.status == expected_status)
+            .order_by(Notification.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        
+        try:
+            notification = (await self.db.scalars(
+                update(Notification)
+                .where(Notification.id == target_id, Notification.status == expected_status)
+                .values(**values)
+                .returning(Notification),
+                execution_options={'populate_existing': True}
+            )).first()
+            # Переход фиксируется сразу: повторное нажатие, обработанное параллельно,
+            # должно увидеть новый статус до запроса к МИС
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            logger.error(f"Ошибка при смене статуса уведомления: {e}")
+            return None
+        
+        if notification is None:
+            return None
+        
+        logger.info(f"Статус уведомления {notification.id} изменен с {expected_status} на {status}")
+        return notification
+    
     async def get_pending_notifications_by_patient(self, patient_id: int) -> List[Notification]:
         """
         Получение всех ожидающих ответа уведомлений пациента.
@@ -166,10 +305,13 @@ class NotificationService:
             List[Notification]: Список уведомлений
         """
         try:
-            return self.db.query(Notification).filter(
-                Notification.patient_id == patient_id,
-                Notification.status == "pending"
-            ).all()
+            result = await self.db.scalars(lambda_stmt(
+                lambda: select(Notification).where(
+                    Notification.patient_id == patient_id,
+                    Notification.status == "pending"
+                )
+            ))
+            return list(result)
         
         except SQLAlchemyError as e:
             logger.error(f"Ошибка при получении ожидающих уведомлений: {e}")
@@ -186,9 +328,10 @@ class NotificationService:
             List[Notification]: Список уведомлений
         """
         try:
-            return self.db.query(Notification).filter(
-                Notification.status == status
-            ).all()
+            result = await self.db.scalars(
+                select(Notification).where(Notification.status == status)
+            )
+            return list(result)
         
         except SQLAlchemyError as e:
             logger.error(f"Ошибка при получении уведомлений по статусу: {e}")
@@ -3,20 +3,38 @@
 
 """
 Сервис для работы с пациентами в базе данных PostgreSQL с шифрованием.
+Функции работают с асинхронной сессией базы данных (AsyncSession) и не фиксируют
+транзакцию: изменения фиксирует вызывающий код (процессор обновлений бота).
 """
 
 import logging
+import re
 from datetime import datetime
+from typing import Optional, Union
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text, func
+from sqlalchemy import select, insert, update, delete, or_, func, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from db.models import Patient
-from db.database import encrypt_text, decrypt_text
+from db.database import get_async_db
+from bot.core.update_session import discard_update_session
+from db.models import Patient, PatientSearchToken
+from db.blind_index import blind_index_values, phone_blind_index, name_search_tokens, query_search_tokens
+from bot.services.patient_state_cache import PatientState, patient_state_cache
 
 logger = logging.getLogger(__name__)
 
-def get_patient_by_telegram_id(db: Session, telegram_id: int) -> Patient:
+# Поля ФИО, по которым строятся поисковые токены
+NAME_FIELDS = {'last_name', 'first_name', 'third_name'}
+
+# Поля, которые можно изменить через update_patient_profile
+PROFILE_FIELDS = set(Patient.__table__.columns.keys()) - {'id', 'telegram_id'}
+
+# Столбцы неконфиденциального состояния пациента (PatientState)
+STATE_COLUMNS = tuple(getattr(Patient, field) for field in PatientState._fields)
+
+async def get_patient_by_telegram_id(db: AsyncSession, telegram_id: int) -> Patient:
     """
     Получение пациента по Telegram ID.
     
@@ -28,14 +46,75 @@ def get_patient_by_telegram_id(db: Session, telegram_id: int) -> Patient:
         Patient: Объект пациента или None, если пациент не найден
     """
     try:
-        return db.query(Patient).filter(Patient.telegram_id == telegram_id).first()
+        # Запрос строится и получает ключ кеша скомпилированных запросов один раз,
+        # при следующих вызовах подставляется только параметр
+        patient = await db.scalar(lambda_stmt(lambda: select(Patient).where(Patient.telegram_id == telegram_id)))
+        patient_state_cache.update_from(patient)
+        return patient
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при получении пациента: {e}")
         return None
 
-def get_or_create_patient(db: Session, telegram_id: int, telegram_chat_id: int = None) -> Patient:
+async def get_patient_state(db: AsyncSession, telegram_id: int) -> PatientState:
+    """
+    Получение неконфиденциального состояния пациента для маршрутизации обновлений.
+    Значение берется из кеша, при промахе загружаются только нужные столбцы
+    (без зашифрованных полей).
+    
+    Args:
+        db: Сессия базы данных
+        telegram_id: ID пользователя в Telegram
+        
+    Returns:
+        PatientState: Состояние пациента или None, если пациент не найден
+    """
+    state = patient_state_cache.get(telegram_id)
+    if state is not None:
+        return state
+    
+    try:
+        row = (await db.execute(
+            lambda_stmt(lambda: select(*STATE_COLUMNS).where(Patient.telegram_id == telegram_id))
+        )).first()
+    except SQLAlchemyError as e:
+        logger.error(f"Ошибка при получении состояния пациента: {e}")
+        return None
+    
+    if row is None:
+        return None
+    state = PatientState(*row)
+    patient_state_cache.set(state)
+    return state
+
+def build_patient_upsert():
+    """
+    Построение запроса INSERT ... ON CONFLICT (telegram_id) DO UPDATE для пациентов.
+    Для существующего пациента обновляются только время последней активности
+    и ID чата (если он передан).
+    """
+    stmt = pg_insert(Patient)
+    return stmt.on_conflict_do_update(
+        index_elements=[Patient.telegram_id],
+        set_={
+            'telegram_chat_id': func.coalesce(stmt.excluded.telegram_chat_id, Patient.telegram_chat_id),
+            'last_activity': stmt.excluded.last_activity,
+        }
+    )
+
+def _new_patient_row(telegram_id: int, telegram_chat_id: int = None, now: datetime = None) -> dict:
+    now = now or datetime.utcnow()
+    return {
+        'telegram_id': telegram_id,
+        'telegram_chat_id': telegram_chat_id,
+        'created_at': now,
+        'last_activity': now,
+        'bot_state': "new",
+    }
+
+async def get_or_create_patient(db: AsyncSession, telegram_id: int, telegram_chat_id: int = None) -> Patient:
     """
-    Получение существующего пациента или создание нового.
+    Получение существующего пациента или создание нового одним запросом
+    INSERT ... ON CONFLICT ... RETURNING (без гонки между параллельными /start).
     
     Args:
         db: Сессия базы данных
@@ -45,86 +124,134 @@ def get_or_create_patient(db: Session, telegram_id: int, telegram_chat_id: int =
     Returns:
         Patient: Объект пациента
     """
-    patient = get_patient_by_telegram_id(db, telegram_id)
-    
-    if not patient:
-        # Создание нового пациента
-        now = datetime.utcnow()
-        patient = Patient(
-            telegram_id=telegram_id,
-            telegram_chat_id=telegram_chat_id,
-            created_at=now,
-            last_activity=now,
-            bot_state="new"
+    try:
+        patient = await db.scalar(
+            build_patient_upsert().values(**_new_patient_row(telegram_id, telegram_chat_id)).returning(Patient),
+            execution_options={'populate_existing': True}
         )
-        try:
-            db.add(patient)
-            db.commit()
-            db.refresh(patient)
-            logger.info(f"Создан новый пациент с telegram_id={telegram_id}")
-        except SQLAlchemyError as e:
-            db.rollback()
-            logger.error(f"Ошибка при создании пациента: {e}")
-            raise
+        patient_state_cache.update_from(patient)
+        return patient
+    except SQLAlchemyError as e:
+        await db.rollback()
+        discard_update_session()
+        logger.error(f"Ошибка при создании пациента: {e}")
+        raise
+
+async def upsert_patients(db: AsyncSession, telegram_ids: list, telegram_chat_ids: dict = None) -> list:
+    """
+    Массовое создание пациентов (или обновление времени активности существующих)
+    одним запросом INSERT ... ON CONFLICT ... RETURNING.
     
-    return patient
+    Args:
+        db: Сессия базы данных
+        telegram_ids: Список ID пользователей в Telegram
+        telegram_chat_ids: Словарь {telegram_id: ID чата} (опционально)
+        
+    Returns:
+        list: Список пациентов в порядке уникальных telegram_ids
+    """
+    telegram_chat_ids = telegram_chat_ids or {}
+    now = datetime.utcnow()
+    # Повторяющиеся telegram_id в одном запросе недопустимы для ON CONFLICT DO UPDATE
+    rows = [
+        _new_patient_row(telegram_id, telegram_chat_ids.get(telegram_id), now)
+        for telegram_id in dict.fromkeys(telegram_ids)
+    ]
+    if not rows:
+        return []
+    
+    try:
+        patients = (await db.scalars(
+            build_patient_upsert().returning(Patient, sort_by_parameter_order=True),
+            rows,
+            execution_options={'populate_existing': True}
+        )).all()
+        for patient in patients:
+            patient_state_cache.update_from(patient)
+        logger.info(f"Создано или обновлено пациентов: {len(patients)}")
+        return list(patients)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        discard_update_session()
+        logger.error(f"Ошибка при массовом создании пациентов: {e}")
+        return []
 
-def update_patient_profile(db: Session, telegram_id: int, **kwargs) -> Patient:
+async def update_patient_profile(db: AsyncSession, patient: Union[Patient, int], **kwargs) -> Patient:
     """
     Обновление профиля пациента с шифрованием конфиденциальных данных.
     
+    Все изменения (включая шифрование, слепые индексы и время последней активности)
+    выполняются одним запросом UPDATE ... RETURNING; уже загруженный объект пациента
+    в сессии обновляется значениями из RETURNING.
+    
     Args:
         db: Сессия базы данных
-        telegram_id: ID пользователя в Telegram
+        patient: Объект пациента или ID пользователя в Telegram
         **kwargs: Поля для обновления (phone_number, first_name, и т.д.)
         
     Returns:
-        Patient: Обновленный объект пациента
+        Patient: Обновленный объект пациента или None, если пациент не найден
     """
-    patient = get_patient_by_telegram_id(db, telegram_id)
+    telegram_id = patient.telegram_id if isinstance(patient, Patient) else patient
     
-    if not patient:
-        logger.error(f"Пациент с telegram_id={telegram_id} не найден")
-        return None
+    # Неизвестные поля игнорируются, как и раньше
+    values = {key: value for key, value in kwargs.items() if key in PROFILE_FIELDS}
+    # Конфиденциальные поля шифруются типом столбца в самом запросе
+    values.update(blind_index_values(values))
+    values['last_activity'] = datetime.utcnow()
     
     try:
-        # Шифруемые поля
-        encrypted_fields = ['phone_number', 'first_name', 'last_name', 'third_name', 'birth_date']
+        updated = await db.scalar(
+            update(Patient)
+            .where(Patient.telegram_id == telegram_id)
+            .values(**values)
+            .returning(Patient),
+            execution_options={'populate_existing': True}
+        )
         
-        # Обновление полей пациента
-        for key, value in kwargs.items():
-            if hasattr(patient, key):
-                if key in encrypted_fields and value is not None:
-                    # Шифрование конфиденциальных данных
-                    if key == 'birth_date' and isinstance(value, datetime):
-                        # Преобразование даты в строку для шифрования
-                        value_str = value.strftime("%Y-%m-%d")
-                        encrypted_value = db.execute(encrypt_text(value_str)).scalar()
-                    else:
-                        encrypted_value = db.execute(encrypt_text(str(value))).scalar()
-                    
-                    setattr(patient, key, encrypted_value)
-                else:
-                    setattr(patient, key, value)
+        if not updated:
+            patient_state_cache.invalidate(telegram_id)
+            logger.error(f"Пациент с telegram_id={telegram_id} не найден")
+            return None
         
-        # Обновление времени последней активности
-        patient.last_activity = datetime.utcnow()
+        if NAME_FIELDS.intersection(values):
+            await refresh_search_tokens(db, updated)
         
-        db.commit()
-        db.refresh(patient)
+        patient_state_cache.update_from(updated)
         logger.info(f"Обновлен профиль пациента с telegram_id={telegram_id}")
-        return patient
+        return updated
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
+        discard_update_session()
+        # Состояние в базе данных неизвестно, следующее чтение загрузит его заново
+        patient_state_cache.invalidate(telegram_id)
         logger.error(f"Ошибка при обновлении профиля пациента: {e}")
         return None
 
-def get_decrypted_patient_data(db: Session, patient: Patient) -> dict:
+async def refresh_search_tokens(db: AsyncSession, patient: Patient):
     """
-    Получение расшифрованных данных пациента.
+    Пересоздание поисковых токенов ФИО пациента (без фиксации транзакции).
     
     Args:
         db: Сессия базы данных
+        patient: Объект пациента с актуальными значениями ФИО
+    """
+    await db.execute(delete(PatientSearchToken).where(PatientSearchToken.patient_id == patient.id))
+    tokens = name_search_tokens(patient.last_name, patient.first_name, patient.third_name)
+    if tokens:
+        await db.execute(
+            insert(PatientSearchToken),
+            [{'token': token, 'patient_id': patient.id} for token in tokens]
+        )
+
+def get_decrypted_patient_data(db: Union[Session, AsyncSession], patient: Patient) -> dict:
+    """
+    Получение расшифрованных данных пациента.
+    Зашифрованные поля уже расшифрованы в SELECT, которым загружен пациент,
+    поэтому дополнительных запросов к базе данных не выполняется.
+    
+    Args:
+        db: Сессия базы данных, синхронная или асинхронная (оставлена для совместимости)
         patient: Объект пациента
         
     Returns:
@@ -149,88 +276,102 @@ def get_decrypted_patient_data(db: Session, patient: Patient) -> dict:
         'created_at': patient.created_at
     }
     
-    # Расшифровка конфиденциальных данных
-    if patient.phone_number:
-        result['phone_number'] = db.execute(decrypt_text(patient.phone_number)).scalar()
-    else:
-        result['phone_number'] = None
-        
-    if patient.first_name:
-        result['first_name'] = db.execute(decrypt_text(patient.first_name)).scalar()
-    else:
-        result['first_name'] = None
-        
-    if patient.last_name:
-        result['last_name'] = db.execute(decrypt_text(patient.last_name)).scalar()
-    else:
-        result['last_name'] = None
-        
-    if patient.third_name:
-        result['third_name'] = db.execute(decrypt_text(patient.third_name)).scalar()
-    else:
-        result['third_name'] = None
-        
-    if patient.birth_date:
-        birth_date_str = db.execute(decrypt_text(patient.birth_date)).scalar()
-        if birth_date_str:
-            try:
-                result['birth_date'] = datetime.strptime(birth_date_str, "%Y-%m-%d").date()
-            except ValueError:
-                result['birth_date'] = None
-        else:
-            result['birth_date'] = None
-    else:
-        result['birth_date'] = None
+    # Конфиденциальные данные расшифровываются в запросе загрузки пациента
+    result['phone_number'] = patient.phone_number
+    result['first_name'] = patient.first_name
+    result['last_name'] = patient.last_name
+    result['third_name'] = patient.third_name
+    result['birth_date'] = patient.birth_date
     
     return result
 
-def search_patients(db: Session, query: str, limit: int = 10) -> list:
+async def search_patients(db: Optional[AsyncSession], query: str, limit: int = 10) -> list:
     """
-    Поиск пациентов по имени, фамилии или номеру телефона.
+    Поиск пациентов по Telegram ID, номеру телефона или ФИО.
+    Поиск по телефону выполняется по точному совпадению через слепой индекс,
+    поиск по ФИО - по началу или части слов через поисковые токены.
     
     Args:
-        db: Сессия базы данных
+        db: Сессия базы данных (None - поиск в отдельной сессии на реплике)
         query: Строка поиска
         limit: Максимальное количество результатов
         
     Returns:
         list: Список пациентов, соответствующих запросу
     """
+    query = query.strip()
+    if not query:
+        return []
+    
+    if db is None:
+        async with get_async_db(read_only=True) as read_db:
+            return await search_patients(read_db, query, limit)
+    
     try:
-        # Поиск по telegram_id (если query - число)
-        if query.isdigit():
-            patients = db.query(Patient).filter(Patient.telegram_id == int(query)).limit(limit).all()
-            if patients:
-                return [get_decrypted_patient_data(db, patient) for patient in patients]
+        if not re.fullmatch(r'\+?[\d\s()-]+', query):
+            return await search_patients_by_name(db, query, limit)
         
-        # Поиск по зашифрованным полям сложнее, так как нельзя напрямую искать в зашифрованных данных
-        # Для этого нужно использовать специальные индексы или другие методы
-        # В данном случае, мы можем расшифровать все записи и фильтровать их в памяти
-        # Это не эффективно для больших баз данных, но работает для небольших наборов данных
+        # Поиск по Telegram ID или номеру телефона
+        phone_index = phone_blind_index(query)
+        if phone_index is None:
+            return []
+        conditions = [Patient.phone_number_bidx == phone_index]
+        if query.isdigit() and len(query) <= 18:
+            conditions.append(Patient.telegram_id == int(query))
         
-        all_patients = db.query(Patient).limit(100).all()  # Ограничиваем выборку для производительности
-        
-        results = []
-        for patient in all_patients:
-            decrypted_data = get_decrypted_patient_data(db, patient)
-            
-            # Проверяем, содержит ли какое-либо из полей строку запроса
-            if any(
-                field and query.lower() in str(field).lower()
-                for field in [
-                    decrypted_data.get('first_name'),
-                    decrypted_data.get('last_name'),
-                    decrypted_data.get('third_name'),
-                    decrypted_data.get('phone_number')
-                ]
-            ):
-                results.append(decrypted_data)
-                
-                if len(results) >= limit:
-                    break
-        
-        return results
+        patients = (await db.scalars(
+            select(Patient).where(or_(*conditions)).order_by(Patient.id).limit(limit)
+        )).all()
+        return [get_decrypted_patient_data(db, patient) for patient in patients]
     
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при поиске пациентов: {e}")
         return []
+
+async def search_patients_by_name(db: AsyncSession, query: str, limit: int = 10) -> list:
+    """
+    Поиск пациентов по началу или части фамилии, имени и отчества.
+    
+    Пациент попадает в результат, если каждое слово запроса является началом
+    одного из слов его ФИО, либо если в ФИО встречаются все триграммы запроса.
+    Результаты ранжируются по числу совпавших префиксов, затем триграмм.
+    
+    Args:
+        db: Сессия базы данных
+        query: Строка поиска
+        limit: Максимальное количество результатов
+        
+    Returns:
+        list: Список пациентов в порядке релевантности
+    """
+    prefix_tokens, ngram_tokens = query_search_tokens(query)
+    if not prefix_tokens:
+        return []
+    
+    token = PatientSearchToken.token
+    # Пара (token, patient_id) уникальна, поэтому количество строк равно количеству совпавших токенов
+    prefix_hits = func.count().filter(token.in_(prefix_tokens))
+    ngram_hits = func.count().filter(token.in_(ngram_tokens)) if ngram_tokens else None
+    
+    having = prefix_hits == len(prefix_tokens)
+    order_by = [prefix_hits.desc()]
+    if ngram_hits is not None:
+        having = or_(having, ngram_hits == len(ngram_tokens))
+        order_by.append(ngram_hits.desc())
+    
+    ranked_ids = (await db.scalars(
+        select(PatientSearchToken.patient_id)
+        .where(token.in_(prefix_tokens | ngram_tokens))
+        .group_by(PatientSearchToken.patient_id)
+        .having(having)
+        .order_by(*order_by, PatientSearchToken.patient_id)
+        .limit(limit)
+    )).all()
+    if not ranked_ids:
+        return []
+    
+    patients = {
+        patient.id: patient
+        for patient in await db.scalars(select(Patient).where(Patient.id.in_(ranked_ids)))
+    }
+    return [get_decrypted_patient_data(db, patients[patient_id]) for patient_id in ranked_ids if patient_id in patients]
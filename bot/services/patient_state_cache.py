@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Кеш состояния пациентов для маршрутизации обновлений.
+
+Хранит только неконфиденциальные поля (состояние бота, согласия, ID в МИС),
+которых обработчикам достаточно, чтобы выбрать ветку обработки без загрузки
+и расшифровки всей записи пациента. Кеш ограничен по размеру (LRU)
+и по времени жизни записи (TTL); пути записи обновляют его сразу.
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from config import PATIENT_STATE_CACHE_SIZE, PATIENT_STATE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class PatientState(NamedTuple):
+    """
+    Неконфиденциальное состояние пациента.
+    """
+    id: int
+    telegram_id: int
+    bot_state: Optional[str]
+    consent_notifications: Optional[bool]
+    consent_marketing: Optional[bool]
+    mis_id: Optional[int]
+    registered_in_bot: Optional[bool]
+
+    @classmethod
+    def from_patient(cls, patient) -> "PatientState":
+        return cls(*(getattr(patient, field) for field in cls._fields))
+
+
+class PatientStateCache:
+    """
+    LRU-кеш состояния пациентов с ограниченным временем жизни записей.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id: int) -> Optional[PatientState]:
+        """
+        Получение состояния пациента из кеша.
+
+        Args:
+            telegram_id: ID пользователя в Telegram
+
+        Returns:
+            PatientState: Состояние пациента или None, если записи нет или она устарела
+        """
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[telegram_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, state: PatientState):
+        """
+        Сохранение состояния пациента в кеше.
+
+        Args:
+            state: Состояние пациента
+        """
+        if self.maxsize <= 0:
+            return
+        self._entries[state.telegram_id] = (time.monotonic() + self.ttl, state)
+        self._entries.move_to_end(state.telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def update_from(self, patient):
+        """
+        Обновление кеша значениями загруженного или измененного пациента.
+
+        Args:
+            patient: Объект пациента (может быть None)
+        """
+        if patient is not None:
+            self.set(PatientState.from_patient(patient))
+
+    def invalidate(self, telegram_id: int):
+        """
+        Удаление состояния пациента из кеша.
+
+        Args:
+            telegram_id: ID пользователя в Telegram
+        """
+        self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Счетчики обращений к кешу.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+    def log_stats(self):
+        """
+        Запись счетчиков кеша в лог.
+        """
+        logger.info("Кеш состояния пациентов: " + ", ".join(f"{key}={value}" for key, value in self.stats().items()))
+
+
+# Общий кеш процесса бота
+patient_state_cache = PatientStateCache(PATIENT_STATE_CACHE_SIZE, PATIENT_STATE_CACHE_TTL)
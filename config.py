@@ -14,11 +14,42 @@ load_dotenv()
 
 # Telegram Bot
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Количество обновлений Telegram, обрабатываемых одновременно
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "16"))
+# Интервал записи накопленного времени последней активности пациентов в базу данных, секунды
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "30"))
+# Интервал записи накопленных сообщений пациентов в журнал и список входящих, секунды
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "2"))
+# Кеш состояния пациентов для маршрутизации обновлений: максимальный размер и время жизни записи, секунды
+PATIENT_STATE_CACHE_SIZE = int(os.getenv("PATIENT_STATE_CACHE_SIZE", "10000"))
+PATIENT_STATE_CACHE_TTL = float(os.getenv("PATIENT_STATE_CACHE_TTL", "300"))
 
 # Внешние API
 AMOCRM_API_KEY = os.getenv("AMOCRM_API_KEY")
 AMOCRM_DOMAIN = os.getenv("AMOCRM_DOMAIN")
 MIS_RENOVATIO_API_KEY = os.getenv("RENOVATIO_API_KEY")
+# Синхронизация истории визитов из МИС (scripts/sync_mis_visits.py): количество одновременных
+# запросов к МИС и количество дней до отметки синхронизации пациента, визиты за которые
+# запрашиваются повторно (изменения в МИС задним числом)
+MIS_SYNC_CONCURRENCY = int(os.getenv("MIS_SYNC_CONCURRENCY", "5"))
+MIS_SYNC_LOOKBACK_DAYS = int(os.getenv("MIS_SYNC_LOOKBACK_DAYS", "30"))
+# HTTP-клиент МИС (один на процесс): таймаут запроса, секунды; ограничения пула соединений;
+# время жизни неиспользуемого keep-alive соединения, секунды; HTTP/2 (требуется пакет h2: pip install httpx[http2])
+MIS_HTTP_TIMEOUT = float(os.getenv("MIS_HTTP_TIMEOUT", "10"))
+MIS_HTTP_MAX_CONNECTIONS = int(os.getenv("MIS_HTTP_MAX_CONNECTIONS", "20"))
+MIS_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("MIS_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+MIS_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MIS_HTTP_KEEPALIVE_EXPIRY", "30"))
+MIS_HTTP2 = os.getenv("MIS_HTTP2", "false").lower() in ("1", "true", "yes")
+# Повторы запросов к МИС: количество попыток, начальная и максимальная задержка экспоненциальной
+# паузы со случайным разбросом, секунды; таймаут одной попытки запросов чтения, секунды
+MIS_RETRY_ATTEMPTS = int(os.getenv("MIS_RETRY_ATTEMPTS", "3"))
+MIS_RETRY_BASE_DELAY = float(os.getenv("MIS_RETRY_BASE_DELAY", "0.5"))
+MIS_RETRY_MAX_DELAY = float(os.getenv("MIS_RETRY_MAX_DELAY", "4"))
+MIS_READ_TIMEOUT = float(os.getenv("MIS_READ_TIMEOUT", "5"))
+# Автоматический выключатель запросов к МИС: количество сбоев подряд до отключения
+# и время до пробного запроса, секунды
+MIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("MIS_BREAKER_FAILURE_THRESHOLD", "5"))
+MIS_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("MIS_BREAKER_RECOVERY_TIMEOUT", "30"))
 
 # База данных PostgreSQL
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -27,5 +58,55 @@ DB_NAME = os.getenv("DB_NAME", "medical_bot_db")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 
-# Ключ шифрования для pgcrypto
+# Реплика PostgreSQL только для чтения (если DB_REPLICA_HOST не задан, чтение выполняется на основной базе).
+# Для локальной проверки без docker достаточно второго экземпляра PostgreSQL с потоковой репликацией:
+#   pg_basebackup -h localhost -p 5432 -U postgres -D ./replica -R
+#   pg_ctl -D ./replica -o "-p 5433" start
+# и переменных DB_REPLICA_HOST=localhost, DB_REPLICA_PORT=5433
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", DB_PORT)
+DB_REPLICA_NAME = os.getenv("DB_REPLICA_NAME", DB_NAME)
+DB_REPLICA_USER = os.getenv("DB_REPLICA_USER", DB_USER)
+DB_REPLICA_PASSWORD = os.getenv("DB_REPLICA_PASSWORD", DB_PASSWORD)
+
+# Пул соединений (для каждого движка: синхронного и асинхронного)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Максимальное время ожидания свободного соединения, секунды
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Время жизни соединения до переподключения, секунды
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Таймауты выполнения запроса и ожидания блокировки на стороне PostgreSQL для соединений бота
+# (асинхронные движки), миллисекунды (0 - без ограничения). Скрипты обслуживания выполняются без таймаутов
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_LOCK_TIMEOUT_MS = int(os.getenv("DB_LOCK_TIMEOUT_MS", "5000"))
+# Порог медленного получения соединения из пула, миллисекунды
+DB_SLOW_CHECKOUT_MS = int(os.getenv("DB_SLOW_CHECKOUT_MS", "200"))
+# Интервал записи статистики пула и кешей в лог бота, секунды (0 - отключено)
+DB_POOL_STATS_INTERVAL = int(os.getenv("DB_POOL_STATS_INTERVAL", "300"))
+
+# Хранение webhook-событий: срок хранения помесячных секций и количество секций, создаваемых заранее
+# (секции журнала сообщений пациентов создаются заранее на тот же срок)
+WEBHOOK_EVENTS_RETENTION_MONTHS = int(os.getenv("WEBHOOK_EVENTS_RETENTION_MONTHS", "6"))
+WEBHOOK_EVENTS_PARTITIONS_AHEAD = int(os.getenv("WEBHOOK_EVENTS_PARTITIONS_AHEAD", "2"))
+
+# Ключ шифрования для pgcrypto (значения без версии ключа)
 PGP_KEY = os.getenv("PGP_KEY", "your_strong_encryption_key_here")
+# Версионированные ключи pgcrypto в формате "ID:ключ,ID:ключ" (ID 0-255) и ID активного ключа.
+# Если PGP_KEY_ID не задан, новые значения шифруются ключом PGP_KEY без версии.
+# Во время ротации (scripts/rotate_encryption_key.py) в PGP_KEYS указываются и старый, и новый ключи
+PGP_KEYS = os.getenv("PGP_KEYS", "")
+PGP_KEY_ID = int(os.getenv("PGP_KEY_ID")) if os.getenv("PGP_KEY_ID") else None
+
+# Ключ HMAC для слепых индексов зашифрованных полей (должен отличаться от ключей шифрования)
+BLIND_INDEX_KEY = os.getenv("BLIND_INDEX_KEY", "your_strong_blind_index_key_here")
+
+# Бэкенд шифрования конфиденциальных полей: "pgcrypto" или "aesgcm"
+ENCRYPTION_BACKEND = os.getenv("ENCRYPTION_BACKEND", "pgcrypto")
+
+# Ключ AES-256-GCM (32 байта в base64) и ID активного ключа для бэкенда aesgcm.
+# Дополнительные ключи для расшифровки во время ротации: AES_KEYS="ID:ключ в base64,..."
+AES_KEY = os.getenv("AES_KEY")
+AES_KEY_ID = int(os.getenv("AES_KEY_ID", "1"))
+AES_KEYS = os.getenv("AES_KEYS", "")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Слепые индексы (blind index) для поиска по зашифрованным полям.
+
+Для нормализованного значения вычисляется HMAC-SHA256 с отдельным ключом.
+Хеш хранится рядом с зашифрованным значением и индексируется B-tree,
+что позволяет искать по точному совпадению без расшифровки записей.
+
+Для частичного поиска по ФИО в отдельной таблице хранятся HMAC префиксов
+и триграмм слов (поисковые токены).
+"""
+
+import hmac
+import hashlib
+import re
+from typing import Optional, Set, Tuple
+
+from config import BLIND_INDEX_KEY
+
+
+def normalize_phone(value) -> Optional[str]:
+    """
+    Нормализация номера телефона: только цифры, российские номера приводятся к виду 7XXXXXXXXXX.
+    """
+    if value is None:
+        return None
+    digits = re.sub(r'\D', '', str(value))
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits or None
+
+
+def normalize_name(value) -> Optional[str]:
+    """
+    Нормализация имени: нижний регистр, «ё» заменяется на «е», лишние пробелы удаляются.
+    """
+    if value is None:
+        return None
+    normalized = ' '.join(str(value).lower().replace('ё', 'е').split())
+    return normalized or None
+
+
+def compute_blind_index(kind: str, normalized: Optional[str]) -> Optional[bytes]:
+    """
+    Вычисление слепого индекса для нормализованного значения.
+
+    Args:
+        kind: Тип значения ("phone" или "name"), используется для разделения доменов
+        normalized: Нормализованное значение
+
+    Returns:
+        bytes: HMAC-SHA256 или None для пустого значения
+    """
+    if not normalized:
+        return None
+    message = f"{kind}:{normalized}".encode('utf-8')
+    return hmac.new(BLIND_INDEX_KEY.encode('utf-8'), message, hashlib.sha256).digest()
+
+
+def phone_blind_index(value) -> Optional[bytes]:
+    """
+    Слепой индекс номера телефона.
+    """
+    return compute_blind_index("phone", normalize_phone(value))
+
+
+def name_blind_index(value) -> Optional[bytes]:
+    """
+    Слепой индекс имени, фамилии или отчества.
+    """
+    return compute_blind_index("name", normalize_name(value))
+
+
+# Соответствие зашифрованных полей пациента столбцам слепых индексов
+BLIND_INDEX_COLUMNS = {
+    'phone_number': ('phone_number_bidx', phone_blind_index),
+    'first_name': ('first_name_bidx', name_blind_index),
+    'last_name': ('last_name_bidx', name_blind_index),
+    'third_name': ('third_name_bidx', name_blind_index),
+}
+
+
+def blind_index_values(values: dict) -> dict:
+    """
+    Вычисление слепых индексов для обновляемых полей пациента.
+
+    Args:
+        values: Словарь обновляемых полей (открытые значения)
+
+    Returns:
+        dict: Значения столбцов слепых индексов для переданных полей
+    """
+    return {
+        column: compute(values[field])
+        for field, (column, compute) in BLIND_INDEX_COLUMNS.items()
+        if field in values
+    }
+
+
+# Параметры поисковых токенов ФИО
+SEARCH_PREFIX_MIN = 2
+SEARCH_PREFIX_MAX = 12
+SEARCH_NGRAM_SIZE = 3
+SEARCH_TOKEN_SIZE = 16
+
+
+def _search_token(kind: str, value: str) -> bytes:
+    """
+    HMAC поискового токена, усеченный до SEARCH_TOKEN_SIZE байт.
+    """
+    return compute_blind_index(kind, value)[:SEARCH_TOKEN_SIZE]
+
+
+def _word_ngrams(word: str) -> Set[str]:
+    return {word[i:i + SEARCH_NGRAM_SIZE] for i in range(len(word) - SEARCH_NGRAM_SIZE + 1)}
+
+
+def name_search_tokens(*values) -> Set[bytes]:
+    """
+    Поисковые токены для значений ФИО: префиксы и триграммы каждого слова.
+
+    Args:
+        *values: Фамилия, имя, отчество (открытые значения, допускается None)
+
+    Returns:
+        Set[bytes]: Множество токенов
+    """
+    tokens = set()
+    for value in values:
+        normalized = normalize_name(value)
+        if not normalized:
+            continue
+        for word in normalized.replace('-', ' ').split():
+            for length in range(SEARCH_PREFIX_MIN, min(len(word), SEARCH_PREFIX_MAX) + 1):
+                tokens.add(_search_token("prefix", word[:length]))
+            for ngram in _word_ngrams(word):
+                tokens.add(_search_token("ngram", ngram))
+    return tokens
+
+
+def query_search_tokens(query: str) -> Tuple[Set[bytes], Set[bytes]]:
+    """
+    Поисковые токены для строки запроса.
+
+    Args:
+        query: Строка поиска (начало или часть ФИО)
+
+    Returns:
+        Tuple: токены префиксов слов и токены триграмм
+    """
+    normalized = normalize_name(query)
+    if not normalized:
+        return set(), set()
+
+    words = [word for word in normalized.replace('-', ' ').split() if len(word) >= SEARCH_PREFIX_MIN]
+    prefix_tokens = {_search_token("prefix", word[:SEARCH_PREFIX_MAX]) for word in words}
+    ngram_tokens = set()
+    for word in words:
+        ngram_tokens.update(_search_token("ngram", ngram) for ngram in _word_ngrams(word))
+    return prefix_tokens, ngram_tokens
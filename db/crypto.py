@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Слой шифрования конфиденциальных данных.
+
+Поддерживаются два бэкенда:
+    pgcrypto - шифрование на стороне PostgreSQL (pgp_sym_encrypt/pgp_sym_decrypt);
+    aesgcm   - шифрование AES-256-GCM в процессе приложения.
+
+Активный бэкенд выбирается переменной окружения ENCRYPTION_BACKEND.
+
+Каждое значение хранит ID ключа, которым оно зашифровано, поэтому во время
+ротации ключа расшифровываются значения, зашифрованные и старым, и новым ключом,
+а новые значения шифруются активным ключом (scripts/rotate_encryption_key.py).
+"""
+
+import base64
+import logging
+import os
+from typing import Optional
+from sqlalchemy import func, type_coerce, case, and_, literal, LargeBinary
+
+from config import PGP_KEY, PGP_KEYS, PGP_KEY_ID, ENCRYPTION_BACKEND, AES_KEY, AES_KEY_ID, AES_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Заголовок значений формата AES-GCM: маркер, версия формата и ID ключа.
+# Байт 0xFF не встречается в UTF-8, поэтому значение с таким заголовком нельзя
+# спутать с открытым текстом, а также с сообщением pgcrypto
+AESGCM_MARKER = b"\xff"
+AESGCM_FORMAT_VERSION = 1
+AESGCM_HEADER_SIZE = 3
+AESGCM_NONCE_SIZE = 12
+
+# Заголовок значений pgcrypto с версией ключа: маркер и ID ключа, затем сообщение PGP.
+# Сообщение pgp_sym_encrypt начинается с пакета сеансового ключа (байт 0xC3),
+# поэтому значения без версии ключа (PGP_KEY) отличаются по первому байту
+PGP_VERSIONED_MARKER = b"\xfe"
+PGP_HEADER_SIZE = 2
+
+
+class CipherError(Exception):
+    """
+    Ошибка шифрования или расшифровки данных.
+    """
+
+
+def parse_keyring(value: str) -> dict:
+    """
+    Разбор списка ключей в формате "ID:ключ,ID:ключ".
+
+    Args:
+        value: Строка со списком ключей
+
+    Returns:
+        dict: Словарь {ID ключа: ключ}
+    """
+    keys = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        key_id, separator, key = item.partition(":")
+        if not separator or not key_id.strip().isdigit() or not key:
+            raise CipherError("Ключи должны быть заданы в формате ID:ключ")
+        key_id = int(key_id)
+        if not 0 <= key_id <= 255:
+            raise CipherError("ID ключа должен быть в диапазоне 0-255")
+        keys[key_id] = key
+    return keys
+
+
+class PgcryptoCipher:
+    """
+    Шифрование средствами расширения pgcrypto внутри SQL-запросов.
+    """
+    name = "pgcrypto"
+    in_process = False
+
+    def __init__(self, key: str, keys: dict = None, key_id: Optional[int] = None):
+        """
+        Args:
+            key: Ключ значений без версии (PGP_KEY)
+            keys: Версионированные ключи {ID ключа: ключ}
+            key_id: ID активного ключа (None - шифрование ключом key без версии)
+        """
+        self.key = key
+        self.keys = dict(keys or {})
+        self.key_id = key_id
+        if key_id is not None and key_id not in self.keys:
+            raise CipherError(f"Активный ключ pgcrypto {key_id} отсутствует в списке ключей")
+
+    @property
+    def header(self) -> Optional[bytes]:
+        """
+        Заголовок новых значений (None для значений без версии ключа).
+        """
+        return PGP_VERSIONED_MARKER + bytes([self.key_id]) if self.key_id is not None else None
+
+    @property
+    def active_key(self) -> str:
+        return self.keys[self.key_id] if self.key_id is not None else self.key
+
+    def encrypt_expression(self, value):
+        """
+        SQL-выражение шифрования значения активным ключом.
+        """
+        encrypted = func.pgp_sym_encrypt(value, self.active_key)
+        if self.key_id is None:
+            return encrypted
+        return literal(self.header, LargeBinary).op("||", return_type=LargeBinary)(encrypted)
+
+    def decrypt_expression(self, column):
+        """
+        SQL-выражение расшифровки значения ключом, ID которого записан в значении.
+        """
+        legacy = func.pgp_sym_decrypt(column, self.key)
+        if not self.keys:
+            return legacy
+
+        versioned = func.get_byte(column, 0) == PGP_VERSIONED_MARKER[0]
+        return case(
+            *[
+                (and_(versioned, func.get_byte(column, 1) == key_id),
+                 func.pgp_sym_decrypt(func.substr(column, PGP_HEADER_SIZE + 1), key))
+                for key_id, key in sorted(self.keys.items())
+            ],
+            else_=legacy
+        )
+
+    def is_current_expression(self, column):
+        """
+        SQL-условие: значение зашифровано активным ключом этого бэкенда.
+        """
+        if self.key_id is None:
+            return func.get_byte(column, 0).notin_([PGP_VERSIONED_MARKER[0], AESGCM_MARKER[0]])
+        return and_(
+            func.get_byte(column, 0) == PGP_VERSIONED_MARKER[0],
+            func.get_byte(column, 1) == self.key_id
+        )
+
+    def bind_expression(self, bindvalue, plain_type):
+        """
+        SQL-выражение для записи значения в зашифрованный столбец.
+        """
+        # Приводим параметр к строковому типу, чтобы драйвер не оборачивал его в bytea
+        return self.encrypt_expression(type_coerce(bindvalue, plain_type))
+
+    def column_expression(self, column, plain_type):
+        """
+        SQL-выражение для чтения зашифрованного столбца в открытом виде.
+        """
+        return type_coerce(self.decrypt_expression(column), plain_type)
+
+    def encrypt(self, plaintext: str) -> bytes:
+        raise CipherError("Бэкенд pgcrypto шифрует данные только в SQL-запросах")
+
+    def decrypt(self, data: bytes) -> str:
+        raise CipherError("Бэкенд pgcrypto расшифровывает данные только в SQL-запросах")
+
+
+class AesGcmCipher:
+    """
+    Аутентифицированное шифрование AES-256-GCM в процессе приложения.
+
+    Формат значения: 0xFF | версия формата | ID ключа | nonce (12 байт) | шифротекст с тегом.
+    Значения, зашифрованные pgcrypto, на время перехода расшифровываются в SQL
+    и приходят в приложение открытым текстом в кодировке UTF-8.
+    """
+    name = "aesgcm"
+    in_process = True
+
+    def __init__(self, keys: dict, key_id: int, legacy: PgcryptoCipher = None):
+        """
+        Args:
+            keys: Ключи {ID ключа: 32 байта}; все используются для расшифровки
+            key_id: ID активного ключа, которым шифруются новые значения
+            legacy: Шифрование pgcrypto для расшифровки значений старого формата
+        """
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if key_id not in keys:
+            raise CipherError(f"Активный ключ AES-GCM {key_id} отсутствует в списке ключей")
+        self.ciphers = {}
+        for keyring_id, key in keys.items():
+            if len(key) != 32:
+                raise CipherError("Ключ AES-GCM должен быть длиной 32 байта")
+            if not 0 <= keyring_id <= 255:
+                raise CipherError("ID ключа AES-GCM должен быть в диапазоне 0-255")
+            self.ciphers[keyring_id] = AESGCM(key)
+
+        self.key_id = key_id
+        self.legacy = legacy
+
+    def bind_expression(self, bindvalue, plain_type):
+        # Значение шифруется в bind_processor, в SQL передается готовый bytea
+        return bindvalue
+
+    def column_expression(self, column, plain_type):
+        if self.legacy is None:
+            return column
+
+        # Значения старого формата (pgcrypto) расшифровываем на стороне базы данных
+        return case(
+            (func.get_byte(column, 0) == AESGCM_MARKER[0], column),
+            else_=type_coerce(
+                func.convert_to(self.legacy.decrypt_expression(column), "UTF8"),
+                LargeBinary
+            )
+        )
+
+    def is_current_expression(self, column):
+        """
+        SQL-условие: значение зашифровано активным ключом этого бэкенда.
+        """
+        return and_(
+            func.get_byte(column, 0) == AESGCM_MARKER[0],
+            func.get_byte(column, 2) == self.key_id
+        )
+
+    def encrypt(self, plaintext: str) -> bytes:
+        """
+        Шифрование строки активным ключом.
+
+        Args:
+            plaintext: Открытый текст
+
+        Returns:
+            bytes: Зашифрованное значение с заголовком формата
+        """
+        header = AESGCM_MARKER + bytes([AESGCM_FORMAT_VERSION, self.key_id])
+        nonce = os.urandom(AESGCM_NONCE_SIZE)
+        return header + nonce + self.ciphers[self.key_id].encrypt(nonce, plaintext.encode("utf-8"), header)
+
+    def decrypt(self, data: bytes) -> str:
+        """
+        Расшифровка значения ключом, ID которого записан в заголовке.
+
+        Args:
+            data: Зашифрованное значение (или открытый текст старого формата)
+
+        Returns:
+            str: Открытый текст
+        """
+        from cryptography.exceptions import InvalidTag
+
+        data = bytes(data)
+        if not is_aesgcm_value(data):
+            # Значение старого формата, уже расшифрованное в column_expression
+            return data.decode("utf-8")
+
+        header = data[:AESGCM_HEADER_SIZE]
+        cipher = self.ciphers.get(header[2])
+        if header[1] != AESGCM_FORMAT_VERSION or cipher is None:
+            raise CipherError(f"Неизвестная версия формата или ID ключа: {header[1]}/{header[2]}")
+
+        nonce = data[AESGCM_HEADER_SIZE:AESGCM_HEADER_SIZE + AESGCM_NONCE_SIZE]
+        try:
+            plaintext = cipher.decrypt(nonce, data[AESGCM_HEADER_SIZE + AESGCM_NONCE_SIZE:], header)
+        except InvalidTag:
+            raise CipherError("Не удалось проверить целостность зашифрованного значения")
+        return plaintext.decode("utf-8")
+
+
+def needs_rotation_expression(cipher, column):
+    """
+    SQL-условие: значение столбца задано и зашифровано не активным ключом.
+
+    Args:
+        cipher: Объект шифрования
+        column: Столбец таблицы (без column_expression)
+    """
+    return and_(column.isnot(None), ~cipher.is_current_expression(column))
+
+
+def is_aesgcm_value(data: bytes) -> bool:
+    """
+    Проверка, что значение зашифровано в формате AES-GCM.
+    """
+    return bool(data) and data[:1] == AESGCM_MARKER
+
+
+def create_cipher(backend: str = ENCRYPTION_BACKEND):
+    """
+    Создание объекта шифрования для указанного бэкенда.
+
+    Args:
+        backend: Название бэкенда ("pgcrypto" или "aesgcm")
+
+    Returns:
+        Объект шифрования
+    """
+    pgcrypto = PgcryptoCipher(PGP_KEY, parse_keyring(PGP_KEYS), PGP_KEY_ID)
+    if backend == "pgcrypto":
+        return pgcrypto
+    if backend == "aesgcm":
+        keys = {key_id: base64.b64decode(key) for key_id, key in parse_keyring(AES_KEYS).items()}
+        if AES_KEY:
+            keys[AES_KEY_ID] = base64.b64decode(AES_KEY)
+        if not keys:
+            raise CipherError("Для бэкенда aesgcm необходимо задать переменную окружения AES_KEY")
+        return AesGcmCipher(keys, AES_KEY_ID, legacy=pgcrypto)
+    raise CipherError(f"Неизвестный бэкенд шифрования: {backend}")
+
+
+_cipher = None
+
+def get_cipher():
+    """
+    Получение активного объекта шифрования (создается один раз на процесс).
+    """
+    global _cipher
+    if _cipher is None:
+        _cipher = create_cipher()
+        logger.info(f"Используется бэкенд шифрования: {_cipher.name}")
+    return _cipher
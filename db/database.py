@@ -3,15 +3,32 @@
 
 """
 Модуль для работы с базой данных PostgreSQL.
+
+Запись и чтение, которое должно видеть собственные только что записанные
+изменения (обработчики бота), выполняются на основной базе (SessionLocal,
+AsyncSessionLocal). Явно читающие задачи - просмотр и поиск пациентов,
+выборка пациентов для напоминаний - используют фабрики ReadOnlySessionLocal
+и AsyncReadOnlySessionLocal, которые направляют запросы на реплику
+(DB_REPLICA_HOST). Данные реплики могут отставать от основной базы.
 """
 
 import logging
 import urllib.parse
-from sqlalchemy import create_engine, text
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, text, select, literal, type_coerce, LargeBinary, String
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, PGP_KEY
+from config import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+    DB_REPLICA_HOST, DB_REPLICA_PORT, DB_REPLICA_NAME, DB_REPLICA_USER, DB_REPLICA_PASSWORD,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS, WEBHOOK_EVENTS_PARTITIONS_AHEAD
+)
+from db.crypto import get_cipher, is_aesgcm_value
+from db.pool_stats import instrumented_pool
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -22,19 +39,93 @@ Base = declarative_base()
 # Безопасное формирование строки подключения с экранированием специальных символов
 password = urllib.parse.quote_plus(DB_PASSWORD)
 DATABASE_URL = f"postgresql://{DB_USER}:{password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Общие настройки пула соединений
+POOL_OPTIONS = {
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_pre_ping': DB_POOL_PRE_PING,
+}
+
+# Таймауты, устанавливаемые для каждого соединения асинхронных движков бота на стороне PostgreSQL.
+# Синхронные движки используются скриптами обслуживания (DDL, пакетная обработка, перешифрование),
+# запросы которых могут выполняться дольше, поэтому таймауты для них не устанавливаются:
+# прерванный по таймауту CREATE INDEX CONCURRENTLY оставил бы недействительный индекс
+SERVER_SETTINGS = {
+    'statement_timeout': str(DB_STATEMENT_TIMEOUT_MS),
+    'lock_timeout': str(DB_LOCK_TIMEOUT_MS),
+}
 
 # Создание движка SQLAlchemy с явным указанием кодировки
 engine = create_engine(
     DATABASE_URL,
     client_encoding='utf8',
+    poolclass=instrumented_pool(QueuePool, "sync"),
     connect_args={
         'client_encoding': 'utf8'
-    }
+    },
+    **POOL_OPTIONS
 )
 
 # Создание фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок (asyncpg) для обработчиков бота, чтобы запросы к базе данных
+# не блокировали цикл событий
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=instrumented_pool(AsyncAdaptedQueuePool, "async"),
+    connect_args={
+        'server_settings': SERVER_SETTINGS
+    },
+    **POOL_OPTIONS
+)
+
+# Фабрика асинхронных сессий. Объекты не истекают после commit, так как
+# ленивая подгрузка атрибутов в асинхронном режиме недоступна
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Движки реплики. Соединения открываются в режиме только для чтения, чтобы
+# ошибочно направленная на реплику запись сразу завершалась ошибкой
+if DB_REPLICA_HOST:
+    replica_password = urllib.parse.quote_plus(DB_REPLICA_PASSWORD)
+    REPLICA_DATABASE_URL = (f"postgresql://{DB_REPLICA_USER}:{replica_password}@"
+                            f"{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_REPLICA_NAME}")
+    ASYNC_REPLICA_DATABASE_URL = (f"postgresql+asyncpg://{DB_REPLICA_USER}:{replica_password}@"
+                                  f"{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_REPLICA_NAME}")
+    REPLICA_SERVER_SETTINGS = dict(SERVER_SETTINGS, default_transaction_read_only='on')
+    REPLICA_SYNC_SERVER_SETTINGS = {'default_transaction_read_only': 'on'}
+
+    replica_engine = create_engine(
+        REPLICA_DATABASE_URL,
+        client_encoding='utf8',
+        poolclass=instrumented_pool(QueuePool, "sync_replica"),
+        connect_args={
+            'client_encoding': 'utf8',
+            'options': " ".join(f"-c {name}={value}" for name, value in REPLICA_SYNC_SERVER_SETTINGS.items())
+        },
+        **POOL_OPTIONS
+    )
+    async_replica_engine = create_async_engine(
+        ASYNC_REPLICA_DATABASE_URL,
+        poolclass=instrumented_pool(AsyncAdaptedQueuePool, "async_replica"),
+        connect_args={
+            'server_settings': REPLICA_SERVER_SETTINGS
+        },
+        **POOL_OPTIONS
+    )
+else:
+    # Реплика не настроена: чтение выполняется на основной базе
+    replica_engine = engine
+    async_replica_engine = async_engine
+
+# Фабрики сессий только для чтения
+ReadOnlySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+AsyncReadOnlySessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     """
     Функция-генератор для получения сессии базы данных.
@@ -46,6 +137,22 @@ def get_db():
     finally:
         db.close()
 
+@asynccontextmanager
+async def get_async_db(read_only: bool = False):
+    """
+    Асинхронный контекстный менеджер для получения сессии базы данных.
+    Гарантирует закрытие сессии после использования.
+    
+    Args:
+        read_only: Сессия только для чтения на реплике (данные могут отставать
+            от основной базы, поэтому не подходит для чтения после собственной записи)
+    """
+    db: AsyncSession = AsyncReadOnlySessionLocal() if read_only else AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
 def init_db():
     """
     Инициализация базы данных.
@@ -60,11 +167,17 @@ def init_db():
         conn.commit()
         
         # Импорт моделей для создания таблиц
-        from db.models import Patient, Service, Notification, WebhookEvent, Conversation
+        from db.models import Patient, Service, Notification, WebhookEvent, Conversation, PatientMessage
         
         # Создание таблиц
         Base.metadata.create_all(bind=engine)
         
+        # Создание помесячных секций webhook_events и patient_messages на ближайшие месяцы
+        from db.partitions import ensure_month_partitions, PARTITIONED_TABLES
+        with engine.begin() as partitions_conn:
+            for table in PARTITIONED_TABLES:
+                ensure_month_partitions(partitions_conn, table, WEBHOOK_EVENTS_PARTITIONS_AHEAD)
+        
         logger.info("База данных успешно инициализирована")
         conn.close()
     except Exception as e:
@@ -73,7 +186,9 @@ def init_db():
 
 def encrypt_text(text_value):
     """
-    Функция для шифрования текстовых данных с помощью pgcrypto.
+    Функция для шифрования текстовых данных активным бэкендом шифрования.
+    Столбцы моделей шифруются типом EncryptedText (db/types.py), функция
+    оставлена для совместимости со старым кодом.
     
     Args:
         text_value: Текст для шифрования
@@ -83,11 +198,17 @@ def encrypt_text(text_value):
     """
     if text_value is None:
         return None
-    return text(f"pgp_sym_encrypt(:text_value, :key)").bindparams(text_value=text_value, key=PGP_KEY)
+    cipher = get_cipher()
+    if cipher.in_process:
+        return select(literal(cipher.encrypt(str(text_value)), LargeBinary))
+    # Шифрование активным ключом pgcrypto с записью его ID в значение
+    return select(cipher.encrypt_expression(literal(str(text_value), String)))
 
 def decrypt_text(encrypted_value):
     """
-    Функция для расшифровки данных с помощью pgcrypto.
+    Функция для расшифровки данных активным бэкендом шифрования.
+    Столбцы моделей расшифровываются типом EncryptedText (db/types.py), функция
+    оставлена для совместимости со старым кодом.
     
     Args:
         encrypted_value: Зашифрованное значение
@@ -97,4 +218,9 @@ def decrypt_text(encrypted_value):
     """
     if encrypted_value is None:
         return None
-    return text(f"pgp_sym_decrypt(:encrypted_value::bytea, :key)").bindparams(encrypted_value=encrypted_value, key=PGP_KEY)
+    cipher = get_cipher()
+    if cipher.in_process and is_aesgcm_value(bytes(encrypted_value)):
+        return select(literal(cipher.decrypt(encrypted_value), String))
+    # Значения pgcrypto расшифровываются ключом, ID которого записан в значении
+    pgcrypto = cipher.legacy if cipher.in_process else cipher
+    return select(type_coerce(pgcrypto.decrypt_expression(literal(bytes(encrypted_value), LargeBinary)), String))
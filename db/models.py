@@ -6,18 +6,27 @@
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, ForeignKey, JSON, Text, LargeBinary
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, ForeignKey, LargeBinary, Index, text, event, DDL
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
 from db.database import Base
+from db.types import EncryptedText, EncryptedDate
 
 class Patient(Base):
     """
     Модель пациента в системе с шифрованием конфиденциальных данных.
     """
     __tablename__ = "patients"
+    __table_args__ = (
+        # Пациенты для рассылки напоминаний (scripts/send_notifications.py)
+        Index(
+            "ix_patients_notifiable", "id",
+            postgresql_where=text("consent_notifications AND mis_id IS NOT NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False)
@@ -25,12 +34,18 @@ class Patient(Base):
     amocrm_id = Column(Integer, nullable=True)
     mis_id = Column(Integer, nullable=True)
     
-    # Шифруемые поля (хранятся как BYTEA)
-    phone_number = Column(LargeBinary, nullable=True)
-    first_name = Column(LargeBinary, nullable=True)
-    last_name = Column(LargeBinary, nullable=True)
-    third_name = Column(LargeBinary, nullable=True)
-    birth_date = Column(LargeBinary, nullable=True)
+    # Шифруемые поля (хранятся как BYTEA, расшифровываются в том же SELECT)
+    phone_number = Column(EncryptedText, nullable=True)
+    first_name = Column(EncryptedText, nullable=True)
+    last_name = Column(EncryptedText, nullable=True)
+    third_name = Column(EncryptedText, nullable=True)
+    birth_date = Column(EncryptedDate, nullable=True)
+    
+    # Слепые индексы (HMAC нормализованных значений) для поиска по зашифрованным полям
+    phone_number_bidx = Column(LargeBinary, nullable=True, index=True)
+    first_name_bidx = Column(LargeBinary, nullable=True, index=True)
+    last_name_bidx = Column(LargeBinary, nullable=True, index=True)
+    third_name_bidx = Column(LargeBinary, nullable=True, index=True)
     
     # Нешифруемые поля
     consent_notifications = Column(Boolean, default=False)
@@ -41,28 +56,50 @@ class Patient(Base):
     last_activity = Column(DateTime, nullable=False, default=datetime.utcnow)
     initial_message_sent = Column(Boolean, default=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Дата, до которой синхронизированы визиты из МИС (scripts/sync_mis_visits.py)
+    visits_synced_until = Column(Date, nullable=True)
 
     # Отношения
     services = relationship("Service", back_populates="patient", cascade="all, delete-orphan")
     notifications = relationship("Notification", back_populates="patient", cascade="all, delete-orphan")
     conversations = relationship("Conversation", back_populates="patient", cascade="all, delete-orphan")
+    search_tokens = relationship("PatientSearchToken", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Patient(id={self.id}, telegram_id={self.telegram_id})>"
 
 
+class PatientSearchToken(Base):
+    """
+    Поисковый токен ФИО пациента (HMAC префикса или триграммы слова).
+    """
+    __tablename__ = "patient_search_tokens"
+
+    token = Column(LargeBinary, primary_key=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f"<PatientSearchToken(patient_id={self.patient_id})>"
+
+
 class Service(Base):
     """
     Модель услуги/посещения пациента.
     """
     __tablename__ = "services"
+    __table_args__ = (
+        # Ключ для INSERT ... ON CONFLICT при синхронизации визитов из внешней системы
+        Index("ux_services_patient_source_external_id", "patient_id", "source", "external_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
     date = Column(Date, nullable=False)
     service_name = Column(String(255), nullable=False)
     doctor_name = Column(String(255), nullable=True)
     source = Column(String(50), nullable=False, default="mis")
+    # ID визита в системе-источнике
+    external_id = Column(BigInteger, nullable=True)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Отношение с моделью Patient
@@ -77,6 +114,13 @@ class Notification(Base):
     Модель уведомления о приеме.
     """
     __tablename__ = "notifications"
+    __table_args__ = (
+        # Поиск уведомления при ответе на кнопки подтверждения/отмены визита
+        Index("ix_notifications_appointment_telegram", "appointment_id", "telegram_id"),
+        # Ожидающие ответа уведомления пациента; также покрывает внешний ключ patient_id
+        Index("ix_notifications_patient_status", "patient_id", "status"),
+        Index("ix_notifications_status", "status"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False)
@@ -98,27 +142,53 @@ class Notification(Base):
 class WebhookEvent(Base):
     """
     Модель для логирования входящих событий от внешних систем.
+    Таблица секционирована по месяцам по received_at (секции создаются и удаляются
+    функциями db/partitions.py).
     """
     __tablename__ = "webhook_events"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    __table_args__ = (
+        Index("ix_webhook_events_received_at", "received_at"),
+        Index("ix_webhook_events_event_type_received_at", "event_type", "received_at"),
+        Index(
+            "ix_webhook_events_payload", "payload",
+            postgresql_using="gin", postgresql_ops={"payload": "jsonb_path_ops"}
+        ),
+        {'postgresql_partition_by': 'RANGE (received_at)'},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
     event_type = Column(String(100), nullable=False)
-    payload = Column(JSON, nullable=True)
-    received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    payload = Column(JSONB, nullable=True)
+    # Ключ секционирования обязан входить в первичный ключ
+    received_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
 
     def __repr__(self):
         return f"<WebhookEvent(id={self.id}, event_type={self.event_type}, received_at={self.received_at})>"
 
 
+# Секция по умолчанию принимает события, для месяца которых еще не создана секция
+event.listen(
+    WebhookEvent.__table__, "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS webhook_events_default PARTITION OF webhook_events DEFAULT")
+)
+
+
 class Conversation(Base):
     """
     Модель для кеширования информации о чатах.
+    Одна запись на пациента; last_message и unread_count обновляются вместе
+    с записью сообщений в журнал (bot/services/conversation_service.py),
+    поэтому список входящих не требует подсчета сообщений.
     """
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Список входящих: последние чаты сверху
+        Index("ix_conversations_last_timestamp", "last_timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False)
-    last_message = Column(Text, nullable=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True, unique=True)
+    last_message = Column(EncryptedText, nullable=True)
     last_timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
     unread_count = Column(Integer, nullable=False, default=0)
 
@@ -127,3 +197,34 @@ class Conversation(Base):
 
     def __repr__(self):
         return f"<Conversation(id={self.id}, patient_id={self.patient_id}, unread_count={self.unread_count})>"
+
+
+class PatientMessage(Base):
+    """
+    Входящее сообщение пациента. Журнал только для добавления: записи не изменяются.
+    Таблица секционирована по месяцам по created_at (секции создаются
+    функциями db/partitions.py).
+    """
+    __tablename__ = "patient_messages"
+    __table_args__ = (
+        # Переписка с пациентом по времени; также покрывает внешний ключ patient_id
+        Index("ix_patient_messages_patient_created_at", "patient_id", "created_at"),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False)
+    telegram_message_id = Column(BigInteger, nullable=False)
+    text = Column(EncryptedText, nullable=False)
+    # Ключ секционирования обязан входить в первичный ключ
+    created_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PatientMessage(id={self.id}, patient_id={self.patient_id}, created_at={self.created_at})>"
+
+
+# Секция по умолчанию принимает сообщения, для месяца которых еще не создана секция
+event.listen(
+    PatientMessage.__table__, "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS patient_messages_default PARTITION OF patient_messages DEFAULT")
+)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Управление помесячными секциями таблиц webhook_events и patient_messages.
+
+Секция таблицы TABLE за месяц YYYY-MM называется TABLE_pYYYY_MM и содержит строки
+с ключом секционирования в диапазоне [первое число месяца, первое число следующего месяца).
+Устаревшие webhook-события удаляются целыми секциями (DROP TABLE), без DELETE и VACUUM;
+секции журнала сообщений пациентов автоматически не удаляются.
+
+Строки, для месяца которых секция еще не создана (обслуживание запоздало), попадают
+в секцию по умолчанию TABLE_default. При создании секции такого месяца его строки
+переносятся из секции по умолчанию в новую секцию.
+"""
+
+import re
+import logging
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_EVENTS_TABLE = "webhook_events"
+PATIENT_MESSAGES_TABLE = "patient_messages"
+
+# Таблицы, секционированные по месяцам
+PARTITIONED_TABLES = (WEBHOOK_EVENTS_TABLE, PATIENT_MESSAGES_TABLE)
+
+# Ключ секционирования таблиц
+PARTITION_KEYS = {
+    WEBHOOK_EVENTS_TABLE: "received_at",
+    PATIENT_MESSAGES_TABLE: "created_at",
+}
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date, table: str = WEBHOOK_EVENTS_TABLE) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def default_partition_name(table: str = WEBHOOK_EVENTS_TABLE) -> str:
+    return f"{table}_default"
+
+
+def is_partitioned(conn: Connection, table: str = WEBHOOK_EVENTS_TABLE) -> bool:
+    """
+    Проверка, что таблица уже секционирована (webhook_events - миграция 0002,
+    patient_messages - миграция 0003).
+    """
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table"
+    ), {'table': table}).scalar())
+
+
+def ensure_month_partitions(conn: Connection, table: str, months_ahead: int, start: date = None) -> list:
+    """
+    Создание секций таблицы с текущего месяца на months_ahead месяцев вперед.
+
+    Args:
+        conn: Соединение с базой данных
+        table: Секционированная таблица
+        months_ahead: Количество месяцев вперед
+        start: Первый месяц (по умолчанию текущий)
+
+    Returns:
+        list: Имена созданных секций
+    """
+    if not is_partitioned(conn, table):
+        logger.warning(f"Таблица {table} не секционирована, примените миграции: alembic upgrade head")
+        return []
+
+    existing = {name for name, _ in list_month_partitions(conn, table)}
+    first = month_start(start or date.today())
+    created = []
+
+    for offset in range(months_ahead + 1):
+        month = add_months(first, offset)
+        name = partition_name(month, table)
+        if name in existing:
+            continue
+        create_month_partition(conn, table, month)
+        created.append(name)
+
+    return created
+
+
+def create_month_partition(conn: Connection, table: str, month: date):
+    """
+    Создание секции таблицы за месяц.
+
+    Если строки этого месяца уже попали в секцию по умолчанию, CREATE TABLE ... PARTITION OF
+    завершился бы ошибкой: секция по умолчанию отсоединяется, создается секция месяца,
+    строки переносятся в нее, и секция по умолчанию присоединяется обратно. Отсоединение
+    блокирует таблицу до конца транзакции, поэтому новые строки не теряются.
+
+    Args:
+        conn: Соединение с базой данных
+        table: Секционированная таблица
+        month: Первое число месяца
+    """
+    name = partition_name(month, table)
+    default = default_partition_name(table)
+    key = PARTITION_KEYS[table]
+    bounds = {'lower': month, 'upper': add_months(month, 1)}
+    create = text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {'name': default}).scalar() is not None
+    misplaced = has_default and conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {key} >= :lower AND {key} < :upper)"
+    ), bounds).scalar()
+
+    if not misplaced:
+        conn.execute(create)
+        logger.info(f"Создана секция {name}")
+        return
+
+    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    conn.execute(create)
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {key} >= :lower AND {key} < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds).rowcount
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    logger.warning(f"Создана секция {name}, из секции {default} перенесено строк: {moved}")
+
+
+def ensure_webhook_event_partitions(conn: Connection, months_ahead: int, start: date = None) -> list:
+    """
+    Создание секций таблицы webhook_events на months_ahead месяцев вперед.
+    """
+    return ensure_month_partitions(conn, WEBHOOK_EVENTS_TABLE, months_ahead, start)
+
+
+def list_month_partitions(conn: Connection, table: str) -> list:
+    """
+    Список помесячных секций таблицы.
+
+    Args:
+        conn: Соединение с базой данных
+        table: Секционированная таблица
+
+    Returns:
+        list: Список пар (имя секции, первое число месяца) по возрастанию месяца
+    """
+    name_re = re.compile(rf"^{table}_p(\d{{4}})_(\d{{2}})$")
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table"
+    ), {'table': table}).scalars().all()
+
+    partitions = []
+    for name in names:
+        match = name_re.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def list_webhook_event_partitions(conn: Connection) -> list:
+    """
+    Список помесячных секций таблицы webhook_events.
+    """
+    return list_month_partitions(conn, WEBHOOK_EVENTS_TABLE)
+
+
+def drop_expired_webhook_event_partitions(conn: Connection, retention_months: int,
+                                          today: date = None, dry_run: bool = False) -> list:
+    """
+    Удаление секций, все события которых старше срока хранения.
+
+    Args:
+        conn: Соединение с базой данных
+        retention_months: Срок хранения в месяцах (текущий месяц не учитывается)
+        today: Текущая дата (для проверки)
+        dry_run: Только вывести список секций, не удаляя их
+
+    Returns:
+        list: Имена удаленных (или подлежащих удалению) секций
+    """
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    expired = [name for name, month in list_webhook_event_partitions(conn) if add_months(month, 1) <= cutoff]
+
+    for name in expired:
+        if dry_run:
+            logger.info(f"Секция {name} подлежит удалению (события до {cutoff.isoformat()})")
+            continue
+        conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        logger.info(f"Удалена секция {name}")
+
+    # Устаревшие события, попавшие в секцию по умолчанию, удаляются построчно
+    default = default_partition_name(WEBHOOK_EVENTS_TABLE)
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': default}).scalar() is not None:
+        condition = f"{PARTITION_KEYS[WEBHOOK_EVENTS_TABLE]} < :cutoff"
+        if dry_run:
+            count = conn.execute(text(f"SELECT count(*) FROM {default} WHERE {condition}"), {'cutoff': cutoff}).scalar()
+            if count:
+                logger.info(f"В секции {default} подлежит удалению событий: {count}")
+        else:
+            count = conn.execute(text(f"DELETE FROM {default} WHERE {condition}"), {'cutoff': cutoff}).rowcount
+            if count:
+                logger.info(f"Из секции {default} удалено событий: {count}")
+
+    return expired
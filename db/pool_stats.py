@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Статистика пулов соединений SQLAlchemy.
+
+Пулы движков создаются из подклассов QueuePool/AsyncAdaptedQueuePool, которые
+измеряют время ожидания свободного соединения, считают ошибки получения
+соединения и медленные получения. Время открытия нового соединения с базой данных
+учитывается отдельно и не входит во время ожидания, чтобы задержка подключения
+не выглядела как нехватка соединений в пуле.
+"""
+
+import logging
+import threading
+import time
+from sqlalchemy import exc
+
+from config import DB_SLOW_CHECKOUT_MS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """
+    Счетчики пула соединений одного движка.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.connects = 0
+        self.total_connect = 0.0
+        self.max_connect = 0.0
+
+    def record_connect(self, duration: float):
+        """
+        Учет открытия нового соединения с базой данных.
+
+        Args:
+            duration: Время открытия соединения в секундах
+        """
+        with self._lock:
+            self.connects += 1
+            self.total_connect += duration
+            self.max_connect = max(self.max_connect, duration)
+
+    def record_checkout(self, wait: float):
+        """
+        Учет успешного получения соединения из пула.
+
+        Args:
+            wait: Время ожидания соединения в секундах (без открытия нового соединения)
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            slow = wait * 1000 >= DB_SLOW_CHECKOUT_MS
+            if slow:
+                self.slow_checkouts += 1
+
+        if slow:
+            logger.warning(f"Медленное получение соединения из пула {self.name}: {wait * 1000:.0f} мс "
+                           f"({self.pool.status() if self.pool else ''})")
+
+    def record_failure(self, wait: float):
+        """
+        Учет ошибки получения соединения (например, истечения pool_timeout).
+
+        Args:
+            wait: Время ожидания до ошибки в секундах
+        """
+        with self._lock:
+            self.checkout_failures += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        logger.error(f"Не удалось получить соединение из пула {self.name} за {wait * 1000:.0f} мс "
+                     f"({self.pool.status() if self.pool else ''})")
+
+    def snapshot(self) -> dict:
+        """
+        Текущее состояние пула и накопленные счетчики.
+        """
+        with self._lock:
+            result = {
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'slow_checkouts': self.slow_checkouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'connects': self.connects,
+                'avg_connect_ms': round(self.total_connect / self.connects * 1000, 2) if self.connects else 0.0,
+                'max_connect_ms': round(self.max_connect * 1000, 2),
+            }
+
+        if self.pool is not None:
+            result.update({
+                'pool_size': self.pool.size(),
+                'checked_out': self.pool.checkedout(),
+                'checked_in': self.pool.checkedin(),
+                'overflow': self.pool.overflow(),
+            })
+        return result
+
+
+# Статистика всех пулов процесса по имени движка
+_pool_stats = {}
+
+
+def instrumented_pool(pool_class, name: str):
+    """
+    Создание класса пула со сбором статистики.
+
+    Статистика хранится в атрибуте класса, поэтому сохраняется
+    при пересоздании пула (engine.dispose()).
+
+    Args:
+        pool_class: Базовый класс пула (QueuePool или AsyncAdaptedQueuePool)
+        name: Имя движка для статистики
+
+    Returns:
+        Подкласс pool_class
+    """
+    stats = _pool_stats.setdefault(name, PoolStats(name))
+
+    class InstrumentedPool(pool_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            stats.pool = self
+
+        def _create_connection(self):
+            started = time.perf_counter()
+            record = super()._create_connection()
+            duration = time.perf_counter() - started
+            stats.record_connect(duration)
+            # Время открытия вычитается из времени ожидания в _do_get, вызвавшем создание соединения
+            record._instrumented_connect_time = duration
+            return record
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                stats.record_failure(time.perf_counter() - started)
+                raise
+            connect_time = connection.__dict__.pop('_instrumented_connect_time', 0.0)
+            stats.record_checkout(time.perf_counter() - started - connect_time)
+            return connection
+
+    InstrumentedPool.__name__ = InstrumentedPool.__qualname__ = f"Instrumented{pool_class.__name__}"
+    InstrumentedPool.stats = stats
+    return InstrumentedPool
+
+
+def get_pool_stats() -> dict:
+    """
+    Статистика всех пулов соединений процесса.
+
+    Returns:
+        dict: Словарь {имя движка: состояние пула}
+    """
+    return {name: stats.snapshot() for name, stats in _pool_stats.items()}
+
+
+def log_pool_stats():
+    """
+    Запись статистики пулов соединений в лог.
+    """
+    for name, snapshot in get_pool_stats().items():
+        logger.info(f"Пул соединений {name}: " + ", ".join(f"{key}={value}" for key, value in snapshot.items()))
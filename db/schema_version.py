@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Проверка версии схемы базы данных при запуске.
+
+Бот не создает таблицы при каждом запуске (Base.metadata.create_all), а только
+сравнивает ревизию Alembic, записанную в базе данных, с последней ревизией
+в migrations/versions и не запускается при расхождении. Дополнительно проверяется,
+что в таблицах базы данных есть все столбцы моделей: ревизия не гарантирует
+этого, если столбцы были добавлены в модели без миграции. Схема создается
+скриптом scripts/init_database.py и обновляется командой alembic upgrade head.
+"""
+
+import os
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALEMBIC_INI = os.path.join(PROJECT_ROOT, "alembic.ini")
+
+
+class SchemaVersionError(RuntimeError):
+    """
+    Версия схемы базы данных не совпадает с версией кода.
+    """
+
+
+def alembic_config():
+    """
+    Конфигурация Alembic проекта, не зависящая от текущего каталога.
+    """
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(PROJECT_ROOT, "migrations"))
+    # Логирование настраивает вызывающий скрипт, migrations/env.py не применяет alembic.ini
+    config.attributes['configure_logger'] = False
+    return config
+
+
+def get_head_revisions() -> set:
+    """
+    Последние ревизии миграций в migrations/versions (без подключения к базе данных).
+    """
+    from alembic.script import ScriptDirectory
+
+    return set(ScriptDirectory.from_config(alembic_config()).get_heads())
+
+
+def get_current_revisions(conn: Connection) -> set:
+    """
+    Ревизии, примененные к базе данных (пустое множество, если миграции не применялись).
+    """
+    if conn.execute(text("SELECT to_regclass('alembic_version')")).scalar() is None:
+        return set()
+    return set(conn.execute(text("SELECT version_num FROM alembic_version")).scalars().all())
+
+
+def is_revision_applied(conn: Connection, revision: str) -> bool:
+    """
+    Проверка, что ревизия применена к базе данных (совпадает с текущей или предшествует ей).
+    """
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory.from_config(alembic_config())
+    return any(
+        applied.revision == revision
+        for current in get_current_revisions(conn)
+        for applied in script.iterate_revisions(current, "base")
+    )
+
+
+def get_missing_columns(conn: Connection) -> dict:
+    """
+    Столбцы моделей, которых нет в таблицах базы данных.
+
+    Returns:
+        dict: Имя таблицы и список отсутствующих в ней столбцов (пустой, если схема соответствует моделям)
+    """
+    from db.models import Base
+
+    existing = {}
+    rows = conn.execute(
+        text("SELECT table_name, column_name FROM information_schema.columns "
+             "WHERE table_schema = current_schema() AND table_name = ANY(:tables)"),
+        {'tables': list(Base.metadata.tables)}
+    )
+    for table_name, column_name in rows:
+        existing.setdefault(table_name, set()).add(column_name)
+
+    missing = {}
+    for table in Base.metadata.sorted_tables:
+        columns = [column.name for column in table.columns if column.name not in existing.get(table.name, set())]
+        if columns:
+            missing[table.name] = columns
+    return missing
+
+
+def check_schema_version(engine) -> str:
+    """
+    Проверка, что к базе данных применены все миграции и только они.
+
+    Args:
+        engine: Синхронный движок SQLAlchemy
+
+    Returns:
+        str: Текущая ревизия схемы
+
+    Raises:
+        SchemaVersionError: Если ревизия базы данных не совпадает с ревизией кода
+            или в таблицах базы данных нет столбцов моделей
+    """
+    heads = get_head_revisions()
+    with engine.connect() as conn:
+        current = get_current_revisions(conn)
+        missing = get_missing_columns(conn) if current == heads else {}
+
+    if current != heads:
+        raise SchemaVersionError(
+            f"Версия схемы базы данных ({', '.join(sorted(current)) or 'нет'}) не совпадает "
+            f"с версией кода ({', '.join(sorted(heads))}). Примените миграции: alembic upgrade head "
+            f"(для новой базы данных: python scripts/init_database.py)"
+        )
+
+    if missing:
+        raise SchemaVersionError(
+            f"Схема базы данных версии {', '.join(sorted(current))} не соответствует моделям, нет столбцов: "
+            + "; ".join(f"{table}({', '.join(columns)})" for table, columns in missing.items())
+            + ". Добавьте миграцию, создающую эти столбцы, и примените ее: alembic upgrade head"
+        )
+
+    revision = ', '.join(sorted(current))
+    logger.info(f"Версия схемы базы данных: {revision}")
+    return revision
+
+
+def stamp_head():
+    """
+    Запись последней ревизии в базу данных, созданную по моделям (create_all).
+    """
+    from alembic import command
+
+    command.stamp(alembic_config(), "head")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Пользовательские типы столбцов SQLAlchemy для хранения зашифрованных данных.
+"""
+
+from datetime import date, datetime
+from sqlalchemy import String, LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+from db.crypto import get_cipher
+
+
+class _PlainText(TypeDecorator):
+    """
+    Строка, передаваемая в базу данных для шифрования.
+    """
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return str(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return value
+
+
+class _IsoDateString(TypeDecorator):
+    """
+    Дата, передаваемая в базу данных в виде строки формата YYYY-MM-DD.
+    """
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d")
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    def process_result_value(self, value, dialect):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            return None
+
+
+class EncryptedText(TypeDecorator):
+    """
+    Строка, хранящаяся в столбце BYTEA в зашифрованном виде.
+
+    Способ шифрования определяется активным бэкендом (db/crypto.py):
+    для pgcrypto параметры при записи оборачиваются в pgp_sym_encrypt, а столбец
+    при чтении заменяется на pgp_sym_decrypt внутри того же SELECT; для aesgcm
+    значения шифруются и расшифровываются в процессе приложения.
+    В обоих случаях в Python приходит открытый текст.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    # Тип открытого значения, в котором параметр передается драйверу
+    plain_type = _PlainText()
+
+    def bind_expression(self, bindvalue):
+        return get_cipher().bind_expression(bindvalue, self.plain_type)
+
+    def column_expression(self, column):
+        return get_cipher().column_expression(column, self.plain_type)
+
+    def bind_processor(self, dialect):
+        cipher = get_cipher()
+        plain_process = self.plain_type.dialect_impl(dialect).bind_processor(dialect)
+        if not cipher.in_process:
+            return plain_process
+
+        binary_process = self.impl_instance.dialect_impl(dialect).bind_processor(dialect)
+
+        def process(value):
+            if plain_process is not None:
+                value = plain_process(value)
+            if value is None:
+                return None
+            value = cipher.encrypt(value)
+            return binary_process(value) if binary_process is not None else value
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        cipher = get_cipher()
+        if not cipher.in_process:
+            # Значение уже расшифровано в column_expression и приходит как текст
+            return self.plain_type.dialect_impl(dialect).result_processor(dialect, coltype)
+
+        binary_process = self.impl_instance.dialect_impl(dialect).result_processor(dialect, coltype)
+
+        def process(value):
+            if binary_process is not None:
+                value = binary_process(value)
+            if value is None:
+                return None
+            return self.plain_type.process_result_value(cipher.decrypt(value), dialect)
+
+        return process
+
+
+class EncryptedDate(EncryptedText):
+    """
+    Дата, хранящаяся в столбце BYTEA в зашифрованном виде (pgcrypto).
+    В Python значение представлено объектом date.
+    """
+    cache_ok = True
+
+    plain_type = _IsoDateString()
@@ -5,12 +5,14 @@
 Основной файл запуска Telegram-бота для медицинской клиники.
 """
 
-import logging
-from telegram.ext import Application
+import time
+
+# Начало отсчета профиля запуска (до импорта остальных модулей)
+STARTED = time.perf_counter()
 
-from config import TELEGRAM_BOT_TOKEN
-from bot.core.setup import setup_bot
-from db.database import init_db
+import sys
+import logging
+import argparse
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,15 +23,61 @@ logger = logging.getLogger(__name__)
 
 def main():
     """Запуск бота"""
-    logger.info("Инициализация базы данных PostgreSQL...")
-    init_db()
-    
+    parser = argparse.ArgumentParser(description="Telegram-бот медицинской клиники")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Записать в лог длительность этапов запуска до первого запроса getUpdates")
+    args = parser.parse_args()
+
+    # Модули бота импортируются после разбора аргументов, чтобы их импорт вошел в профиль запуска
+    from telegram.ext import Application
+    from sqlalchemy.exc import SQLAlchemyError
+    from config import TELEGRAM_BOT_TOKEN, BOT_CONCURRENT_UPDATES
+    from db.database import engine
+    from db.schema_version import check_schema_version, SchemaVersionError
+    from bot.core.startup_profile import StartupProfile, ProfiledGetUpdatesRequest
+
+    profile = StartupProfile(STARTED) if args.profile_startup else None
+    if profile:
+        profile.mark("импорт модулей")
+
+    # Вместо создания таблиц при каждом запуске проверяются версия схемы и наличие столбцов моделей
+    try:
+        check_schema_version(engine)
+    except SchemaVersionError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    except SQLAlchemyError as e:
+        logger.error(f"Не удалось проверить версию схемы базы данных: {e}")
+        sys.exit(1)
+    finally:
+        # Синхронное соединение нужно только для проверки
+        engine.dispose()
+    if profile:
+        profile.mark("проверка версии схемы")
+
+    from bot.core.setup import setup_bot, on_startup, on_shutdown
+    from bot.core.update_session import SessionUpdateProcessor
+
     logger.info("Запуск бота...")
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    
+    # Обновления разных пользователей обрабатываются параллельно,
+    # так как обработчики не блокируют цикл событий при работе с базой данных.
+    # Процессор обновлений открывает и закрывает сессию базы данных для каждого обновления
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(SessionUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if profile:
+        builder = builder.get_updates_request(ProfiledGetUpdatesRequest(profile, connection_pool_size=1))
+    application = builder.build()
+
     # Настройка бота (регистрация обработчиков и т.д.)
     setup_bot(application)
-    
+    if profile:
+        profile.mark("настройка обработчиков")
+
     # Запуск бота
     application.run_polling()
 
@@ -1,7 +1,11 @@
 from logging.config import fileConfig
 
+import sys
+import os
+
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy import text
 
 from alembic import context
 
@@ -11,9 +15,14 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# При вызове Alembic из кода (db/schema_version.py) логирование уже настроено
+# вызвавшим скриптом: fileConfig отключил бы его логгеры и поднял уровень до WARN
+if config.config_file_name is not None and config.attributes.get('configure_logger', True):
     fileConfig(config.config_file_name)
 
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -26,11 +35,8 @@ target_metadata = Base.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
-# Import the DATABASE_URL from config.py
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import DATABASE_URL
+# Import the DATABASE_URL from db/database.py
+from db.database import DATABASE_URL
 
 # Override the sqlalchemy.url in alembic.ini
 config.set_main_option("sqlalchemy.url", DATABASE_URL)
@@ -79,7 +85,7 @@ def run_migrations_online() -> None:
 
         with context.begin_transaction():
             # Создаем расширение pgcrypto перед миграциями
-            connection.execute("CREATE EXTENSION IF NOT EXISTS pgcrypto;")
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto;"))
             context.run_migrations()
 
 
@@ -0,0 +1,70 @@
+"""Индексы под фактические запросы сервисов и скриптов
+
+Индексы создаются CONCURRENTLY, поэтому миграцию можно применять
+на работающей базе данных без блокировки записи.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, столбцы, условие частичного индекса)
+INDEXES = [
+    # NotificationService.get_notification_by_appointment_and_telegram
+    ("ix_notifications_appointment_telegram", "notifications", ["appointment_id", "telegram_id"], None),
+    # NotificationService.get_pending_notifications_by_patient и каскадное удаление пациента
+    ("ix_notifications_patient_status", "notifications", ["patient_id", "status"], None),
+    # NotificationService.get_notifications_by_status
+    ("ix_notifications_status", "notifications", ["status"], None),
+    # scripts/send_notifications.py: пациенты с согласием на уведомления и привязкой к МИС
+    ("ix_patients_notifiable", "patients", ["id"], "consent_notifications AND mis_id IS NOT NULL"),
+    # Каскадное удаление и загрузка связанных записей пациента
+    ("ix_services_patient_id", "services", ["patient_id"], None),
+    ("ix_conversations_patient_id", "conversations", ["patient_id"], None),
+]
+
+
+def drop_invalid_index(name: str) -> None:
+    """
+    Удаление индекса, оставшегося невалидным после прерванного CREATE INDEX CONCURRENTLY,
+    иначе IF NOT EXISTS пропустит его создание.
+    """
+    if context.is_offline_mode():
+        return
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {'name': name}).scalar()
+    if invalid:
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            drop_invalid_index(name)
+            op.create_index(
+                name, table, columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,104 @@
+"""Перевод webhook_events на JSONB и помесячное секционирование по received_at
+
+Существующая таблица переименовывается, создается секционированная таблица
+с секциями на весь диапазон имеющихся событий (плюс секция по умолчанию),
+данные копируются, после чего старая таблица удаляется. На время миграции
+запись в webhook_events блокируется.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Количество секций, создаваемых заранее после текущего месяца
+MONTHS_AHEAD = 2
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_month_partitions(first: date, last: date) -> None:
+    month = first
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE webhook_events_p{month:%Y_%m} PARTITION OF webhook_events "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+        month = add_months(month, 1)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE webhook_events RENAME TO webhook_events_legacy")
+    op.execute("ALTER TABLE webhook_events_legacy RENAME CONSTRAINT webhook_events_pkey TO webhook_events_legacy_pkey")
+
+    # Последовательность сохраняется, чтобы ID событий продолжали расти
+    op.execute("ALTER SEQUENCE webhook_events_id_seq AS BIGINT")
+    op.execute("""
+        CREATE TABLE webhook_events (
+            id BIGINT NOT NULL DEFAULT nextval('webhook_events_id_seq'),
+            event_type VARCHAR(100) NOT NULL,
+            payload JSONB,
+            received_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, received_at)
+        ) PARTITION BY RANGE (received_at)
+    """)
+    op.execute("ALTER SEQUENCE webhook_events_id_seq OWNED BY webhook_events.id")
+
+    current = date.today().replace(day=1)
+    first = current
+    if not context.is_offline_mode():
+        oldest = op.get_bind().execute(sa.text("SELECT min(received_at) FROM webhook_events_legacy")).scalar()
+        if oldest is not None:
+            first = min(first, oldest.date().replace(day=1))
+    create_month_partitions(first, add_months(current, MONTHS_AHEAD))
+    op.execute("CREATE TABLE webhook_events_default PARTITION OF webhook_events DEFAULT")
+
+    op.execute("""
+        INSERT INTO webhook_events (id, event_type, payload, received_at)
+        SELECT id, event_type, payload::jsonb, received_at FROM webhook_events_legacy
+    """)
+    op.execute("DROP TABLE webhook_events_legacy")
+
+    # Индексы секционированной таблицы создаются во всех секциях
+    op.create_index("ix_webhook_events_received_at", "webhook_events", ["received_at"])
+    op.create_index("ix_webhook_events_event_type_received_at", "webhook_events", ["event_type", "received_at"])
+    op.create_index(
+        "ix_webhook_events_payload", "webhook_events", ["payload"],
+        postgresql_using="gin", postgresql_ops={"payload": "jsonb_path_ops"}
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE webhook_events RENAME TO webhook_events_partitioned")
+    op.execute("ALTER TABLE webhook_events_partitioned RENAME CONSTRAINT webhook_events_pkey TO webhook_events_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE webhook_events (
+            id INTEGER NOT NULL DEFAULT nextval('webhook_events_id_seq'),
+            event_type VARCHAR(100) NOT NULL,
+            payload JSON,
+            received_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT webhook_events_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO webhook_events (id, event_type, payload, received_at)
+        SELECT id, event_type, payload::json, received_at FROM webhook_events_partitioned
+    """)
+    op.execute("ALTER SEQUENCE webhook_events_id_seq OWNED BY webhook_events.id")
+    op.execute("DROP TABLE webhook_events_partitioned")
+    op.execute("ALTER SEQUENCE webhook_events_id_seq AS INTEGER")
@@ -0,0 +1,83 @@
+"""Журнал сообщений пациентов и список входящих чатов
+
+Создается секционированная по месяцам по created_at таблица patient_messages
+(секции на текущий и ближайшие месяцы плюс секция по умолчанию).
+В conversations остается одна запись на пациента (уникальный индекс по patient_id,
+нужный для INSERT ... ON CONFLICT), last_message хранится в зашифрованном виде,
+добавляется индекс для списка входящих по last_timestamp.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Количество секций, создаваемых заранее после текущего месяца
+MONTHS_AHEAD = 2
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE patient_messages (
+            id BIGSERIAL NOT NULL,
+            patient_id INTEGER NOT NULL REFERENCES patients (id) ON DELETE CASCADE,
+            telegram_message_id BIGINT NOT NULL,
+            text BYTEA NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    current = date.today().replace(day=1)
+    for offset in range(MONTHS_AHEAD + 1):
+        month = add_months(current, offset)
+        op.execute(
+            f"CREATE TABLE patient_messages_p{month:%Y_%m} PARTITION OF patient_messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    op.execute("CREATE TABLE patient_messages_default PARTITION OF patient_messages DEFAULT")
+    op.create_index("ix_patient_messages_patient_created_at", "patient_messages", ["patient_id", "created_at"])
+
+    # До этой ревизии чаты не записывались; возможные дубликаты удаляются перед созданием уникального индекса
+    op.execute("""
+        DELETE FROM conversations c USING conversations newer
+        WHERE newer.patient_id = c.patient_id AND newer.id > c.id
+    """)
+    op.drop_index("ix_conversations_patient_id", table_name="conversations")
+    op.create_index("ix_conversations_patient_id", "conversations", ["patient_id"], unique=True)
+    op.create_index("ix_conversations_last_timestamp", "conversations", ["last_timestamp"])
+
+    # Открытый текст нельзя зашифровать в SQL для бэкенда aesgcm, а столбец не заполнялся
+    op.alter_column(
+        "conversations", "last_message",
+        type_=sa.LargeBinary(), postgresql_using="NULL::bytea"
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "conversations", "last_message",
+        type_=sa.Text(), postgresql_using="NULL::text"
+    )
+    op.drop_index("ix_conversations_last_timestamp", table_name="conversations")
+    op.drop_index("ix_conversations_patient_id", table_name="conversations")
+    op.create_index("ix_conversations_patient_id", "conversations", ["patient_id"])
+
+    op.execute("DROP TABLE patient_messages")
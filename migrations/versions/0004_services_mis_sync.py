@@ -0,0 +1,46 @@
+"""Синхронизация истории визитов из МИС в services
+
+В services добавляется ID визита в системе-источнике и уникальный индекс
+(patient_id, source, external_id) для INSERT ... ON CONFLICT; в patients -
+дата, до которой синхронизированы визиты пациента. Оба столбца допускают NULL,
+поэтому ALTER TABLE не перезаписывает таблицы. Индекс создается CONCURRENTLY.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Столбцы фиксируются до создания индекса вне транзакции; IF NOT EXISTS и удаление
+    # индекса позволяют повторить миграцию после прерванного CREATE INDEX CONCURRENTLY
+    op.execute("ALTER TABLE services ADD COLUMN IF NOT EXISTS external_id BIGINT")
+    op.execute("ALTER TABLE patients ADD COLUMN IF NOT EXISTS visits_synced_until DATE")
+
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ux_services_patient_source_external_id", table_name="services",
+            if_exists=True, postgresql_concurrently=True
+        )
+        op.create_index(
+            "ux_services_patient_source_external_id", "services",
+            ["patient_id", "source", "external_id"], unique=True,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ux_services_patient_source_external_id", table_name="services")
+    op.drop_column("patients", "visits_synced_until")
+    op.drop_column("services", "external_id")
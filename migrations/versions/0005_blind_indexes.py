@@ -0,0 +1,80 @@
+"""Слепые индексы зашифрованных полей пациентов и поисковые токены ФИО
+
+Добавляются столбцы слепых индексов patients.*_bidx и таблица patient_search_tokens,
+которые раньше создавались только скриптом scripts/backfill_blind_indexes.py.
+Все объекты создаются с IF NOT EXISTS, поэтому миграция применяется и к базам данных,
+где этот скрипт уже запускался. Индексы создаются CONCURRENTLY, без блокировки записи.
+Значения заполняются скриптом scripts/backfill_blind_indexes.py.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BLIND_INDEX_COLUMNS = ['phone_number_bidx', 'first_name_bidx', 'last_name_bidx', 'third_name_bidx']
+
+# (имя индекса, таблица, столбцы)
+INDEXES = [
+    *[(f"ix_patients_{column}", "patients", [column]) for column in BLIND_INDEX_COLUMNS],
+    # Удаление поисковых токенов пациента и каскадное удаление
+    ("ix_patient_search_tokens_patient_id", "patient_search_tokens", ["patient_id"]),
+]
+
+
+def drop_invalid_index(name: str) -> None:
+    """
+    Удаление индекса, оставшегося невалидным после прерванного CREATE INDEX CONCURRENTLY,
+    иначе IF NOT EXISTS пропустит его создание.
+    """
+    if context.is_offline_mode():
+        return
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {'name': name}).scalar()
+    if invalid:
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade() -> None:
+    for column in BLIND_INDEX_COLUMNS:
+        op.execute(f"ALTER TABLE patients ADD COLUMN IF NOT EXISTS {column} BYTEA")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS patient_search_tokens (
+            token BYTEA NOT NULL,
+            patient_id INTEGER NOT NULL REFERENCES patients (id) ON DELETE CASCADE,
+            PRIMARY KEY (token, patient_id)
+        )
+    """)
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            drop_invalid_index(name)
+            op.create_index(
+                name, table, columns,
+                if_not_exists=True,
+                postgresql_concurrently=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+
+    op.execute("DROP TABLE IF EXISTS patient_search_tokens")
+    for column in reversed(BLIND_INDEX_COLUMNS):
+        op.execute(f"ALTER TABLE patients DROP COLUMN IF EXISTS {column}")
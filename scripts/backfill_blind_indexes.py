@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для заполнения слепых индексов (blind index) и поисковых токенов ФИО
+у существующих пациентов.
+
+Столбцы слепых индексов, B-tree индексы по ним и таблица поисковых токенов
+создаются миграцией 0005 (alembic upgrade head); скрипт проверяет, что она
+применена, и пакетами пересчитывает значения для всех записей таблицы patients.
+Скрипт можно безопасно запускать повторно, в том числе с параметром --start-id.
+"""
+
+import sys
+import os
+import time
+import logging
+import argparse
+from sqlalchemy import select, update, insert, delete
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import engine, SessionLocal
+from db.schema_version import is_revision_applied, SchemaVersionError
+from db.pool_stats import log_pool_stats
+from db.models import Patient, PatientSearchToken
+from db.blind_index import BLIND_INDEX_COLUMNS, blind_index_values, name_search_tokens
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+# Миграция, создающая столбцы, индексы и таблицу слепых индексов
+SCHEMA_REVISION = "0005"
+
+
+def check_schema():
+    """
+    Проверка, что миграция слепых индексов применена. Скрипт не применяет миграции сам:
+    alembic upgrade head применил бы и все остальные ожидающие миграции.
+
+    Raises:
+        SchemaVersionError: Если миграция не применена
+    """
+    with engine.connect() as conn:
+        applied = is_revision_applied(conn, SCHEMA_REVISION)
+    if not applied:
+        raise SchemaVersionError(
+            f"Миграция {SCHEMA_REVISION} (слепые индексы) не применена. Выполните: alembic upgrade head"
+        )
+
+
+def backfill(batch_size: int, start_id: int) -> int:
+    """
+    Пересчет слепых индексов и поисковых токенов для всех пациентов.
+
+    Args:
+        batch_size: Количество записей в одном пакете
+        start_id: ID, после которого начинается обработка
+
+    Returns:
+        int: Количество обработанных записей
+    """
+    fields = list(BLIND_INDEX_COLUMNS.keys())
+    columns = [getattr(Patient, field) for field in fields]
+
+    last_id = start_id
+    processed = 0
+    started = time.monotonic()
+
+    while True:
+        db = SessionLocal()
+        try:
+            # Зашифрованные поля расшифровываются в этом же запросе
+            rows = db.execute(
+                select(Patient.id, *columns)
+                .where(Patient.id > last_id)
+                .order_by(Patient.id)
+                .limit(batch_size)
+            ).all()
+
+            if not rows:
+                break
+
+            params = [
+                {'id': row.id, **blind_index_values({field: getattr(row, field) for field in fields})}
+                for row in rows
+            ]
+            db.execute(update(Patient), params)
+
+            # Пересоздание поисковых токенов ФИО
+            batch_ids = [row.id for row in rows]
+            db.execute(delete(PatientSearchToken).where(PatientSearchToken.patient_id.in_(batch_ids)))
+            tokens = [
+                {'token': token, 'patient_id': row.id}
+                for row in rows
+                for token in name_search_tokens(row.last_name, row.first_name, row.third_name)
+            ]
+            if tokens:
+                db.execute(insert(PatientSearchToken), tokens)
+            db.commit()
+        finally:
+            db.close()
+
+        last_id = rows[-1].id
+        processed += len(rows)
+        elapsed = time.monotonic() - started
+        logger.info(f"Обработано до id={last_id}, всего записей: {processed} "
+                    f"({processed / elapsed:.0f} записей/с)")
+
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение слепых индексов и поисковых токенов пациентов")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Размер пакета (по умолчанию 1000)")
+    parser.add_argument("--start-id", type=int, default=0, help="Начать обработку после указанного ID")
+    args = parser.parse_args()
+
+    try:
+        check_schema()
+        processed = backfill(args.batch_size, args.start_id)
+        print(f"Слепые индексы и поисковые токены заполнены. Обработано записей: {processed}")
+        log_pool_stats()
+    except Exception as e:
+        logger.error(f"Ошибка при заполнении слепых индексов: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк поиска пациентов по ФИО.
+
+Сравнивает задержку поиска через поисковые токены (search_patients_by_name)
+с прежним подходом «расшифровать и отфильтровать в Python»:
+    legacy-100  - прежний цикл: первые 100 пациентов, расшифровка каждого поля отдельным запросом
+                  (результаты за пределами первых 100 записей теряются);
+    full-scan   - сканирование всей таблицы с расшифровкой в SELECT
+                  (единственный корректный вариант без индекса).
+
+Синтетические пациенты создаются во временной схеме bench_search,
+которая удаляется после завершения (если не указан --keep).
+
+Пример:
+    python scripts/benchmark_search.py --sizes 100000 1000000
+"""
+
+import sys
+import os
+import time
+import asyncio
+import random
+import logging
+import argparse
+import statistics
+from tabulate import tabulate
+from sqlalchemy import select, insert, text, type_coerce, LargeBinary
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import PGP_KEY
+from db.database import engine, async_engine, Base
+from db.models import Patient, PatientSearchToken
+from db.blind_index import blind_index_values, name_search_tokens, normalize_name
+from bot.services.patient_service import search_patients_by_name
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+SCHEMA = "bench_search"
+CHUNK_SIZE = 5000
+NAME_FIELDS = ('last_name', 'first_name', 'third_name')
+
+LAST_NAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+    "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+    "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин",
+    "Захаров", "Зайцев", "Соловьев", "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьев",
+]
+FIRST_NAMES = [
+    "Александр", "Сергей", "Дмитрий", "Андрей", "Алексей", "Максим", "Евгений", "Иван",
+    "Михаил", "Артем", "Анна", "Мария", "Елена", "Ольга", "Наталья", "Татьяна", "Ирина",
+]
+THIRD_NAMES = [
+    "Александрович", "Сергеевич", "Дмитриевич", "Андреевич", "Алексеевич", "Иванович",
+    "Михайлович", "Петрович", "Николаевич", "Владимирович",
+]
+
+
+def synthetic_patient(telegram_id: int) -> dict:
+    """
+    Случайные данные синтетического пациента.
+    """
+    # Суффиксы увеличивают разнообразие фамилий
+    last_name = f"{random.choice(LAST_NAMES)}{random.choice(['', 'а', 'ский', 'ин', 'енко'])}"
+    return {
+        'telegram_id': telegram_id,
+        'phone_number': f"+79{random.randint(0, 999999999):09d}",
+        'first_name': random.choice(FIRST_NAMES),
+        'last_name': last_name,
+        'third_name': random.choice(THIRD_NAMES),
+        'bot_state': "active",
+    }
+
+
+def populate(db: Session, size: int):
+    """
+    Заполнение схемы бенчмарка синтетическими пациентами и поисковыми токенами.
+    """
+    started = time.monotonic()
+    for offset in range(0, size, CHUNK_SIZE):
+        rows = [synthetic_patient(telegram_id) for telegram_id in range(offset + 1, min(offset + CHUNK_SIZE, size) + 1)]
+        for row in rows:
+            row.update(blind_index_values(row))
+
+        ids = db.scalars(insert(Patient).returning(Patient.id, sort_by_parameter_order=True), rows).all()
+        tokens = [
+            {'token': token, 'patient_id': patient_id}
+            for patient_id, row in zip(ids, rows)
+            for token in name_search_tokens(row['last_name'], row['first_name'], row['third_name'])
+        ]
+        db.execute(insert(PatientSearchToken), tokens)
+        db.commit()
+        logger.info(f"Создано пациентов: {offset + len(rows)} из {size}")
+
+    db.execute(text(f"ANALYZE {SCHEMA}.patients"))
+    db.execute(text(f"ANALYZE {SCHEMA}.patient_search_tokens"))
+    db.commit()
+    logger.info(f"Заполнение {size} пациентов заняло {time.monotonic() - started:.1f} с")
+
+
+def legacy_search(db: Session, query: str, limit: int) -> list:
+    """
+    Прежний алгоритм: первые 100 пациентов, расшифровка каждого поля отдельным запросом.
+    """
+    decrypt = text("SELECT pgp_sym_decrypt(:value, :key)")
+    needle = normalize_name(query)
+    # type_coerce к LargeBinary отключает расшифровку в SELECT: поля приходят зашифрованными
+    rows = db.execute(
+        select(Patient.id, *[type_coerce(getattr(Patient, field), LargeBinary) for field in NAME_FIELDS])
+        .order_by(Patient.id)
+        .limit(100)
+    ).all()
+
+    results = []
+    for row in rows:
+        values = [
+            db.execute(decrypt, {'value': value, 'key': PGP_KEY}).scalar() if value is not None else None
+            for value in row[1:]
+        ]
+        if any(value and needle in normalize_name(value) for value in values):
+            results.append(row[0])
+            if len(results) >= limit:
+                break
+    return results
+
+
+def full_scan_search(db: Session, query: str, limit: int) -> list:
+    """
+    Сканирование всей таблицы с расшифровкой в SELECT и фильтрацией в Python.
+    """
+    needle = normalize_name(query)
+    stmt = select(Patient.id, *[getattr(Patient, field) for field in NAME_FIELDS]).order_by(Patient.id)
+
+    results = []
+    for row in db.execute(stmt.execution_options(yield_per=5000)):
+        if any(value and needle in normalize_name(value) for value in row[1:]):
+            results.append(row[0])
+            if len(results) >= limit:
+                break
+    return results
+
+
+def measure(func, queries: list) -> list:
+    """
+    Замер задержки выполнения функции для каждого запроса (в миллисекундах).
+    """
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        func(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def measure_async(func, queries: list) -> list:
+    """
+    Замер задержки выполнения асинхронной функции для каждого запроса (в миллисекундах).
+    """
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        await func(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(size: int, method: str, timings: list) -> list:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return [size, method, len(timings), f"{statistics.median(timings):.1f}", f"{p95:.1f}"]
+
+
+async def run_benchmark(sizes: list, queries_count: int, scan_queries: int, limit: int, keep: bool):
+    bench_engine = engine.execution_options(schema_translate_map={None: SCHEMA})
+    bench_async_engine = async_engine.execution_options(schema_translate_map={None: SCHEMA})
+    report = []
+
+    for size in sizes:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(bind=bench_engine, tables=[Patient.__table__, PatientSearchToken.__table__])
+
+        with Session(bench_engine) as db:
+            populate(db, size)
+
+            queries = [
+                random.choice(LAST_NAMES)[:random.randint(2, 5)] if i % 2 else
+                f"{random.choice(LAST_NAMES)} {random.choice(FIRST_NAMES)[:3]}"
+                for i in range(queries_count)
+            ]
+
+            async with AsyncSession(bench_async_engine) as async_db:
+                report.append(summarize(size, "tokens", await measure_async(
+                    lambda q: search_patients_by_name(async_db, q, limit), queries)))
+            report.append(summarize(size, "legacy-100", measure(
+                lambda q: legacy_search(db, q, limit), queries[:scan_queries])))
+            report.append(summarize(size, "full-scan", measure(
+                lambda q: full_scan_search(db, q, limit), queries[:scan_queries])))
+
+        if not keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    print(tabulate(report, headers=["Пациентов", "Метод", "Запросов", "Медиана, мс", "p95, мс"], tablefmt="grid"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска пациентов по ФИО")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000], help="Размеры синтетических таблиц")
+    parser.add_argument("--queries", type=int, default=50, help="Количество запросов поиска через токены")
+    parser.add_argument("--scan-queries", type=int, default=3, help="Количество запросов для методов со сканированием")
+    parser.add_argument("--limit", type=int, default=10, help="Максимальное количество результатов")
+    parser.add_argument("--keep", action="store_true", help="Не удалять схему бенчмарка")
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark(args.sizes, args.queries, args.scan_queries, args.limit, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Микробенчмарк накладных расходов на построение запросов для самых частых обращений к базе данных.
+
+Для каждого запроса сравниваются два варианта:
+    select       - прежний вариант: объект select() строится заново при каждом вызове,
+                   а для поиска в кеше скомпилированных запросов каждый раз вычисляется его ключ;
+    lambda_stmt  - текущий вариант: запрос строится один раз, при следующих вызовах
+                   из замыкания извлекаются только значения параметров.
+
+По умолчанию измеряется только время на стороне Python (построение запроса и ключа кеша),
+подключение к базе данных не требуется. С флагом --db дополнительно измеряется
+полное время выполнения запроса через AsyncSession для указанного --telegram-id.
+
+Пример:
+    python scripts/benchmark_statements.py --iterations 20000
+    python scripts/benchmark_statements.py --db --telegram-id 123456789 --iterations 2000
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+import argparse
+from tabulate import tabulate
+from sqlalchemy import select, lambda_stmt
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.models import Patient, Notification
+from bot.services.patient_service import STATE_COLUMNS
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def patient_by_telegram_id(telegram_id, **_):
+    return select(Patient).where(Patient.telegram_id == telegram_id)
+
+
+def patient_by_telegram_id_cached(telegram_id, **_):
+    return lambda_stmt(lambda: select(Patient).where(Patient.telegram_id == telegram_id))
+
+
+def patient_state(telegram_id, **_):
+    return select(*STATE_COLUMNS).where(Patient.telegram_id == telegram_id)
+
+
+def patient_state_cached(telegram_id, **_):
+    return lambda_stmt(lambda: select(*STATE_COLUMNS).where(Patient.telegram_id == telegram_id))
+
+
+def notification_by_appointment(telegram_id, appointment_id, **_):
+    return select(Notification).where(
+        Notification.appointment_id == appointment_id,
+        Notification.telegram_id == telegram_id
+    ).limit(1)
+
+
+def notification_by_appointment_cached(telegram_id, appointment_id, **_):
+    return lambda_stmt(
+        lambda: select(Notification).where(
+            Notification.appointment_id == appointment_id,
+            Notification.telegram_id == telegram_id
+        ).limit(1)
+    )
+
+
+def notification_status(telegram_id, appointment_id, **_):
+    return select(Notification.status).where(
+        Notification.appointment_id == appointment_id,
+        Notification.telegram_id == telegram_id
+    ).limit(1)
+
+
+def notification_status_cached(telegram_id, appointment_id, **_):
+    return lambda_stmt(
+        lambda: select(Notification.status).where(
+            Notification.appointment_id == appointment_id,
+            Notification.telegram_id == telegram_id
+        ).limit(1)
+    )
+
+
+def pending_notifications(patient_id, **_):
+    return select(Notification).where(
+        Notification.patient_id == patient_id,
+        Notification.status == "pending"
+    )
+
+
+def pending_notifications_cached(patient_id, **_):
+    return lambda_stmt(
+        lambda: select(Notification).where(
+            Notification.patient_id == patient_id,
+            Notification.status == "pending"
+        )
+    )
+
+
+# Запрос: (прежний вариант, текущий вариант)
+QUERIES = {
+    'get_patient_by_telegram_id': (patient_by_telegram_id, patient_by_telegram_id_cached),
+    'get_patient_state': (patient_state, patient_state_cached),
+    'get_notification_by_appointment_and_telegram': (notification_by_appointment, notification_by_appointment_cached),
+    'get_notification_status': (notification_status, notification_status_cached),
+    'get_pending_notifications_by_patient': (pending_notifications, pending_notifications_cached),
+}
+
+
+def measure_overhead(build, iterations: int) -> float:
+    """
+    Среднее время построения запроса и его ключа кеша в микросекундах.
+    Параметры меняются на каждой итерации, как при обработке сообщений разных пользователей.
+    """
+    # Первый вызов заполняет кеш lambda_stmt и не учитывается
+    build(telegram_id=0, appointment_id=0, patient_id=0)._generate_cache_key()
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        build(telegram_id=i, appointment_id=i, patient_id=i)._generate_cache_key()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def measure_execution(build, iterations: int, params: dict) -> float:
+    """
+    Среднее время выполнения запроса через AsyncSession в микросекундах.
+    """
+    from db.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        (await db.execute(build(**params))).all()
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            (await db.execute(build(**params))).all()
+            # Объекты не накапливаются в identity map между вызовами, как и при обработке разных обновлений
+            db.expunge_all()
+        return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+async def run_db_benchmark(iterations: int, telegram_id: int) -> list:
+    """
+    Измерение полного времени выполнения запросов для существующего пациента.
+    """
+    from db.database import AsyncSessionLocal, async_engine
+
+    try:
+        async with AsyncSessionLocal() as db:
+            patient_id = await db.scalar(select(Patient.id).where(Patient.telegram_id == telegram_id))
+            appointment_id = await db.scalar(
+                select(Notification.appointment_id).where(Notification.telegram_id == telegram_id).limit(1)
+            )
+        if patient_id is None:
+            raise ValueError(f"Пациент с telegram_id={telegram_id} не найден")
+
+        params = {'telegram_id': telegram_id, 'appointment_id': appointment_id or 0, 'patient_id': patient_id}
+        rows = []
+        for name, (before, after) in QUERIES.items():
+            before_us = await measure_execution(before, iterations, params)
+            after_us = await measure_execution(after, iterations, params)
+            rows.append([name, f"{before_us:.1f}", f"{after_us:.1f}", f"{before_us / after_us:.2f}x"])
+        return rows
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк накладных расходов на построение частых запросов")
+    parser.add_argument("--iterations", type=int, default=20000, help="Количество вызовов каждого запроса (по умолчанию 20000)")
+    parser.add_argument("--db", action="store_true", help="Дополнительно измерить полное выполнение запросов в базе данных")
+    parser.add_argument("--telegram-id", type=int, help="Telegram ID существующего пациента (для --db)")
+    args = parser.parse_args()
+
+    if args.db and args.telegram_id is None:
+        parser.error("для --db требуется --telegram-id")
+
+    rows = []
+    for name, (before, after) in QUERIES.items():
+        before_us = measure_overhead(before, args.iterations)
+        after_us = measure_overhead(after, args.iterations)
+        rows.append([name, f"{before_us:.1f}", f"{after_us:.1f}", f"{before_us / after_us:.2f}x"])
+
+    print("\nПостроение запроса и ключа кеша, мкс на вызов:")
+    print(tabulate(rows, headers=["Запрос", "select", "lambda_stmt", "Ускорение"], tablefmt="grid"))
+
+    if args.db:
+        try:
+            db_rows = asyncio.run(run_db_benchmark(args.iterations, args.telegram_id))
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении бенчмарка в базе данных: {e}")
+            sys.exit(1)
+
+        print("\nПолное выполнение запроса через AsyncSession, мкс на вызов:")
+        print(tabulate(db_rows, headers=["Запрос", "select", "lambda_stmt", "Ускорение"], tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для проверки планов выполнения основных запросов бота.
+
+Для каждого запроса выполняется EXPLAIN с отключенным последовательным сканированием
+(enable_seqscan = off): если подходящего индекса нет, планировщик все равно выберет
+Seq Scan, и проверка завершится ошибкой. На маленьких таблицах без этой настройки
+PostgreSQL законно предпочитает последовательное сканирование.
+
+Пример:
+    python scripts/check_query_plans.py --verbose
+"""
+
+import sys
+import os
+import json
+import logging
+import argparse
+from tabulate import tabulate
+from sqlalchemy import select, text
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import engine
+from db.models import Patient, Notification, Service, Conversation, PatientMessage
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def build_queries() -> dict:
+    """
+    Запросы в том виде, в котором их выполняют сервисы и скрипты.
+    """
+    return {
+        "NotificationService.get_notification_by_appointment_and_telegram": select(Notification).where(
+            Notification.appointment_id == 1,
+            Notification.telegram_id == 1
+        ).limit(1),
+        "NotificationService.get_pending_notifications_by_patient": select(Notification).where(
+            Notification.patient_id == 1,
+            Notification.status == "pending"
+        ),
+        "NotificationService.get_notifications_by_status": select(Notification).where(
+            Notification.status == "pending"
+        ),
+        "send_notifications.send_appointment_reminders": select(Patient.id)
+            .where(Patient.consent_notifications == True, Patient.mis_id.isnot(None))
+            .order_by(Patient.id),
+        "patient_service.get_patient_by_telegram_id": select(Patient.id).where(Patient.telegram_id == 1),
+        "patient_service.search_patients (телефон)": select(Patient.id).where(Patient.phone_number_bidx == b"0" * 32),
+        "Patient.services": select(Service).where(Service.patient_id == 1),
+        "Patient.conversations": select(Conversation).where(Conversation.patient_id == 1),
+        "conversation_service.get_inbox": select(Conversation)
+            .order_by(Conversation.last_timestamp.desc())
+            .limit(50),
+        "conversation_service.get_patient_messages": select(PatientMessage)
+            .where(PatientMessage.patient_id == 1)
+            .order_by(PatientMessage.created_at.desc())
+            .limit(50),
+    }
+
+
+def collect_nodes(plan: dict) -> list:
+    """
+    Список всех узлов плана выполнения.
+    """
+    nodes = [plan]
+    for child in plan.get('Plans', []):
+        nodes.extend(collect_nodes(child))
+    return nodes
+
+
+def check_plans(verbose: bool) -> bool:
+    """
+    Проверка отсутствия последовательного сканирования в планах запросов.
+
+    Args:
+        verbose: Выводить полный план каждого запроса
+
+    Returns:
+        bool: True, если ни один запрос не использует Seq Scan
+    """
+    report = []
+    ok = True
+
+    with engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+        for name, query in build_queries().items():
+            sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = collect_nodes(plan[0]['Plan'])
+
+            seq_scans = [node.get('Relation Name') for node in nodes if node['Node Type'] == 'Seq Scan']
+            indexes = [node['Index Name'] for node in nodes if 'Index Name' in node]
+            ok = ok and not seq_scans
+
+            report.append([
+                name,
+                ", ".join(indexes) or "-",
+                "Seq Scan: " + ", ".join(seq_scans) if seq_scans else "OK"
+            ])
+            if verbose:
+                print(f"\n{name}\n{sql}\n{json.dumps(plan, indent=2, ensure_ascii=False)}")
+        conn.rollback()
+
+    print(tabulate(report, headers=["Запрос", "Индексы", "Результат"], tablefmt="grid"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов выполнения запросов")
+    parser.add_argument("--verbose", action="store_true", help="Выводить полный план каждого запроса")
+    args = parser.parse_args()
+
+    try:
+        if not check_plans(args.verbose):
+            print("Обнаружено последовательное сканирование. Примените миграции: alembic upgrade head")
+            sys.exit(1)
+        print("Все запросы используют индексы.")
+    except Exception as e:
+        logger.error(f"Ошибка при проверке планов запросов: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
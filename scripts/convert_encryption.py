@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для перешифрования конфиденциальных полей пациентов из формата pgcrypto
+в формат AES-GCM (бэкенд aesgcm).
+
+Скрипт обрабатывает таблицу patients пакетами по возрастанию id и сохраняет
+номер последней обработанной записи в файл контрольной точки, поэтому после
+прерывания его можно запустить повторно. Уже преобразованные значения пропускаются.
+
+Скрипт рассчитан на значения pgcrypto без версии ключа (PGP_KEY). Если заданы
+версионированные ключи (PGP_KEYS), для перехода на aesgcm используйте
+scripts/rotate_encryption_key.py с ENCRYPTION_BACKEND=aesgcm.
+
+Рекомендуемый порядок перехода:
+    1. Задать AES_KEY и переключить бота на ENCRYPTION_BACKEND=aesgcm
+       (значения старого формата продолжают читаться);
+    2. Запустить этот скрипт.
+"""
+
+import sys
+import os
+import json
+import time
+import logging
+import argparse
+from sqlalchemy import text, bindparam, LargeBinary
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import PGP_KEY
+from db.database import engine
+from db.pool_stats import log_pool_stats
+from db.crypto import create_cipher, AESGCM_MARKER
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+ENCRYPTED_COLUMNS = ['phone_number', 'first_name', 'last_name', 'third_name', 'birth_date']
+DEFAULT_CHECKPOINT = "convert_encryption.checkpoint.json"
+
+
+def load_checkpoint(path: str) -> int:
+    """
+    Загрузка ID последней обработанной записи из файла контрольной точки.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file).get('last_id', 0)
+
+
+def save_checkpoint(path: str, last_id: int, converted: int):
+    """
+    Сохранение контрольной точки.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'last_id': last_id, 'converted': converted}, file)
+    os.replace(tmp_path, path)
+
+
+def build_select_batch():
+    """
+    Запрос пакета записей с расшифровкой значений старого формата в SQL.
+    Значения, уже зашифрованные AES-GCM, возвращаются как NULL.
+    Строки пакета блокируются до конца транзакции, чтобы изменения профиля,
+    сделанные ботом между чтением и записью, не были перезаписаны старыми значениями.
+    """
+    decrypted = ",\n            ".join(
+        f"CASE WHEN {column} IS NOT NULL AND get_byte({column}, 0) <> :marker "
+        f"THEN pgp_sym_decrypt({column}, :key) END AS {column}"
+        for column in ENCRYPTED_COLUMNS
+    )
+    return text(f"""
+        SELECT id,
+            {decrypted}
+        FROM patients
+        WHERE id > :after_id
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE
+    """)
+
+
+def build_update():
+    """
+    Запрос обновления записи: NULL означает, что значение не меняется.
+    """
+    assignments = ", ".join(
+        f"{column} = COALESCE(:{column}, {column})" for column in ENCRYPTED_COLUMNS
+    )
+    return text(f"UPDATE patients SET {assignments} WHERE id = :id").bindparams(
+        *[bindparam(column, type_=LargeBinary) for column in ENCRYPTED_COLUMNS]
+    )
+
+
+def convert(batch_size: int, checkpoint_path: str, pause: float) -> int:
+    """
+    Перешифрование всех записей пациентов.
+
+    Args:
+        batch_size: Количество записей в одном пакете
+        checkpoint_path: Путь к файлу контрольной точки
+        pause: Пауза между пакетами в секундах
+
+    Returns:
+        int: Количество перешифрованных записей
+    """
+    cipher = create_cipher("aesgcm")
+    select_batch = build_select_batch()
+    update = build_update()
+
+    last_id = load_checkpoint(checkpoint_path)
+    if last_id:
+        logger.info(f"Продолжение с контрольной точки: id > {last_id}")
+
+    converted = 0
+    started = time.monotonic()
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select_batch, {
+                'marker': AESGCM_MARKER[0],
+                'key': PGP_KEY,
+                'after_id': last_id,
+                'batch_size': batch_size
+            }).mappings().all()
+
+            if not rows:
+                break
+
+            params = []
+            for row in rows:
+                values = {
+                    column: cipher.encrypt(row[column]) if row[column] is not None else None
+                    for column in ENCRYPTED_COLUMNS
+                }
+                if any(value is not None for value in values.values()):
+                    params.append({'id': row['id'], **values})
+
+            if params:
+                conn.execute(update, params)
+
+        last_id = rows[-1]['id']
+        converted += len(params)
+        save_checkpoint(checkpoint_path, last_id, converted)
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Обработано до id={last_id}, перешифровано записей: {converted} "
+                    f"({converted / elapsed:.0f} записей/с)")
+
+        if pause:
+            time.sleep(pause)
+
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перешифрование данных пациентов из pgcrypto в AES-GCM")
+    parser.add_argument("--batch-size", type=int, default=500, help="Размер пакета (по умолчанию 500)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Файл контрольной точки")
+    parser.add_argument("--pause", type=float, default=0.0, help="Пауза между пакетами в секундах")
+    parser.add_argument("--reset", action="store_true", help="Начать с начала таблицы, игнорируя контрольную точку")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    try:
+        converted = convert(args.batch_size, args.checkpoint, args.pause)
+        print(f"Перешифрование завершено. Перешифровано записей: {converted}")
+        log_pool_stats()
+    except KeyboardInterrupt:
+        print("Прервано. Повторный запуск продолжит работу с контрольной точки.")
+    except Exception as e:
+        logger.error(f"Ошибка при перешифровании данных: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@
 
 """
 Скрипт для инициализации базы данных PostgreSQL.
+Для новой базы данных создает расширение pgcrypto и таблицы по моделям и
+записывает последнюю ревизию Alembic, которую проверяет бот при запуске.
+Существующая база данных не изменяется: ее схема обновляется командой alembic upgrade head.
 """
 
 import sys
@@ -14,8 +17,8 @@ import traceback
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy import text
-from db.database import engine, Base
-from db.models import Patient, Service, Notification, WebhookEvent, Conversation
+from db.database import engine, init_db
+from db.schema_version import get_current_revisions, stamp_head
 from config import DB_HOST, DB_PORT, DB_NAME, DB_USER
 
 # Настройка логирования
@@ -34,23 +37,29 @@ def init_database():
         # Вывод информации о подключении (без пароля)
         logger.info(f"Подключение к базе данных: {DB_HOST}:{DB_PORT}/{DB_NAME} (пользователь: {DB_USER})")
         
-        # Создание соединения
-        conn = engine.connect()
-        logger.info("Соединение с базой данных установлено")
+        with engine.connect() as conn:
+            existing_schema = conn.execute(text("SELECT to_regclass('patients')")).scalar() is not None
+            revisions = get_current_revisions(conn)
         
-        # Создание расширения pgcrypto для шифрования
-        logger.info("Создание расширения pgcrypto...")
-        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto;"))
-        conn.commit()
-        logger.info("Расширение pgcrypto создано или уже существует")
+        # Существующая база данных обновляется только миграциями: таблицы, созданные
+        # по последним моделям, помешали бы миграциям, которые создают их сами
+        if revisions:
+            logger.info(f"Ревизия схемы: {', '.join(sorted(revisions))}. Для обновления выполните: alembic upgrade head")
+            return True
+        if existing_schema:
+            # Таблицы созданы до перехода на Alembic: миграции нужно применить, а не пропустить
+            logger.warning("Таблицы уже существуют, но миграции не применялись. Выполните: alembic upgrade head")
+            return True
         
-        # Создание таблиц
+        # Создание расширения pgcrypto, таблиц и секций webhook_events
         logger.info("Создание таблиц...")
-        Base.metadata.create_all(bind=engine)
+        init_db()
         
-        logger.info("База данных PostgreSQL успешно инициализирована")
-        conn.close()
+        # Новая база данных создана по моделям и соответствует последней ревизии
+        stamp_head()
+        logger.info("Записана последняя ревизия схемы Alembic")
         
+        logger.info("База данных PostgreSQL успешно инициализирована")
         return True
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {e}")
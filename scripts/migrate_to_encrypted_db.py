@@ -2,21 +2,42 @@
 # -*- coding: utf-8 -*-
 
 """
-Скрипт для миграции данных из незашифрованной базы данных в зашифрованную.
+Скрипт для переноса данных из старой базы SQLite (таблицы users и notifications,
+схема db/migrations/*.sql) в таблицы patients и notifications PostgreSQL
+с шифрованием конфиденциальных полей.
+
+Данные читаются порциями по возрастанию id. Порция записывается командой COPY
+во временную таблицу и переносится в целевую таблицу одним INSERT ... SELECT:
+для бэкенда pgcrypto все поля порции шифруются в этом же запросе, для aesgcm
+значения шифруются в процессе перед COPY. Слепые индексы и поисковые токены ФИО
+вычисляются сразу при переносе.
+
+После каждой порции ID последней перенесенной записи сохраняется в файл
+контрольной точки, поэтому после прерывания скрипт можно запустить повторно.
+Повторный перенос уже существующих записей пропускается: пациенты - по telegram_id,
+уведомления - по (appointment_id, telegram_id, message_id).
+
+Целевая схема должна быть создана заранее (alembic upgrade head или init_database.py).
 """
 
 import sys
 import os
-import logging
+import io
+import json
+import time
 import sqlite3
-import shutil
-from datetime import datetime
+import logging
+import argparse
+from datetime import date, datetime
+from tabulate import tabulate
 
 # Добавление корневой директории проекта в sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from pysqlcipher3 import dbapi2 as sqlcipher
-from config import DB_ENCRYPTION_KEY
+from db.database import engine
+from db.pool_stats import log_pool_stats
+from db.crypto import get_cipher
+from db.blind_index import blind_index_values, name_search_tokens
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,113 +46,391 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def migrate_to_encrypted_db():
+DEFAULT_SQLITE_PATH = "bot_database.db"
+DEFAULT_CHECKPOINT = "migrate_to_encrypted_db.checkpoint.json"
+DEFAULT_CHUNK_SIZE = 5000
+
+ENCRYPTED_COLUMNS = ['phone_number', 'first_name', 'last_name', 'third_name', 'birth_date']
+BLIND_INDEX_COLUMNS = ['phone_number_bidx', 'first_name_bidx', 'last_name_bidx', 'third_name_bidx']
+
+# Столбцы старой таблицы users в порядке чтения
+USER_COLUMNS = [
+    'id', 'telegram_id', 'amocrm_id', 'mis_id', *ENCRYPTED_COLUMNS,
+    'consent_notifications', 'consent_marketing', 'registration_date', 'last_activity', 'bot_state'
+]
+NOTIFICATION_COLUMNS = [
+    'id', 'telegram_id', 'appointment_id', 'message_id', 'status', 'sent_at', 'responded_at', 'cancel_reason'
+]
+
+# Временные таблицы очищаются после каждой порции (при COMMIT)
+PATIENTS_STAGE = "migrate_patients_stage"
+NOTIFICATIONS_STAGE = "migrate_notifications_stage"
+TOKENS_STAGE = "migrate_search_tokens_stage"
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    Загрузка ID последних перенесенных записей по таблицам из файла контрольной точки.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """
+    Сохранение контрольной точки.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+def copy_value(value) -> str:
+    """
+    Представление значения в текстовом формате COPY.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def copy_rows(cursor, table: str, columns: list, rows: list):
+    """
+    Загрузка строк в таблицу командой COPY.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def to_bool(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "t", "true", "yes")
+    return bool(value)
+
+
+def to_birth_date(value):
+    """
+    Дата рождения в формате YYYY-MM-DD (формат хранения EncryptedDate).
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        return None
+
+
+def iter_chunks(source: sqlite3.Connection, table: str, columns: list, after_id: int, chunk_size: int):
+    """
+    Постраничное чтение таблицы SQLite по возрастанию id.
+    """
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?"
+    while True:
+        rows = source.execute(query, (after_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]['id']
+
+
+class MigrationStats:
+    """
+    Счетчики переноса одной таблицы.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.read = 0
+        self.inserted = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def report_row(self) -> list:
+        return [self.name, self.read, self.inserted, self.read - self.inserted,
+                f"{self.elapsed:.1f}", f"{self.rate:.0f}"]
+
+
+def create_stage_tables(cursor, in_process: bool):
+    """
+    Создание временных таблиц для COPY.
+    Для aesgcm конфиденциальные поля загружаются уже зашифрованными (bytea),
+    для pgcrypto - открытым текстом и шифруются при переносе в patients.
+    """
+    pii_type = "BYTEA" if in_process else "TEXT"
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {PATIENTS_STAGE} (
+            telegram_id BIGINT NOT NULL,
+            amocrm_id INTEGER,
+            mis_id INTEGER,
+            {", ".join(f"{column} {pii_type}" for column in ENCRYPTED_COLUMNS)},
+            {", ".join(f"{column} BYTEA" for column in BLIND_INDEX_COLUMNS)},
+            consent_notifications BOOLEAN,
+            consent_marketing BOOLEAN,
+            bot_state VARCHAR(50),
+            registered_in_bot BOOLEAN,
+            registration_date TIMESTAMP,
+            last_activity TIMESTAMP
+        ) ON COMMIT DELETE ROWS
+    """)
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {TOKENS_STAGE} (
+            telegram_id BIGINT NOT NULL,
+            token BYTEA NOT NULL
+        ) ON COMMIT DELETE ROWS
+    """)
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {NOTIFICATIONS_STAGE} (
+            telegram_id BIGINT NOT NULL,
+            appointment_id INTEGER NOT NULL,
+            message_id BIGINT NOT NULL,
+            status VARCHAR(20),
+            sent_at TIMESTAMP,
+            responded_at TIMESTAMP,
+            cancel_reason VARCHAR(255)
+        ) ON COMMIT DELETE ROWS
+    """)
+
+
+def build_patients_insert(cipher) -> str:
+    """
+    Перенос порции пациентов из временной таблицы с шифрованием в том же запросе.
+    Пациенты, уже существующие в PostgreSQL (по telegram_id), не изменяются.
+    """
+    if cipher.in_process:
+        encrypted = ", ".join(ENCRYPTED_COLUMNS)
+    else:
+        # Для версионированного ключа перед сообщением PGP записывается заголовок с ID ключа
+        prefix = "%(header)s || " if cipher.header is not None else ""
+        encrypted = ", ".join(f"{prefix}pgp_sym_encrypt({column}, %(key)s)" for column in ENCRYPTED_COLUMNS)
+    return f"""
+        WITH inserted AS (
+            INSERT INTO patients (
+                telegram_id, amocrm_id, mis_id, {", ".join(ENCRYPTED_COLUMNS)}, {", ".join(BLIND_INDEX_COLUMNS)},
+                consent_notifications, consent_marketing, bot_state, registered_in_bot,
+                registration_date, last_activity, initial_message_sent, created_at
+            )
+            SELECT
+                telegram_id, amocrm_id, mis_id, {encrypted}, {", ".join(BLIND_INDEX_COLUMNS)},
+                COALESCE(consent_notifications, false), COALESCE(consent_marketing, false),
+                COALESCE(bot_state, 'new'), registered_in_bot,
+                registration_date, COALESCE(last_activity, now() AT TIME ZONE 'utc'), false,
+                COALESCE(registration_date, now() AT TIME ZONE 'utc')
+            FROM {PATIENTS_STAGE}
+            ON CONFLICT (telegram_id) DO NOTHING
+            RETURNING id, telegram_id
+        ), tokens AS (
+            INSERT INTO patient_search_tokens (token, patient_id)
+            SELECT DISTINCT t.token, i.id
+            FROM {TOKENS_STAGE} t JOIN inserted i ON i.telegram_id = t.telegram_id
+        )
+        SELECT count(*) FROM inserted
+    """
+
+
+NOTIFICATIONS_INSERT = f"""
+    INSERT INTO notifications (
+        patient_id, telegram_id, appointment_id, message_id, status, sent_at, responded_at, cancel_reason
+    )
+    SELECT p.id, s.telegram_id, s.appointment_id, s.message_id, COALESCE(s.status, 'pending'),
+           COALESCE(s.sent_at, now() AT TIME ZONE 'utc'), s.responded_at, s.cancel_reason
+    FROM {NOTIFICATIONS_STAGE} s
+    JOIN patients p ON p.telegram_id = s.telegram_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM notifications n
+        WHERE n.appointment_id = s.appointment_id
+          AND n.telegram_id = s.telegram_id
+          AND n.message_id = s.message_id
+    )
+"""
+
+
+def patient_stage_rows(rows: list, cipher) -> tuple:
+    """
+    Подготовка порции пользователей к COPY: шифрование (для aesgcm),
+    слепые индексы и поисковые токены ФИО.
+
+    Returns:
+        tuple: (строки временной таблицы пациентов, строки временной таблицы токенов)
+    """
+    patients = []
+    tokens = []
+    for row in rows:
+        plain = {
+            column: (str(row[column]).strip() or None) if row[column] is not None else None
+            for column in ENCRYPTED_COLUMNS
+        }
+        plain['birth_date'] = to_birth_date(row['birth_date'])
+
+        indexes = blind_index_values(plain)
+        encrypted = [
+            cipher.encrypt(plain[column]) if cipher.in_process and plain[column] is not None else plain[column]
+            for column in ENCRYPTED_COLUMNS
+        ]
+        patients.append([
+            row['telegram_id'], row['amocrm_id'], row['mis_id'], *encrypted,
+            *[indexes[column] for column in BLIND_INDEX_COLUMNS],
+            to_bool(row['consent_notifications']), to_bool(row['consent_marketing']),
+            row['bot_state'], row['bot_state'] == "active",
+            row['registration_date'], row['last_activity']
+        ])
+        tokens.extend(
+            (row['telegram_id'], token)
+            for token in name_search_tokens(plain['last_name'], plain['first_name'], plain['third_name'])
+        )
+    return patients, tokens
+
+
+def migrate_users(source, target, checkpoint: dict, checkpoint_path: str, chunk_size: int) -> MigrationStats:
+    """
+    Перенос таблицы users в patients.
+    """
+    cipher = get_cipher()
+    stats = MigrationStats("users -> patients")
+    insert_patients = build_patients_insert(cipher)
+    params = None if cipher.in_process else {'key': cipher.active_key, 'header': cipher.header}
+    stage_columns = [
+        'telegram_id', 'amocrm_id', 'mis_id', *ENCRYPTED_COLUMNS, *BLIND_INDEX_COLUMNS,
+        'consent_notifications', 'consent_marketing', 'bot_state', 'registered_in_bot',
+        'registration_date', 'last_activity'
+    ]
+
+    after_id = checkpoint.get('users', 0)
+    if after_id:
+        logger.info(f"users: продолжение с контрольной точки, id > {after_id}")
+
+    for rows in iter_chunks(source, "users", USER_COLUMNS, after_id, chunk_size):
+        patients, tokens = patient_stage_rows(rows, cipher)
+        with target.cursor() as cursor:
+            copy_rows(cursor, PATIENTS_STAGE, stage_columns, patients)
+            if tokens:
+                copy_rows(cursor, TOKENS_STAGE, ['telegram_id', 'token'], tokens)
+            cursor.execute(insert_patients, params)
+            inserted = cursor.fetchone()[0]
+        target.commit()
+
+        checkpoint['users'] = rows[-1]['id']
+        save_checkpoint(checkpoint_path, checkpoint)
+        stats.read += len(rows)
+        stats.inserted += inserted
+        logger.info(f"users: перенесено до id={checkpoint['users']}, прочитано {stats.read}, "
+                    f"добавлено {stats.inserted} ({stats.rate:.0f} строк/с)")
+
+    return stats
+
+
+def migrate_notifications(source, target, checkpoint: dict, checkpoint_path: str, chunk_size: int) -> MigrationStats:
     """
-    Миграция данных из незашифрованной базы данных в зашифрованную.
+    Перенос таблицы notifications. Пациент определяется по telegram_id;
+    уведомления пользователей, отсутствующих в patients, пропускаются.
+    """
+    stats = MigrationStats("notifications -> notifications")
+
+    after_id = checkpoint.get('notifications', 0)
+    if after_id:
+        logger.info(f"notifications: продолжение с контрольной точки, id > {after_id}")
+
+    for rows in iter_chunks(source, "notifications", NOTIFICATION_COLUMNS, after_id, chunk_size):
+        with target.cursor() as cursor:
+            copy_rows(cursor, NOTIFICATIONS_STAGE, NOTIFICATION_COLUMNS[1:],
+                      [[row[column] for column in NOTIFICATION_COLUMNS[1:]] for row in rows])
+            cursor.execute(NOTIFICATIONS_INSERT)
+            inserted = cursor.rowcount
+        target.commit()
+
+        checkpoint['notifications'] = rows[-1]['id']
+        save_checkpoint(checkpoint_path, checkpoint)
+        stats.read += len(rows)
+        stats.inserted += inserted
+        logger.info(f"notifications: перенесено до id={checkpoint['notifications']}, прочитано {stats.read}, "
+                    f"добавлено {stats.inserted} ({stats.rate:.0f} строк/с)")
+
+    return stats
+
+
+def migrate(sqlite_path: str, checkpoint_path: str, chunk_size: int) -> list:
     """
-    # Путь к файлу базы данных
-    db_path = "bot_database.db"
-    backup_path = f"bot_database_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-    
-    # Проверка существования базы данных
-    if not os.path.exists(db_path):
-        logger.error(f"База данных {db_path} не найдена")
-        return False
-    
+    Перенос данных из SQLite в PostgreSQL.
+
+    Args:
+        sqlite_path: Путь к файлу базы данных SQLite
+        checkpoint_path: Путь к файлу контрольной точки
+        chunk_size: Количество записей в одной порции
+
+    Returns:
+        list: Статистика переноса по таблицам
+    """
+    if not os.path.exists(sqlite_path):
+        raise FileNotFoundError(f"База данных {sqlite_path} не найдена")
+
+    # Источник открывается только для чтения
+    source = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    source.row_factory = sqlite3.Row
+    target = engine.raw_connection()
+    checkpoint = load_checkpoint(checkpoint_path)
+
     try:
-        # Создание резервной копии
-        shutil.copy2(db_path, backup_path)
-        logger.info(f"Создана резервная копия базы данных: {backup_path}")
-        
-        # Подключение к незашифрованной базе данных
-        conn_src = sqlite3.connect(db_path)
-        cursor_src = conn_src.cursor()
-        
-        # Получение списка таблиц
-        cursor_src.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor_src.fetchall()
-        
-        if not tables:
-            logger.warning("В базе данных нет таблиц")
-            conn_src.close()
-            return False
-        
-        # Создание временной зашифрованной базы данных
-        temp_db_path = "temp_encrypted.db"
-        if os.path.exists(temp_db_path):
-            os.remove(temp_db_path)
-        
-        conn_dest = sqlcipher.connect(temp_db_path)
-        cursor_dest = conn_dest.cursor()
-        
-        # Установка ключа шифрования
-        cursor_dest.execute(f"PRAGMA key = '{DB_ENCRYPTION_KEY}'")
-        
-        # Миграция схемы и данных для каждой таблицы
-        for table in tables:
-            table_name = table[0]
-            
-            # Пропуск системных таблиц SQLite
-            if table_name.startswith('sqlite_'):
-                continue
-            
-            logger.info(f"Миграция таблицы: {table_name}")
-            
-            # Получение схемы таблицы
-            cursor_src.execute(f"SELECT sql FROM sqlite_master WHERE type='table' AND name='{table_name}';")
-            create_table_sql = cursor_src.fetchone()[0]
-            
-            # Создание таблицы в зашифрованной базе данных
-            cursor_dest.execute(create_table_sql)
-            
-            # Получение данных из таблицы
-            cursor_src.execute(f"SELECT * FROM {table_name};")
-            rows = cursor_src.fetchall()
-            
-            if rows:
-                # Получение имен столбцов
-                cursor_src.execute(f"PRAGMA table_info({table_name});")
-                columns = cursor_src.fetchall()
-                column_count = len(columns)
-                
-                # Создание заполнителей для SQL запроса (?, ?, ...)
-                placeholders = ', '.join(['?' for _ in range(column_count)])
-                
-                # Вставка данных в зашифрованную базу данных
-                for row in rows:
-                    cursor_dest.execute(f"INSERT INTO {table_name} VALUES ({placeholders});", row)
-            
-            logger.info(f"Мигрировано {len(rows)} записей из таблицы {table_name}")
-        
-        # Фиксация изменений
-        conn_dest.commit()
-        
-        # Закрытие соединений
-        conn_src.close()
-        conn_dest.close()
-        
-        # Замена оригинальной базы данных на зашифрованную
-        os.remove(db_path)
-        os.rename(temp_db_path, db_path)
-        
-        logger.info("Миграция в зашифрованную базу данных успешно завершена")
-        return True
-        
+        with target.cursor() as cursor:
+            create_stage_tables(cursor, get_cipher().in_process)
+        target.commit()
+
+        # Уведомления переносятся после пациентов, так как ссылаются на них
+        return [
+            migrate_users(source, target, checkpoint, checkpoint_path, chunk_size),
+            migrate_notifications(source, target, checkpoint, checkpoint_path, chunk_size),
+        ]
+    finally:
+        target.close()
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос данных из SQLite в PostgreSQL с шифрованием")
+    parser.add_argument("--sqlite", default=DEFAULT_SQLITE_PATH,
+                        help=f"Путь к базе данных SQLite (по умолчанию {DEFAULT_SQLITE_PATH})")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Размер порции (по умолчанию {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Файл контрольной точки")
+    parser.add_argument("--reset", action="store_true", help="Начать с начала, игнорируя контрольную точку")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    try:
+        report = migrate(args.sqlite, args.checkpoint, args.chunk_size)
+        print(tabulate([stats.report_row() for stats in report],
+                       headers=["Таблица", "Прочитано", "Добавлено", "Пропущено", "Время, с", "Строк/с"],
+                       tablefmt="grid"))
+        log_pool_stats()
+    except KeyboardInterrupt:
+        print("Прервано. Повторный запуск продолжит перенос с контрольной точки.")
     except Exception as e:
-        logger.error(f"Ошибка при миграции базы данных: {e}")
-        return False
+        logger.error(f"Ошибка при переносе данных: {e}")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
-    print("Миграция данных в зашифрованную базу данных")
-    print("ВНИМАНИЕ: Перед продолжением убедитесь, что у вас есть резервная копия базы данных!")
-    print("Продолжить? (y/n)")
-    
-    choice = input().lower()
-    if choice == 'y':
-        success = migrate_to_encrypted_db()
-        if success:
-            print("Миграция успешно завершена")
-        else:
-            print("Миграция не удалась. Проверьте логи для получения дополнительной информации.")
-    else:
-        print("Миграция отменена")
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт для онлайн-ротации ключа шифрования конфиденциальных полей пациентов.
+
+Перешифровывает активным ключом активного бэкенда (ENCRYPTION_BACKEND) все значения,
+зашифрованные другим ключом или другим бэкендом. Таблицы patients, conversations
+и patient_messages обрабатываются пакетами по возрастанию id; строки пакета блокируются
+(SELECT ... FOR UPDATE) только на время короткой транзакции, поэтому бот продолжает работу.
+Номер последней обработанной записи каждой таблицы сохраняется в файл контрольной точки,
+после прерывания скрипт можно запустить повторно.
+
+Порядок ротации ключа pgcrypto:
+    1. Добавить новый ключ в PGP_KEYS, сохранив старый, и перезапустить все
+       процессы бота (значения нового ключа теперь читаются везде);
+    2. Задать PGP_KEY_ID нового ключа и снова перезапустить процессы бота
+       (новые значения шифруются новым ключом);
+    3. Запустить этот скрипт; --dry-run показывает количество оставшихся записей;
+    4. Когда не осталось записей со старым ключом, удалить его из PGP_KEYS.
+Для aesgcm порядок тот же с переменными AES_KEYS и AES_KEY_ID.
+"""
+
+import sys
+import os
+import json
+import time
+import logging
+import argparse
+from sqlalchemy import select, update, func, or_
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import SessionLocal
+from db.pool_stats import log_pool_stats
+from db.crypto import get_cipher, needs_rotation_expression
+from db.models import Patient, Conversation, PatientMessage
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Модель и ее зашифрованные столбцы
+ENCRYPTED_COLUMNS = [
+    (Patient, ['phone_number', 'first_name', 'last_name', 'third_name', 'birth_date']),
+    (Conversation, ['last_message']),
+    (PatientMessage, ['text']),
+]
+DEFAULT_CHECKPOINT = "rotate_encryption_key.checkpoint.json"
+
+
+def rotation_target(cipher) -> str:
+    """
+    Обозначение активного бэкенда и ключа для контрольной точки.
+    """
+    return f"{cipher.name}:{cipher.key_id}"
+
+
+def load_checkpoint(path: str, target: str) -> dict:
+    """
+    Загрузка ID последних обработанных записей по таблицам.
+    Контрольная точка другой ротации (другого ключа) игнорируется.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        checkpoint = json.load(file)
+    if checkpoint.get('target') != target:
+        logger.info(f"Контрольная точка относится к ротации {checkpoint.get('target')}, начинаем с начала")
+        return {}
+    return checkpoint.get('tables', {})
+
+
+def save_checkpoint(path: str, target: str, tables: dict):
+    """
+    Сохранение контрольной точки.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'target': target, 'tables': tables}, file)
+    os.replace(tmp_path, path)
+
+
+def needs_rotation(cipher, model, columns: list):
+    """
+    Условие отбора записей, хотя бы одно поле которых зашифровано не активным ключом.
+    """
+    return or_(*[
+        needs_rotation_expression(cipher, model.__table__.c[column])
+        for column in columns
+    ])
+
+
+def count_remaining(cipher) -> dict:
+    """
+    Количество записей каждой таблицы, которые еще нужно перешифровать.
+    """
+    db = SessionLocal()
+    try:
+        return {
+            model.__tablename__: db.scalar(
+                select(func.count()).select_from(model).where(needs_rotation(cipher, model, columns))
+            )
+            for model, columns in ENCRYPTED_COLUMNS
+        }
+    finally:
+        db.close()
+
+
+def rotate_table(model, columns: list, batch_size: int, pause: float, progress: dict,
+                 save_progress) -> int:
+    """
+    Перешифрование записей одной таблицы активным ключом.
+
+    Args:
+        model: Модель таблицы
+        columns: Зашифрованные столбцы
+        batch_size: Количество записей в одном пакете
+        pause: Пауза между пакетами в секундах (снижение нагрузки на базу данных)
+        progress: Прогресс таблицы из контрольной точки (last_id, rotated), обновляется на месте
+        save_progress: Функция сохранения контрольной точки
+
+    Returns:
+        int: Количество перешифрованных записей
+    """
+    cipher = get_cipher()
+    condition = needs_rotation(cipher, model, columns)
+    # Для обновления пакета нужен полный первичный ключ (у секционированных таблиц он составной)
+    key_columns = [column.key for column in model.__mapper__.primary_key]
+
+    last_id = progress.setdefault('last_id', 0)
+    progress.setdefault('rotated', 0)
+    if last_id:
+        logger.info(f"{model.__tablename__}: продолжение с контрольной точки: id > {last_id}")
+
+    rotated = 0
+    started = time.monotonic()
+
+    while True:
+        db = SessionLocal()
+        try:
+            # Значения расшифровываются в этом же запросе любым из ключей;
+            # блокировка строк не дает перезаписать изменения, сделанные ботом
+            rows = db.execute(
+                select(*[getattr(model, column) for column in key_columns + columns])
+                .where(model.id > last_id, condition)
+                .order_by(model.id)
+                .limit(batch_size)
+                .with_for_update()
+            ).all()
+
+            if not rows:
+                break
+
+            # При записи значения шифруются активным ключом (EncryptedText)
+            db.execute(update(model), [
+                {column: getattr(row, column) for column in key_columns + columns}
+                for row in rows
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+        last_id = progress['last_id'] = rows[-1].id
+        rotated += len(rows)
+        progress['rotated'] += len(rows)
+        save_progress()
+
+        elapsed = time.monotonic() - started
+        logger.info(f"{model.__tablename__}: обработано до id={last_id}, перешифровано записей: {rotated} "
+                    f"({rotated / elapsed:.0f} записей/с)")
+
+        if pause:
+            time.sleep(pause)
+
+    return rotated
+
+
+def rotate(batch_size: int, checkpoint_path: str, pause: float) -> int:
+    """
+    Перешифрование записей всех таблиц с зашифрованными полями активным ключом.
+
+    Args:
+        batch_size: Количество записей в одном пакете
+        checkpoint_path: Путь к файлу контрольной точки
+        pause: Пауза между пакетами в секундах (снижение нагрузки на базу данных)
+
+    Returns:
+        int: Количество перешифрованных записей
+    """
+    target = rotation_target(get_cipher())
+    tables = load_checkpoint(checkpoint_path, target)
+
+    rotated = 0
+    for model, columns in ENCRYPTED_COLUMNS:
+        progress = tables.setdefault(model.__tablename__, {})
+        rotated += rotate_table(
+            model, columns, batch_size, pause, progress,
+            lambda: save_checkpoint(checkpoint_path, target, tables)
+        )
+
+    return rotated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ротация ключа шифрования данных пациентов")
+    parser.add_argument("--batch-size", type=int, default=500, help="Размер пакета (по умолчанию 500)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Файл контрольной точки")
+    parser.add_argument("--pause", type=float, default=0.1, help="Пауза между пакетами в секундах (по умолчанию 0.1)")
+    parser.add_argument("--reset", action="store_true", help="Начать с начала таблицы, игнорируя контрольную точку")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать количество записей для перешифрования")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    try:
+        cipher = get_cipher()
+        if args.dry_run:
+            remaining = count_remaining(cipher)
+            print(f"Записей для перешифрования ключом {rotation_target(cipher)}: {sum(remaining.values())}")
+            for table, count in remaining.items():
+                print(f"  {table}: {count}")
+            return
+
+        rotated = rotate(args.batch_size, args.checkpoint, args.pause)
+        print(f"Ротация ключа завершена. Перешифровано записей: {rotated}")
+        log_pool_stats()
+    except KeyboardInterrupt:
+        print("Прервано. Повторный запуск продолжит работу с контрольной точки.")
+    except Exception as e:
+        logger.error(f"Ошибка при ротации ключа шифрования: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
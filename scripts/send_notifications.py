@@ -12,17 +12,17 @@ import os
 import asyncio
 from datetime import datetime, timedelta
 from telegram import Bot, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 
 # Добавление корневой директории проекта в sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import TELEGRAM_BOT_TOKEN
-from db.database import SessionLocal
+from db.database import AsyncSessionLocal, AsyncReadOnlySessionLocal
+from db.pool_stats import log_pool_stats
 from db.models import Patient
-from bot.services.mis_service import MISService
+from bot.services.mis_service import MISService, mis_client
 from bot.services.notification_service import NotificationService
-from bot.services.patient_service import get_decrypted_patient_data
 
 # Настройка логирования
 logging.basicConfig(
@@ -37,23 +37,28 @@ async def send_appointment_reminders():
     Отправка напоминаний о предстоящих приемах.
     """
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     mis_service = MISService()
     notification_service = NotificationService(db)
     
     try:
-        # Получение пациентов, которые согласились на уведомления
-        patients = db.query(Patient).filter(Patient.consent_notifications == True).all()
+        # Получение пациентов, которые согласились на уведомления и привязаны к МИС
+        # (условие совпадает с частичным индексом ix_patients_notifiable).
+        # Выборка выполняется на реплике, уведомления записываются в основную базу
+        read_db = AsyncReadOnlySessionLocal()
+        try:
+            # Выбираются только нужные столбцы, без расшифровки персональных данных
+            patients = (await read_db.execute(
+                select(Patient.id, Patient.mis_id, Patient.telegram_id, Patient.telegram_chat_id)
+                .where(Patient.consent_notifications == True, Patient.mis_id.isnot(None))
+                .order_by(Patient.id)
+            )).all()
+        finally:
+            await read_db.close()
         
         for patient in patients:
-            # Получаем расшифрованные данные пациента
-            patient_data = get_decrypted_patient_data(db, patient)
-            
-            if not patient_data.get('mis_id'):
-                continue
-            
             # Получение предстоящих приемов из МИС
-            appointments = await mis_service.get_appointments(patient_data.get('mis_id'))
+            appointments = await mis_service.get_appointments(patient.mis_id)
             if not appointments:
                 continue
             
@@ -86,7 +91,7 @@ async def send_appointment_reminders():
                 )
                 
                 # Отправляем сообщение с кнопками
-                chat_id = patient_data.get('telegram_chat_id') or patient_data.get('telegram_id')
+                chat_id = patient.telegram_chat_id or patient.telegram_id
                 sent_message = await bot.send_message(
                     chat_id=chat_id,
                     text=message,
@@ -94,21 +99,29 @@ async def send_appointment_reminders():
                 )
                 
                 # Сохраняем информацию об отправленном уведомлении
-                await notification_service.create_notification(
-                    patient_id=patient_data.get('id'),
-                    telegram_id=patient_data.get('telegram_id'),
+                notification = await notification_service.create_notification(
+                    patient_id=patient.id,
+                    telegram_id=patient.telegram_id,
                     appointment_id=appointment_id,
                     message_id=sent_message.message_id
                 )
+                if notification:
+                    await db.commit()
                 
-                logger.info(f"Отправлено напоминание пациенту {patient_data.get('telegram_id')} о приеме завтра в {time}")
+                logger.info(f"Отправлено напоминание пациенту {patient.telegram_id} о приеме завтра в {time}")
     
     except Exception as e:
         logger.error(f"Ошибка при отправке напоминаний: {e}")
     finally:
-        db.close()
+        await db.close()
+        log_pool_stats()
+
+async def main():
+    # Все запросы к МИС выполняются через один пул соединений
+    async with mis_client():
+        await send_appointment_reminders()
 
 if __name__ == "__main__":
     logger.info("Запуск скрипта отправки уведомлений")
-    asyncio.run(send_appointment_reminders())
+    asyncio.run(main())
     logger.info("Скрипт отправки уведомлений завершен")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт инкрементальной синхронизации истории визитов пациентов из МИС в таблицу services.
+Может быть запущен по расписанию через cron или другой планировщик.
+
+Для каждого пациента, привязанного к МИС (mis_id), запрашиваются визиты начиная
+с его отметки синхронизации (patients.visits_synced_until) минус MIS_SYNC_LOOKBACK_DAYS
+дней или с общей даты --since; при первой синхронизации - за все время.
+Пациенты обрабатываются страницами по возрастанию id, запросы к МИС внутри страницы
+выполняются параллельно (не более --concurrency одновременно).
+
+Визиты страницы записываются запросом INSERT ... ON CONFLICT DO UPDATE ... WHERE,
+который изменяет существующую строку только при отличии данных, поэтому неизмененные
+визиты не перезаписываются. Отметки синхронизации пациентов обновляются в той же
+транзакции и только для пациентов, визиты которых успешно получены.
+
+Пример:
+    python scripts/sync_mis_visits.py --concurrency 10
+"""
+
+import sys
+import os
+import time
+import asyncio
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+from tabulate import tabulate
+from sqlalchemy import select, update, values, column, tuple_, literal_column, Integer, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MIS_SYNC_CONCURRENCY, MIS_SYNC_LOOKBACK_DAYS, MIS_HTTP_MAX_CONNECTIONS
+from db.database import async_engine, AsyncReadOnlySessionLocal
+from db.pool_stats import log_pool_stats
+from db.models import Patient, Service
+from bot.services.mis_service import MISService, mis_client
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+SOURCE = "mis"
+DEFAULT_PAGE_SIZE = 200
+# Максимальное количество визитов в одном запросе INSERT
+UPSERT_CHUNK_SIZE = 1000
+# Название услуги, если МИС не вернула его для визита
+DEFAULT_SERVICE_NAME = "Прием специалиста"
+# Столбцы визита, изменение которых в МИС обновляет строку services
+VISIT_COLUMNS = ('date', 'service_name', 'doctor_name')
+
+
+class SyncStats:
+    """
+    Счетчики синхронизации.
+    """
+
+    def __init__(self):
+        self.patients = 0
+        self.failed = 0
+        self.fetched = 0
+        self.inserted = 0
+        self.updated = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def unchanged(self) -> int:
+        return self.fetched - self.inserted - self.updated
+
+    def rate(self, count: int) -> str:
+        return f"{count / self.elapsed:.1f}" if self.elapsed else "0.0"
+
+    def report(self) -> str:
+        return tabulate([
+            ["Пациентов обработано", self.patients, ""],
+            ["Ошибок запроса к МИС", self.failed, ""],
+            ["Визитов получено", self.fetched, self.rate(self.fetched)],
+            ["Добавлено", self.inserted, self.rate(self.inserted)],
+            ["Обновлено", self.updated, self.rate(self.updated)],
+            ["Без изменений", self.unchanged, ""],
+        ], headers=["", "Количество", "В секунду"], tablefmt="grid") + f"\nВремя: {self.elapsed:.1f} с"
+
+
+def parse_visit(patient_id: int, appointment: dict, now: datetime) -> dict:
+    """
+    Строка таблицы services по визиту из ответа МИС.
+
+    Args:
+        patient_id: ID пациента
+        appointment: Визит из ответа getAppointments
+        now: Время синхронизации
+
+    Returns:
+        dict: Значения столбцов или None, если в визите нет ID или даты
+    """
+    try:
+        external_id = int(appointment['id'])
+        visit_date = datetime.fromisoformat(appointment['date']).date()
+    except (KeyError, TypeError, ValueError):
+        logger.warning(f"Пропущен визит пациента {patient_id} без ID или даты: {appointment.get('id')}")
+        return None
+
+    doctor_name = appointment.get('doctor_name')
+    return {
+        'patient_id': patient_id,
+        'source': SOURCE,
+        'external_id': external_id,
+        'date': visit_date,
+        'service_name': (appointment.get('service_name') or DEFAULT_SERVICE_NAME)[:255],
+        'doctor_name': doctor_name[:255] if doctor_name else None,
+        'updated_at': now,
+    }
+
+
+def build_visits_upsert(rows: list):
+    """
+    Запрос записи визитов: новые визиты добавляются, существующие обновляются
+    только при отличии данных. RETURNING возвращает по строке на каждый добавленный
+    или обновленный визит (xmax = 0 у добавленной строки).
+    """
+    table = Service.__table__
+    stmt = pg_insert(table).values(rows)
+    changed = tuple_(*[table.c[name] for name in VISIT_COLUMNS]).is_distinct_from(
+        tuple_(*[stmt.excluded[name] for name in VISIT_COLUMNS])
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.patient_id, table.c.source, table.c.external_id],
+        set_={**{name: stmt.excluded[name] for name in VISIT_COLUMNS}, 'updated_at': stmt.excluded.updated_at},
+        where=changed
+    ).returning(literal_column("xmax = 0").label("inserted"))
+
+
+def visits_date_from(synced_until: date, since: date, full: bool) -> date:
+    """
+    Начало периода запроса визитов пациента.
+    """
+    if full:
+        return None
+    if since is not None:
+        return since
+    if synced_until is not None:
+        return synced_until - timedelta(days=MIS_SYNC_LOOKBACK_DAYS)
+    return None
+
+
+async def fetch_visits(mis_service: MISService, semaphore: asyncio.Semaphore, patient,
+                       date_from: date, now: datetime):
+    """
+    Получение визитов пациента из МИС.
+
+    Returns:
+        tuple: ID пациента и список строк services (None при ошибке запроса)
+    """
+    async with semaphore:
+        appointments = await mis_service.get_appointments(
+            patient.mis_id,
+            date_from=date_from.isoformat() if date_from else None
+        )
+
+    if appointments is None:
+        return patient.id, None
+
+    rows = {}
+    for appointment in appointments:
+        row = parse_visit(patient.id, appointment, now)
+        if row is not None:
+            # Повторяющийся визит нельзя обновить дважды в одном INSERT ... ON CONFLICT
+            rows[row['external_id']] = row
+    return patient.id, list(rows.values())
+
+
+async def write_page(results: list, synced_until: date, stats: SyncStats):
+    """
+    Запись визитов страницы пациентов и их отметок синхронизации в одной транзакции.
+
+    Args:
+        results: Пары (ID пациента, строки services)
+        synced_until: Новая отметка синхронизации
+        stats: Счетчики синхронизации
+    """
+    rows = [row for _, patient_rows in results for row in patient_rows]
+    async with async_engine.begin() as conn:
+        for offset in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            result = await conn.execute(build_visits_upsert(rows[offset:offset + UPSERT_CHUNK_SIZE]))
+            for written in result.scalars():
+                if written:
+                    stats.inserted += 1
+                else:
+                    stats.updated += 1
+
+        synced = values(
+            column('id', Integer),
+            column('visits_synced_until', Date),
+            name='synced'
+        ).data([(patient_id, synced_until) for patient_id, _ in results])
+        await conn.execute(
+            update(Patient.__table__)
+            .where(Patient.id == synced.c.id)
+            .values(visits_synced_until=synced.c.visits_synced_until)
+        )
+
+    stats.fetched += len(rows)
+
+
+async def sync_visits(concurrency: int, page_size: int, since: date = None, full: bool = False) -> SyncStats:
+    """
+    Синхронизация визитов всех пациентов, привязанных к МИС.
+
+    Args:
+        concurrency: Максимальное количество одновременных запросов к МИС
+        page_size: Количество пациентов на странице
+        since: Общая дата начала периода вместо отметок синхронизации пациентов
+        full: Запросить визиты за все время
+
+    Returns:
+        SyncStats: Счетчики синхронизации
+    """
+    mis_service = MISService()
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = SyncStats()
+    last_id = 0
+
+    while True:
+        # Список пациентов читается с реплики, визиты записываются в основную базу
+        read_db = AsyncReadOnlySessionLocal()
+        try:
+            patients = (await read_db.execute(
+                select(Patient.id, Patient.mis_id, Patient.visits_synced_until)
+                .where(Patient.mis_id.isnot(None), Patient.id > last_id)
+                .order_by(Patient.id)
+                .limit(page_size)
+            )).all()
+        finally:
+            await read_db.close()
+
+        if not patients:
+            break
+
+        # Отметка ставится на дату начала запроса, чтобы визиты, добавленные в МИС
+        # во время синхронизации, попали в следующий период
+        now = datetime.utcnow()
+        results = await asyncio.gather(*[
+            fetch_visits(mis_service, semaphore, patient,
+                         visits_date_from(patient.visits_synced_until, since, full), now)
+            for patient in patients
+        ])
+
+        succeeded = [(patient_id, rows) for patient_id, rows in results if rows is not None]
+        stats.patients += len(patients)
+        stats.failed += len(patients) - len(succeeded)
+        if succeeded:
+            await write_page(succeeded, now.date(), stats)
+
+        last_id = patients[-1].id
+        logger.info(f"Обработаны пациенты до id={last_id}: добавлено {stats.inserted}, "
+                    f"обновлено {stats.updated}, без изменений {stats.unchanged} "
+                    f"({(stats.inserted + stats.updated) / stats.elapsed:.1f} записей/с)")
+
+    return stats
+
+
+async def run(args) -> SyncStats:
+    try:
+        async with mis_client():
+            return await sync_visits(args.concurrency, args.page_size, args.since, args.full)
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синхронизация истории визитов пациентов из МИС")
+    parser.add_argument("--concurrency", type=int, default=MIS_SYNC_CONCURRENCY,
+                        help=f"Количество одновременных запросов к МИС (по умолчанию {MIS_SYNC_CONCURRENCY})")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Количество пациентов на странице (по умолчанию {DEFAULT_PAGE_SIZE})")
+    period = parser.add_mutually_exclusive_group()
+    period.add_argument("--since", type=date.fromisoformat,
+                        help="Запросить визиты с указанной даты (YYYY-MM-DD) для всех пациентов")
+    period.add_argument("--full", action="store_true", help="Запросить визиты за все время, игнорируя отметки синхронизации")
+    args = parser.parse_args()
+
+    if args.concurrency > MIS_HTTP_MAX_CONNECTIONS:
+        logger.warning(f"--concurrency {args.concurrency} больше размера пула соединений МИС "
+                       f"MIS_HTTP_MAX_CONNECTIONS={MIS_HTTP_MAX_CONNECTIONS}: лишние запросы будут ждать соединения")
+
+    try:
+        stats = asyncio.run(run(args))
+        print(stats.report())
+        log_pool_stats()
+    except KeyboardInterrupt:
+        print("Прервано. Повторный запуск продолжит работу с отметок синхронизации пациентов.")
+    except Exception as e:
+        logger.error(f"Ошибка при синхронизации визитов из МИС: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
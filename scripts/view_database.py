@@ -3,19 +3,32 @@
 
 """
 Скрипт для просмотра данных в базе данных PostgreSQL.
+Чтение выполняется на реплике (DB_REPLICA_HOST), если она настроена.
+
+Выгрузка расшифрованных данных для аналитики:
+    python scripts/view_database.py patients --export patients.csv --columns id,first_name,birth_date
+    python scripts/view_database.py services --export services.parquet --where date>=2026-01-01
 """
 
 import sys
 import os
+import re
 import logging
+import argparse
+import operator
+import csv
+import json
+import time
 from datetime import datetime
 from tabulate import tabulate
+from sqlalchemy import select, cast, literal, String, Integer, BigInteger, Boolean, Date, DateTime, LargeBinary, JSON
 
 # Добавление корневой директории проекта в sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from db.database import SessionLocal
+from db.database import ReadOnlySessionLocal
 from db.models import Patient, Service, Notification, WebhookEvent, Conversation
+from db.types import EncryptedText, EncryptedDate
 from bot.services.patient_service import get_decrypted_patient_data
 
 # Настройка логирования
@@ -25,157 +38,272 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def view_patients():
+# Количество строк на странице вывода
+DEFAULT_PAGE_SIZE = 100
+
+# Количество строк в одном запросе при выгрузке
+EXPORT_CHUNK_SIZE = 10000
+
+# Условие фильтра --where: <столбец><оператор><значение>
+WHERE_RE = re.compile(r"^\s*(\w+)\s*(!=|>=|<=|=|>|<)\s*(.*?)\s*$")
+WHERE_OPERATORS = {
+    '=': operator.eq, '!=': operator.ne,
+    '>': operator.gt, '>=': operator.ge,
+    '<': operator.lt, '<=': operator.le,
+}
+
+
+def format_datetime(value, empty: str = "Не указано", fmt: str = "%d.%m.%Y %H:%M") -> str:
+    return value.strftime(fmt) if value else empty
+
+
+def parse_where(model, conditions: list) -> list:
     """
-    Просмотр всех пациентов в базе данных.
+    Преобразование условий --where в выражения SQLAlchemy.
+    Фильтр по зашифрованным столбцам невозможен и не поддерживается.
+    
+    Args:
+        model: Класс модели
+        conditions: Условия вида "status=pending", "id>=100", "mis_id=null"
+        
+    Returns:
+        list: Список выражений для Select.where
     """
-    db = SessionLocal()
-    try:
-        patients = db.query(Patient).all()
+    columns = model.__table__.columns
+    clauses = []
+    for condition in conditions or []:
+        match = WHERE_RE.match(condition)
+        if not match:
+            raise ValueError(f"Некорректное условие: {condition}")
+        name, op, value = match.groups()
+        if name not in columns:
+            raise ValueError(f"Неизвестный столбец: {name}")
+        column = columns[name]
+        if isinstance(column.type, EncryptedText):
+            raise ValueError(f"Фильтр по зашифрованному столбцу {name} не поддерживается")
+        
+        if value.lower() == 'null':
+            if op not in ('=', '!='):
+                raise ValueError(f"Для null допустимы только = и !=: {condition}")
+            clauses.append(column.is_(None) if op == '=' else column.isnot(None))
+        else:
+            # Значение приводится к типу столбца на стороне PostgreSQL
+            clauses.append(WHERE_OPERATORS[op](column, cast(literal(value, String), column.type)))
+    return clauses
+
+
+def iter_pages(db, statement, key_column, page_size: int = DEFAULT_PAGE_SIZE, after=None, limit: int = None):
+    """
+    Постраничная выборка по ключу (keyset pagination).
+    
+    Каждая страница - отдельный запрос WHERE key > <последний ключ> ORDER BY key LIMIT,
+    строки которого читаются через серверный курсор. Транзакция завершается после
+    каждой страницы, поэтому объем памяти и время удержания снимка на реплике
+    не зависят от размера таблицы.
+    
+    Args:
+        db: Сессия базы данных
+        statement: Запрос select() по столбцам (не по объектам модели)
+        key_column: Уникальный возрастающий столбец (обычно id)
+        page_size: Количество строк на странице
+        after: Значение ключа, после которого начинается выборка
+        limit: Максимальное общее количество строк
+        
+    Yields:
+        list: Строки очередной страницы
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page_statement = statement.order_by(key_column).limit(size)
+        if after is not None:
+            page_statement = page_statement.where(key_column > after)
+        
+        result = db.execute(page_statement.execution_options(stream_results=True, yield_per=size))
+        rows = list(result)
+        db.rollback()
         
-        if not patients:
-            print("В базе данных нет пациентов.")
+        if not rows:
             return
+        yield rows
+        
+        after = getattr(rows[-1], key_column.key)
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            return
+
+
+def print_pages(title: str, empty_message: str, headers: list, pages, format_row, key_index: int = 0) -> int:
+    """
+    Вывод страниц по мере их получения.
+    
+    Args:
+        title: Заголовок списка
+        empty_message: Сообщение для пустой выборки
+        headers: Заголовки столбцов
+        pages: Итератор страниц (iter_pages)
+        format_row: Функция преобразования строки результата в строку таблицы
+        key_index: Индекс столбца ключа в строке таблицы
         
-        # Подготовка данных для таблицы
+    Returns:
+        int: Количество выведенных строк
+    """
+    total = 0
+    for number, rows in enumerate(pages, start=1):
+        table = [format_row(row) for row in rows]
+        total += len(table)
+        print(f"\n{title}, страница {number}:")
+        print(tabulate(table, headers=headers, tablefmt="grid"))
+        print(f"Следующая страница: --after {table[-1][key_index]}")
+    
+    if total:
+        print(f"Выведено строк: {total}")
+    else:
+        print(empty_message)
+    return total
+
+
+def view_patients(limit: int = None, after: int = None, where: list = None, page_size: int = DEFAULT_PAGE_SIZE):
+    """
+    Постраничный просмотр пациентов в базе данных.
+    Выбираются только отображаемые столбцы, зашифрованные поля расшифровываются в SELECT.
+    
+    Args:
+        limit: Максимальное количество пациентов
+        after: ID пациента, после которого начинается вывод
+        where: Условия фильтра (см. parse_where)
+        page_size: Количество строк на странице
+    """
+    db = ReadOnlySessionLocal()
+    try:
         headers = [
             "ID", "Telegram ID", "MIS ID", "AmoCRM ID", "Телефон", 
             "Имя", "Фамилия", "Отчество", "Дата рождения", 
             "Согласие на уведомления", "Согласие на маркетинг",
             "Состояние", "Дата регистрации", "Последняя активность"
         ]
+        statement = select(
+            Patient.id, Patient.telegram_id, Patient.mis_id, Patient.amocrm_id,
+            Patient.phone_number, Patient.first_name, Patient.last_name, Patient.third_name,
+            Patient.birth_date, Patient.consent_notifications, Patient.consent_marketing,
+            Patient.bot_state, Patient.registration_date, Patient.last_activity
+        ).where(*parse_where(Patient, where))
         
-        rows = []
-        for patient in patients:
-            # Получение расшифрованных данных пациента
-            patient_data = get_decrypted_patient_data(db, patient)
-            
-            birth_date = patient_data.get('birth_date').strftime("%d.%m.%Y") if patient_data.get('birth_date') else "Не указана"
-            registration_date = patient_data.get('registration_date').strftime("%d.%m.%Y %H:%M") if patient_data.get('registration_date') else "Не указана"
-            last_activity = patient_data.get('last_activity').strftime("%d.%m.%Y %H:%M") if patient_data.get('last_activity') else "Не указана"
-            
-            rows.append([
-                patient_data.get('id'), patient_data.get('telegram_id'), patient_data.get('mis_id'), patient_data.get('amocrm_id'),
-                patient_data.get('phone_number'), patient_data.get('first_name'), patient_data.get('last_name'), patient_data.get('third_name'),
-                birth_date, patient_data.get('consent_notifications'), patient_data.get('consent_marketing'),
-                patient_data.get('bot_state'), registration_date, last_activity
-            ])
+        def format_row(patient):
+            return [
+                patient.id, patient.telegram_id, patient.mis_id, patient.amocrm_id,
+                patient.phone_number, patient.first_name, patient.last_name, patient.third_name,
+                format_datetime(patient.birth_date, "Не указана", "%d.%m.%Y"),
+                patient.consent_notifications, patient.consent_marketing, patient.bot_state,
+                format_datetime(patient.registration_date, "Не указана"),
+                format_datetime(patient.last_activity, "Не указана")
+            ]
         
-        # Вывод таблицы
-        print("\nСписок пациентов:")
-        print(tabulate(rows, headers=headers, tablefmt="grid"))
-        print(f"Всего пациентов: {len(patients)}")
+        print_pages("Список пациентов", "Пациенты не найдены.", headers,
+                    iter_pages(db, statement, Patient.id, page_size, after, limit), format_row)
         
     except Exception as e:
         logger.error(f"Ошибка при получении данных пациентов: {e}")
     finally:
         db.close()
 
-def view_notifications():
+def view_notifications(limit: int = None, after: int = None, where: list = None, page_size: int = DEFAULT_PAGE_SIZE):
     """
-    Просмотр всех уведомлений в базе данных.
+    Постраничный просмотр уведомлений в базе данных.
+    
+    Args:
+        limit: Максимальное количество уведомлений
+        after: ID уведомления, после которого начинается вывод
+        where: Условия фильтра (см. parse_where)
+        page_size: Количество строк на странице
     """
-    db = SessionLocal()
+    db = ReadOnlySessionLocal()
     try:
-        notifications = db.query(Notification).all()
-        
-        if not notifications:
-            print("В базе данных нет уведомлений.")
-            return
-        
-        # Подготовка данных для таблицы
         headers = [
             "ID", "Patient ID", "Telegram ID", "Appointment ID", "Message ID",
             "Статус", "Отправлено", "Отвечено", "Причина отмены"
         ]
+        statement = select(
+            Notification.id, Notification.patient_id, Notification.telegram_id,
+            Notification.appointment_id, Notification.message_id, Notification.status,
+            Notification.sent_at, Notification.responded_at, Notification.cancel_reason
+        ).where(*parse_where(Notification, where))
         
-        rows = []
-        for notification in notifications:
-            sent_at = notification.sent_at.strftime("%d.%m.%Y %H:%M") if notification.sent_at else "Не указано"
-            responded_at = notification.responded_at.strftime("%d.%m.%Y %H:%M") if notification.responded_at else "Не указано"
-            
-            rows.append([
+        def format_row(notification):
+            return [
                 notification.id, notification.patient_id, notification.telegram_id,
-                notification.appointment_id, notification.message_id,
-                notification.status, sent_at, responded_at, notification.cancel_reason
-            ])
+                notification.appointment_id, notification.message_id, notification.status,
+                format_datetime(notification.sent_at), format_datetime(notification.responded_at),
+                notification.cancel_reason
+            ]
         
-        # Вывод таблицы
-        print("\nСписок уведомлений:")
-        print(tabulate(rows, headers=headers, tablefmt="grid"))
-        print(f"Всего уведомлений: {len(notifications)}")
+        print_pages("Список уведомлений", "Уведомления не найдены.", headers,
+                    iter_pages(db, statement, Notification.id, page_size, after, limit), format_row)
         
     except Exception as e:
         logger.error(f"Ошибка при получении данных уведомлений: {e}")
     finally:
         db.close()
 
-def view_services():
+def view_services(limit: int = None, after: int = None, where: list = None, page_size: int = DEFAULT_PAGE_SIZE):
     """
-    Просмотр всех услуг в базе данных.
+    Постраничный просмотр услуг в базе данных.
+    
+    Args:
+        limit: Максимальное количество услуг
+        after: ID услуги, после которой начинается вывод
+        where: Условия фильтра (см. parse_where)
+        page_size: Количество строк на странице
     """
-    db = SessionLocal()
+    db = ReadOnlySessionLocal()
     try:
-        services = db.query(Service).all()
-        
-        if not services:
-            print("В базе данных нет услуг.")
-            return
-        
-        # Подготовка данных для таблицы
         headers = [
             "ID", "Patient ID", "Дата", "Название услуги", "Врач", "Источник", "Обновлено"
         ]
+        statement = select(
+            Service.id, Service.patient_id, Service.date, Service.service_name,
+            Service.doctor_name, Service.source, Service.updated_at
+        ).where(*parse_where(Service, where))
         
-        rows = []
-        for service in services:
-            date = service.date.strftime("%d.%m.%Y") if service.date else "Не указана"
-            updated_at = service.updated_at.strftime("%d.%m.%Y %H:%M") if service.updated_at else "Не указано"
-            
-            rows.append([
-                service.id, service.patient_id, date, service.service_name,
-                service.doctor_name, service.source, updated_at
-            ])
+        def format_row(service):
+            return [
+                service.id, service.patient_id, format_datetime(service.date, "Не указана", "%d.%m.%Y"),
+                service.service_name, service.doctor_name, service.source, format_datetime(service.updated_at)
+            ]
         
-        # Вывод таблицы
-        print("\nСписок услуг:")
-        print(tabulate(rows, headers=headers, tablefmt="grid"))
-        print(f"Всего услуг: {len(services)}")
+        print_pages("Список услуг", "Услуги не найдены.", headers,
+                    iter_pages(db, statement, Service.id, page_size, after, limit), format_row)
         
     except Exception as e:
         logger.error(f"Ошибка при получении данных услуг: {e}")
     finally:
         db.close()
 
-def view_webhook_events():
+def view_webhook_events(limit: int = None, after: int = None, where: list = None, page_size: int = DEFAULT_PAGE_SIZE):
     """
-    Просмотр всех webhook-событий в базе данных.
+    Постраничный просмотр webhook-событий в базе данных.
+    
+    Args:
+        limit: Максимальное количество событий
+        after: ID события, после которого начинается вывод
+        where: Условия фильтра (см. parse_where), например received_at>=2026-01-01
+        page_size: Количество строк на странице
     """
-    db = SessionLocal()
+    db = ReadOnlySessionLocal()
     try:
-        events = db.query(WebhookEvent).all()
-        
-        if not events:
-            print("В базе данных нет webhook-событий.")
-            return
-        
-        # Подготовка данных для таблицы
         headers = [
             "ID", "Тип события", "Получено"
         ]
+        statement = select(
+            WebhookEvent.id, WebhookEvent.event_type, WebhookEvent.received_at
+        ).where(*parse_where(WebhookEvent, where))
         
-        rows = []
-        for event in events:
-            received_at = event.received_at.strftime("%d.%m.%Y %H:%M") if event.received_at else "Не указано"
-            
-            rows.append([
-                event.id, event.event_type, received_at
-            ])
+        def format_row(event):
+            return [event.id, event.event_type, format_datetime(event.received_at)]
         
-        # Вывод таблицы
-        print("\nСписок webhook-событий:")
-        print(tabulate(rows, headers=headers, tablefmt="grid"))
-        print(f"Всего событий: {len(events)}")
+        print_pages("Список webhook-событий", "Webhook-события не найдены.", headers,
+                    iter_pages(db, statement, WebhookEvent.id, page_size, after, limit), format_row)
         
     except Exception as e:
         logger.error(f"Ошибка при получении данных webhook-событий: {e}")
@@ -189,7 +317,7 @@ def view_patient_by_telegram_id(telegram_id):
     Args:
         telegram_id: ID пользователя в Telegram
     """
-    db = SessionLocal()
+    db = ReadOnlySessionLocal()
     try:
         patient = db.query(Patient).filter(Patient.telegram_id == telegram_id).first()
         
@@ -228,9 +356,168 @@ def view_patient_by_telegram_id(telegram_id):
     finally:
         db.close()
 
-def main():
+def export_columns(model, names: list = None) -> list:
     """
-    Основная функция скрипта.
+    Столбцы для выгрузки: указанные в списке или все, кроме слепых индексов.
+    
+    Args:
+        model: Класс модели
+        names: Список имен столбцов (allow-list)
+        
+    Returns:
+        list: Список столбцов таблицы
+    """
+    columns = model.__table__.columns
+    if not names:
+        return [column for column in columns
+                if isinstance(column.type, EncryptedText) or not isinstance(column.type, LargeBinary)]
+    
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f"Неизвестные столбцы: {', '.join(unknown)}")
+    return [columns[name] for name in names]
+
+
+def arrow_type(column):
+    """
+    Тип столбца Parquet по типу столбца SQLAlchemy.
+    """
+    import pyarrow as pa
+    
+    if isinstance(column.type, EncryptedDate) or isinstance(column.type, Date):
+        return pa.date32()
+    if isinstance(column.type, EncryptedText):
+        return pa.string()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, (Integer, BigInteger)):
+        return pa.int64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column.type, LargeBinary):
+        return pa.binary()
+    return pa.string()
+
+
+class CsvExportWriter:
+    """
+    Построчная запись выгрузки в CSV.
+    """
+
+    def __init__(self, path: str, columns: list):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([column.name for column in columns])
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetExportWriter:
+    """
+    Запись выгрузки в Parquet: каждая порция строк - отдельная группа строк файла.
+    Требует установленного пакета pyarrow.
+    """
+
+    def __init__(self, path: str, columns: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Для выгрузки в Parquet установите пакет pyarrow: pip install pyarrow")
+        
+        self._pa = pa
+        self._schema = pa.schema([(column.name, arrow_type(column)) for column in columns])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: list):
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(zip(*rows), self._schema)],
+            schema=self._schema
+        ))
+
+    def close(self):
+        self._writer.close()
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'parquet': ParquetExportWriter,
+}
+
+
+def export_table(model, path: str, export_format: str = None, columns: list = None, where: list = None,
+                 after: int = None, limit: int = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Потоковая выгрузка таблицы с расшифровкой в CSV или Parquet.
+    
+    Строки читаются порциями по ключу (iter_pages); зашифрованные поля всей
+    порции расшифровываются в том же SELECT, которым она выбирается, и порция
+    сразу дописывается в файл, поэтому объем памяти не зависит от размера таблицы.
+    
+    Args:
+        model: Класс модели
+        path: Путь к файлу выгрузки
+        export_format: csv или parquet (по умолчанию по расширению файла)
+        columns: Список выгружаемых столбцов (по умолчанию все, кроме слепых индексов)
+        where: Условия фильтра (см. parse_where)
+        after: ID, после которого начинается выгрузка
+        limit: Максимальное количество строк
+        chunk_size: Количество строк в одном запросе
+        
+    Returns:
+        int: Количество выгруженных строк
+    """
+    export_format = export_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if export_format not in EXPORT_WRITERS:
+        raise ValueError(f"Неподдерживаемый формат выгрузки: {export_format}")
+    
+    selected = export_columns(model, columns)
+    key_column = model.__table__.c.id
+    # Ключ нужен для постраничной выборки, даже если он не выгружается
+    statement = select(*selected, *([] if key_column in selected else [key_column]))
+    statement = statement.where(*parse_where(model, where))
+    width = len(selected)
+    # JSON-значения (payload webhook-событий) выгружаются строкой
+    json_indexes = [index for index, column in enumerate(selected) if isinstance(column.type, JSON)]
+    
+    writer = EXPORT_WRITERS[export_format](path, selected)
+    db = ReadOnlySessionLocal()
+    total = 0
+    started = time.perf_counter()
+    try:
+        for rows in iter_pages(db, statement, key_column, chunk_size, after, limit):
+            chunk = [list(row)[:width] for row in rows]
+            for values in chunk:
+                for index in json_indexes:
+                    if values[index] is not None:
+                        values[index] = json.dumps(values[index], ensure_ascii=False)
+            writer.write(chunk)
+            total += len(rows)
+            elapsed = time.perf_counter() - started
+            logger.info(f"Выгружено строк: {total} ({total / elapsed:.0f} строк/с)")
+    finally:
+        writer.close()
+        db.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"Выгружено строк: {total} в {path} за {elapsed:.1f} с ({total / elapsed if elapsed else 0:.0f} строк/с)")
+    return total
+
+# Постраничные представления таблиц для аргумента table
+TABLE_VIEWS = {
+    'patients': (Patient, view_patients),
+    'notifications': (Notification, view_notifications),
+    'services': (Service, view_services),
+    'webhook_events': (WebhookEvent, view_webhook_events),
+}
+
+def interactive_menu():
+    """
+    Интерактивное меню выбора действия.
     """
     print("Просмотр данных в базе данных PostgreSQL")
     print("1. Просмотр всех пациентов")
@@ -263,5 +550,54 @@ def main():
     else:
         print("Некорректный выбор.")
 
+def main():
+    """
+    Основная функция скрипта.
+    Без аргументов запускает интерактивное меню.
+    """
+    parser = argparse.ArgumentParser(description="Просмотр данных в базе данных PostgreSQL")
+    parser.add_argument("table", nargs="?", choices=sorted(TABLE_VIEWS), help="Таблица для просмотра")
+    parser.add_argument("--telegram-id", type=int, help="Просмотр пациента по Telegram ID")
+    parser.add_argument("--limit", type=int, default=None, help="Максимальное количество строк")
+    parser.add_argument("--after", type=int, default=None, help="Вывод строк с ID больше указанного")
+    parser.add_argument("--where", action="append", default=[],
+                        help="Условие фильтра <столбец><оператор><значение>, например status=pending (можно повторять)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Количество строк на странице (по умолчанию {DEFAULT_PAGE_SIZE})")
+    parser.add_argument("--export", metavar="PATH", help="Выгрузить таблицу с расшифровкой в файл вместо вывода")
+    parser.add_argument("--format", choices=sorted(EXPORT_WRITERS), help="Формат выгрузки (по умолчанию по расширению файла)")
+    parser.add_argument("--columns", help="Список выгружаемых столбцов через запятую")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE,
+                        help=f"Количество строк в одном запросе выгрузки (по умолчанию {EXPORT_CHUNK_SIZE})")
+    args = parser.parse_args()
+    
+    if args.telegram_id is not None:
+        view_patient_by_telegram_id(args.telegram_id)
+    elif args.table:
+        if args.page_size <= 0:
+            parser.error("--page-size должен быть больше нуля")
+        model, view = TABLE_VIEWS[args.table]
+        try:
+            # Проверка условий до подключения к базе данных
+            parse_where(model, args.where)
+        except ValueError as e:
+            parser.error(str(e))
+        if not args.export:
+            view(limit=args.limit, after=args.after, where=args.where, page_size=args.page_size)
+            return
+        
+        columns = [name.strip() for name in args.columns.split(',') if name.strip()] if args.columns else None
+        try:
+            export_columns(model, columns)
+            export_table(model, args.export, args.format, columns, args.where,
+                         args.after, args.limit, args.chunk_size)
+        except ValueError as e:
+            parser.error(str(e))
+        except Exception as e:
+            logger.error(f"Ошибка при выгрузке таблицы {args.table}: {e}")
+            sys.exit(1)
+    else:
+        interactive_menu()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Скрипт обслуживания секций таблиц webhook_events и patient_messages.
+Может быть запущен по расписанию через cron или другой планировщик (например, ежедневно).
+
+Создает секции обеих таблиц на ближайшие месяцы и удаляет целиком секции webhook_events,
+все события которых старше срока хранения, вместо удаления событий через DELETE.
+Журнал сообщений пациентов не удаляется.
+
+Каждая таблица и удаление устаревших секций обслуживаются в отдельной транзакции,
+поэтому ошибка одного шага не отменяет остальные.
+"""
+
+import sys
+import os
+import logging
+import argparse
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEBHOOK_EVENTS_RETENTION_MONTHS, WEBHOOK_EVENTS_PARTITIONS_AHEAD
+from db.database import engine
+from db.partitions import ensure_month_partitions, drop_expired_webhook_event_partitions, PARTITIONED_TABLES
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание секций таблиц webhook_events и patient_messages")
+    parser.add_argument("--retention-months", type=int, default=WEBHOOK_EVENTS_RETENTION_MONTHS,
+                        help=f"Срок хранения событий в месяцах (по умолчанию {WEBHOOK_EVENTS_RETENTION_MONTHS})")
+    parser.add_argument("--months-ahead", type=int, default=WEBHOOK_EVENTS_PARTITIONS_AHEAD,
+                        help=f"Количество секций, создаваемых заранее (по умолчанию {WEBHOOK_EVENTS_PARTITIONS_AHEAD})")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать секции, подлежащие удалению")
+    args = parser.parse_args()
+
+    created = []
+    dropped = []
+    failed = False
+
+    if not args.dry_run:
+        for table in PARTITIONED_TABLES:
+            try:
+                with engine.begin() as conn:
+                    created += ensure_month_partitions(conn, table, args.months_ahead)
+            except Exception as e:
+                logger.error(f"Ошибка при создании секций таблицы {table}: {e}")
+                failed = True
+
+    try:
+        with engine.begin() as conn:
+            dropped = drop_expired_webhook_event_partitions(conn, args.retention_months, dry_run=args.dry_run)
+    except Exception as e:
+        logger.error(f"Ошибка при удалении устаревших секций: {e}")
+        failed = True
+
+    print(f"Создано секций: {len(created)}, {'подлежит удалению' if args.dry_run else 'удалено'} секций: {len(dropped)}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
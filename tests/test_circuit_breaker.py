@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Тесты переходов состояний автоматического выключателя.
+"""
+
+import sys
+import os
+
+import pytest
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.services import circuit_breaker
+from bot.services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: clock[0])
+    return clock
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker("тест", failure_threshold=3, recovery_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.stats()['rejected'] == 1
+    assert breaker.stats()['opened'] == 1
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker("тест", failure_threshold=3, recovery_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker("тест", failure_threshold=2, recovery_timeout=30)
+    open_breaker(breaker)
+
+    clock[0] += 29
+    assert breaker.state == OPEN
+
+    clock[0] += 1
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_probe_success_closes(clock):
+    breaker = CircuitBreaker("тест", failure_threshold=2, recovery_timeout=30)
+    open_breaker(breaker)
+    clock[0] += 30
+
+    assert breaker.allow_request()
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("тест", failure_threshold=2, recovery_timeout=30)
+    open_breaker(breaker)
+    clock[0] += 30
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened'] == 2
+    clock[0] += 29
+    assert not breaker.allow_request()
+
+
+def test_released_probe_can_be_retried(clock):
+    breaker = CircuitBreaker("тест", failure_threshold=2, recovery_timeout=30)
+    open_breaker(breaker)
+    clock[0] += 30
+
+    assert breaker.allow_request()
+    breaker.release()
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Тесты повторов запросов к МИС по политикам RETRY_POLICIES и работы выключателя.
+"""
+
+import sys
+import os
+import asyncio
+
+import httpx
+import pytest
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.services import mis_service
+from bot.services.mis_service import MISService, RETRY_POLICIES, READ_POLICY, WRITE_POLICY
+from bot.services.circuit_breaker import CircuitBreaker, CLOSED, OPEN
+
+OK_RESPONSE = {"error": 0, "data": {"id": 1}}
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("МИС", failure_threshold=5, recovery_timeout=30)
+    monkeypatch.setattr(mis_service, 'mis_circuit_breaker', breaker)
+    monkeypatch.setattr(mis_service, 'backoff_delay', lambda retry: 0)
+    return breaker
+
+
+def request(method: str, handler, params: dict = None):
+    """
+    Выполнение запроса к МИС через транспорт, отвечающий функцией handler.
+
+    Returns:
+        tuple: Результат запроса и количество отправленных запросов
+    """
+    calls = []
+
+    def transport_handler(http_request: httpx.Request) -> httpx.Response:
+        calls.append(http_request)
+        return handler(len(calls))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(transport_handler)) as client:
+            return await MISService(client)._make_request(method, params or {})
+
+    return asyncio.run(run()), len(calls)
+
+
+def test_read_methods_use_read_policy():
+    assert RETRY_POLICIES["getAppointments"] is READ_POLICY
+    assert not READ_POLICY.unsent_only
+    assert RETRY_POLICIES.get("confirmAppointment", WRITE_POLICY) is WRITE_POLICY
+    assert WRITE_POLICY.unsent_only
+
+
+def test_read_is_retried_after_server_error(breaker):
+    def handler(call):
+        return httpx.Response(503) if call < READ_POLICY.attempts else httpx.Response(200, json=OK_RESPONSE)
+
+    result, calls = request("getAppointments", handler)
+
+    assert result == {"id": 1}
+    assert calls == READ_POLICY.attempts
+    assert breaker.state == CLOSED
+
+
+def test_write_is_not_retried_after_server_error(breaker):
+    result, calls = request("confirmAppointment", lambda call: httpx.Response(503))
+
+    assert result is None
+    assert calls == 1
+
+
+def test_write_is_retried_when_not_sent(breaker):
+    def handler(call):
+        if call == 1:
+            raise httpx.ConnectError("соединение не установлено")
+        return httpx.Response(200, json=OK_RESPONSE)
+
+    result, calls = request("confirmAppointment", handler)
+
+    assert result == {"id": 1}
+    assert calls == 2
+
+
+def test_client_error_is_not_retried_and_keeps_breaker_closed(breaker):
+    result, calls = request("getPatient", lambda call: httpx.Response(404))
+
+    assert result is None
+    assert calls == 1
+    assert breaker.stats()['consecutive_failures'] == 0
+
+
+def test_breaker_opens_and_rejects_without_request(breaker):
+    for _ in range(breaker.failure_threshold):
+        request("confirmAppointment", lambda call: httpx.Response(503))
+    assert breaker.state == OPEN
+
+    result, calls = request("getAppointments", lambda call: httpx.Response(200, json=OK_RESPONSE))
+
+    assert result is None
+    assert calls == 0
+    assert not mis_service.is_mis_available()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Тесты сессии базы данных, привязанной к обработке обновления:
+ни одно соединение не должно пережить обработку своего обновления.
+"""
+
+import sys
+import os
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update, Message, Chat, User
+
+# Добавление корневой директории проекта в sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.core import update_session
+from bot.core.update_session import SessionUpdateProcessor, get_update_session
+from bot.handlers.error import error_handler
+from bot.services.patient_state_cache import PatientState, patient_state_cache
+
+
+class StubPool:
+    """
+    Пул соединений, считающий выданные соединения.
+    """
+
+    def __init__(self):
+        self.checked_out = 0
+
+
+class StubSession:
+    """
+    Сессия, получающая соединение из пула при первом запросе
+    и возвращающая его при фиксации, откате или закрытии.
+    """
+
+    def __init__(self, pool: StubPool):
+        self.pool = pool
+        self.connected = False
+        self.committed = False
+        self.closed = False
+
+    async def execute(self, statement):
+        if not self.connected:
+            self.connected = True
+            self.pool.checked_out += 1
+
+    def _release(self):
+        if self.connected:
+            self.connected = False
+            self.pool.checked_out -= 1
+
+    async def commit(self):
+        self.committed = True
+        self._release()
+
+    async def rollback(self):
+        self._release()
+
+    async def close(self):
+        self.closed = True
+        self._release()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = StubPool()
+    pool.sessions = []
+
+    def session_factory():
+        session = StubSession(pool)
+        pool.sessions.append(session)
+        return session
+
+    monkeypatch.setattr(update_session, 'AsyncSessionLocal', session_factory)
+    return pool
+
+
+def make_update(user_id: int, update_id: int = 1) -> Update:
+    return Update(update_id, message=Message(
+        update_id, datetime.utcnow(), Chat(user_id, Chat.PRIVATE), from_user=User(user_id, "Тест", False), text="текст"
+    ))
+
+
+def process(coroutine, update: object = None):
+    asyncio.run(SessionUpdateProcessor(4).do_process_update(update or object(), coroutine))
+
+
+def test_normal_return_commits_and_closes(pool):
+    async def handler():
+        await get_update_session().execute("SELECT 1")
+
+    process(handler())
+
+    session, = pool.sessions
+    assert session.committed
+    assert session.closed
+    assert pool.checked_out == 0
+
+
+def test_early_return_closes(pool):
+    async def handler():
+        await get_update_session().execute("SELECT 1")
+        return
+
+    process(handler())
+
+    session, = pool.sessions
+    assert session.closed
+    assert pool.checked_out == 0
+
+
+def test_exception_closes_without_commit(pool):
+    async def handler():
+        await get_update_session().execute("SELECT 1")
+        raise ValueError("ошибка обработчика")
+
+    with pytest.raises(ValueError):
+        process(handler())
+
+    session, = pool.sessions
+    assert not session.committed
+    assert session.closed
+    assert pool.checked_out == 0
+
+
+def test_error_handler_discards_changes(pool):
+    async def handler():
+        await get_update_session().execute("UPDATE patients SET bot_state = NULL")
+        # Application передает ошибку обработчику ошибок внутри обработки обновления
+        await error_handler(None, SimpleNamespace(error=ValueError("ошибка обработчика")))
+
+    process(handler())
+
+    session, = pool.sessions
+    assert not session.committed
+    assert session.closed
+    assert pool.checked_out == 0
+
+
+def test_sessions_of_concurrent_updates_are_closed(pool):
+    async def handler():
+        await get_update_session().execute("SELECT 1")
+        await asyncio.sleep(0)
+
+    async def run():
+        processor = SessionUpdateProcessor(4)
+        await asyncio.gather(*[processor.process_update(object(), handler()) for _ in range(10)])
+
+    asyncio.run(run())
+
+    assert len(pool.sessions) == 10
+    assert all(session.closed for session in pool.sessions)
+    assert pool.checked_out == 0
+
+
+def test_discarded_update_invalidates_patient_state(pool):
+    telegram_id = 1001
+    state_fields = {name: None for name in PatientState._fields}
+
+    async def handler():
+        await get_update_session().execute("UPDATE patients SET bot_state = 'registered'")
+        # Сервис обновляет кеш до фиксации транзакции
+        patient_state_cache.set(PatientState(**dict(state_fields, id=1, telegram_id=telegram_id, bot_state="registered")))
+        await error_handler(None, SimpleNamespace(error=ValueError("ошибка обработчика")))
+
+    process(handler(), make_update(telegram_id))
+
+    assert patient_state_cache.get(telegram_id) is None
+    assert pool.checked_out == 0
+
+
+def test_updates_of_one_user_run_in_order(pool):
+    events = []
+
+    async def handler(name: str, delay: float):
+        events.append(f"{name}:start")
+        await asyncio.sleep(delay)
+        events.append(f"{name}:end")
+
+    async def run():
+        processor = SessionUpdateProcessor(4)
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), handler("first", 0.02)),
+            processor.process_update(make_update(1, 2), handler("second", 0)),
+            processor.process_update(make_update(2, 3), handler("other", 0)),
+        )
+        return processor
+
+    processor = asyncio.run(run())
+
+    # Второе обновление пользователя начинается только после первого,
+    # обновление другого пользователя не ждет
+    assert events.index("second:start") > events.index("first:end")
+    assert events.index("other:end") < events.index("first:end")
+    assert processor._user_locks == {}
+    assert pool.checked_out == 0